@@ -1,9 +1,18 @@
-import asyncio
+import asyncio, time
 
+import numpy as np
 from pysnmp.hlapi.v3arch.asyncio import *
-from utils import FloatOpaque, opaque_to_float, switch_to_int, LoggingFormat
+from utils import FloatOpaque, decode_value, decode_values, encode_floats, switch_to_int, LoggingFormat
+from session import SnmpSession
+from oids import OidTable
+from ramp import RampSupervisor, RampError
+from cache import SetpointCache
+from scheduler import RequestScheduler
+from transport import Transport, ScpiTransport
+from status import OutputStatus, FLAGS, TRIPPED, from_bits, status_matrix, any_set
+from metrics import METRICS, instrumented
+from store import Store, Recorder
 from functools import wraps
-import time
 import logging
 logger = logging.getLogger("WienerClass")
 logger.setLevel(logging.INFO)
@@ -19,36 +28,35 @@ logger.addHandler(console)
 '''
 
 
-class Wiener:
-    statusBits = { # dictionary taken from the WIENER-CRATE-MIB file defining the mapping between error bits and messages
-    0 : "outputOn",
-    1 : "outputInhibit" ,
-    2 : "outputFailureMinSenseVoltage",
-    3 : "outputFailureMaxSenseVoltage",
-    4 : "outputFailureMaxTerminalVoltage",
-    5 : "outputFailureMaxCurrent",
-    6 : "outputFailureMaxTemperature",
-    7 : "outputFailureMaxPower",
-    8 : "reserved",
-    9 : "outputFailureTimeout",
-    10 : "outputCurrentLimited",
-    11 : "outputRampUp",
-    12 : "outputRampDown",
-    13 : "outputEnableKill",
-    14 : "outputEmergencyOff",
-    15 : "outputAdjusting",
-    16 : "outputConstantVoltage",
-    17 : "outputLowCurrentRange",
-    18 : "outputCurrentBoundsExceeded",
-    19 : "outputFailureCurrentLimit",
-    20 : "outputCurrentIncreasing",
-    21 : "outputCurrentDecreasing",
-    22 : "outputConstantPower",
-    23 : "outputVoltageRampSpeedLimited",
-    24 : "outputVoltageBottomReached",
-    25 : "outputInitCrcCheckBad"
-}
-    def __init__(self, host: str, mib_dir: str, mib_name: str, device : str):
+class AsyncWiener:
+    """
+    asyncio interface to one module (HV or LV) of a Wiener crate. Every method is a coroutine, so it can be used
+    from an existing event loop and operations on different channels can overlap, e.g.
+        await asyncio.gather(*(hv.meas_current(ch) for ch in range(1, 9)))
+    At most max_in_flight requests are outstanding at any time.
+    Requests go over SNMP unless another transport is given, e.g. transport="scpi" (see transport.ScpiTransport).
+    """
+    # mapping between outputStatus bits and messages from the WIENER-CRATE-MIB file (see status.OutputStatus)
+    statusBits = {i : flag.name for i, flag in enumerate(FLAGS)}
+    max_varbinds = 16 # varbinds per GET PDU; lowered automatically if the agent answers tooBig
+    snapshot_columns = ( # outputTable columns read by snapshot() by default
+        "outputStatus",
+        "outputSwitch",
+        "outputVoltage",
+        "outputCurrent",
+        "outputMeasurementSenseVoltage",
+        "outputMeasurementTerminalVoltage",
+        "outputMeasurementCurrent",
+        "outputMeasurementTemperature",
+        "outputVoltageRiseRate",
+        "outputVoltageFallRate",
+        "outputCurrentRiseRate",
+        "outputCurrentFallRate",
+    )
+
+    def __init__(self, host: str, mib_dir: str, mib_name: str, device : str, port : int = 161, max_in_flight : int = 8,
+                 cache : bool | SetpointCache = False, scheduler : RequestScheduler | None = None, slot : int | None = None,
+                 transport : str | Transport = "snmp", scpi_port : int = 10001, store : Store | None = None):
         self.authData_public = CommunityData('public', mpModel=1)  # v2c
         self.authData_guru = CommunityData('guru', mpModel=1)  # v2c
         
@@ -57,99 +65,403 @@ class Wiener:
         self._mib_dir = mib_dir
         self._mib_name = mib_name
         self.device = device
-    
-    def cli_store_channel(self, channel : int):
-        if 1 <= channel <= 8: 
-            self.channel = self.get_channel(channel)
+        self.slot = slot if slot is not None else (1 if device == "HV" else 0) # module slot: ma0 = u0.., ma1 = u100..
+        with METRICS.timer("wicc_phase_seconds", phase="mib"):
+            self.oids = OidTable.load(mib_dir, mib_name) # symbol -> numeric OID, compiled once and cached on disk
+        self.session = SnmpSession(host, port)
+        self.max_in_flight = max_in_flight
+        self._in_flight = None
+        self.ramps = RampSupervisor(self)
+        # opt-in read-through cache of setpoints and other configuration objects (see cache.SetpointCache)
+        self.cache = SetpointCache(self.oids) if cache is True else (cache or None)
+        # rate limit, adaptive timeouts/retries and read coalescing, shared by everything talking to this crate
+        self.scheduler = scheduler or RequestScheduler.for_crate(host, port)
+        # None: SNMP over self.session; otherwise read_many/write_many/snapshot go through this transport.Transport
+        if transport == "scpi":
+            transport = ScpiTransport(host, self.slot, port=scpi_port)
+        self.transport = transport if isinstance(transport, Transport) else None
+        # optional store.Store recording every measurement read by read_many and snapshot, off the event loop
+        self.store = store
+        self.recorder = Recorder(store) if store is not None else None
+
+    @property
+    def is_open(self) -> bool:
+        return self._in_flight is not None
+
+    async def open(self):
+        """
+        Open the SNMP session (one engine and one transport reused by every request until close()),
+        or the connection of self.transport, on the running event loop. Called implicitly by the first request.
+        """
+        if self.transport is not None:
+            await self.transport.open()
         else:
-            raise ValueError("Channels range from 1 to 8")
-        
+            await self.session.open()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def close(self):
+        if self.recorder is not None:
+            await self.recorder.close()
+        if self.transport is not None:
+            await self.transport.close()
+        self.session.close()
+        self._in_flight = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _send(self, snmp_func, auth_data, *args, urgent : bool = False):
+        """
+        Send one PDU over the session, waiting for a free slot if max_in_flight requests are outstanding.
+        Urgent requests (all_off) skip both that queue and the scheduler's rate limit.
+        """
+        if self._in_flight is None:
+            await self.open()
+        if urgent:
+            return await self.scheduler.send(self.session, snmp_func, auth_data, self._context, *args, urgent=True)
+        async with self._in_flight:
+            return await self.scheduler.send(self.session, snmp_func, auth_data, self._context, *args)
+    
     def get_channel(self, channel : int) -> str | int:
         """
-        Translate channels 1-8 to the names defined by the Wiener Crate: 
-        LV: Channels 1 - 8 are mapped to u0 - u7
-        HV: Channels 1 - 8 are mapped to u100 - u107
+        Translate channels 1-8 to the names defined by the Wiener Crate, u{100 * slot + channel - 1}:
+        LV (slot 0): Channels 1 - 8 are mapped to u0 - u7
+        HV (slot 1): Channels 1 - 8 are mapped to u100 - u107
         Channels 64 and 128 are used by the groupsSwitch function to apply actions to all HV and LV channels respectively 
         """
-        offset = 99 if self.device == "HV" else -1
+        offset = 100 * self.slot - 1
         if channel == 64 or channel == 128: # special channels for group TODO: better way to do that?
             return channel
         mapped_channel = channel + offset
         mapped_channel_id = f'u{str(mapped_channel)}' 
         return mapped_channel_id
 
+    def _check(self, snmp_func, description : str, errorIndication, errorStatus, errorIndex, varBinds):
+        if errorIndication:
+            raise Exception(f"Error in {snmp_func.__name__} {description}: {errorIndication}")
+        elif errorStatus:
+            raise Exception(f"Error status {errorStatus.prettyPrint()} at "
+                            f"{varBinds[int(errorIndex)-1][0] if errorIndex else '?'}")
+        return varBinds
+
         
     def snmp_call(auth : str, snmp_func):
         """
         Decorator to send SNMP request (snmp_func = get/set) to the Wiener crate, with given authority
         This translates the channel number before passing it
+        The request goes out over the persistent session (self.session) rather than a fresh engine and transport,
+        and is built from the numeric OID in self.oids so no MIB is loaded per request
           
         """
         def _decorator(func):
             @wraps(func)
             async def wrapper(self,  command: str, channel: str, *args, **kwargs):
                 channel = self.get_channel(channel) if isinstance(channel, int) else channel
-                
-                
-                logger.warning(f"Sending {command}.{channel} to {self.device} Wiener module")
-                target = await UdpTransportTarget.create((self.host, 161))
-                oid = ObjectIdentity(self._mib_name, command, channel) \
-                    .add_mib_source(self._mib_dir) \
-                    .load_mibs(self._mib_name)
+                if self.transport is not None:
+                    return (await self._transport_write([(command, channel, *args)]))[(command, channel)]
+
+                logger.debug("Sending %s.%s to %s Wiener module", command, channel, self.device)
+                oid = ObjectIdentity(self.oids.oid(command, channel))
                 
                 rvals = await func(self, oid, *args, **kwargs)
 
-                errorIndication, errorStatus, errorIndex, varBinds = await snmp_func(
-                    SnmpEngine(),
-                    getattr(self, f"authData_{auth}"),
-                    target,
-                    self._context,
-                    *rvals
-                )
-
-                if errorIndication:
-                    raise Exception(f"Error in {snmp_func.__name__} {command}: {errorIndication}")
-                elif errorStatus:
-                    raise Exception(f"Error status {errorStatus.prettyPrint()} at "
-                                    f"{varBinds[int(errorIndex)-1][0] if errorIndex else '?'}")
-                else:
-                    return varBinds[0][1] if varBinds else None
+                response = await self._send(snmp_func, getattr(self, f"authData_{auth}"), *rvals)
+                if self.cache is not None:
+                    self.cache.invalidate(command, self.oids.index(command, channel)) # in case the request fails
+                varBinds = self._check(snmp_func, command, *response)
+                if self.cache is not None and varBinds:
+                    self.cache.written(command, self.oids.index(command, channel),
+                                       decode_value(self.oids.syntax(command), varBinds[0][1]))
+                return varBinds[0][1] if varBinds else None
             return wrapper
         return _decorator
 
     # SNMP get commands must be executed with authorisation 'public' 
     # i.e. snmpget -v 2c -M /usr/share/snmp/mibs -m +WIENER-CRATE-MIB -c public 10.179.59.29 outputVoltage.101
-    @snmp_call("public", get_cmd)
-    async def read(self, oid):
-        return [ObjectType(oid)]
+    @instrumented("read")
+    async def read_many(self, requests : list[tuple[str, int | str]]) -> dict:
+        """
+        Read several objects in as few GET PDUs as possible, e.g.
+            read_many([("outputVoltage", 1), ("outputMeasurementCurrent", 1), ("outputStatus", 2)])
+        Varbinds are packed max_varbinds to a PDU and the PDUs are sent concurrently; a PDU the agent
+        rejects as tooBig is split in half and resent.
+        Returns {(command, channel): decoded value}, with None for objects the crate does not have.
+        """
+        requests = list(dict.fromkeys(requests)) # drop duplicates, keep order
+        retv, missing, instances, decoded = {}, {}, {}, {}
+        token = self.cache.token() if self.cache is not None else None # older than any write completing meanwhile
+        with METRICS.timer("wicc_phase_seconds", phase="mib"):
+            for command, channel in requests:
+                mapped = self.get_channel(channel) if isinstance(channel, int) else channel
+                oid = self.oids.oid(command, mapped)
+                if self.cache is not None:
+                    hit, value = self.cache.get(command, oid[-1])
+                    if hit:
+                        retv[(command, channel)] = value
+                        continue
+                missing[(command, channel)] = oid
+                instances[(command, channel)] = mapped
+        if missing and self.transport is not None:
+            values = await self.transport.read_many([(key[0], instances[key]) for key in missing])
+            decoded = {key: values[(key[0], instances[key])] for key in missing}
+        elif missing:
+            # objects someone else is already reading are not requested again (see RequestScheduler.claim)
+            owned, shared = self.scheduler.claim(list(dict.fromkeys(missing.values())))
+            raw = {}
+            if owned:
+                logger.debug("Sending %d varbinds to %s Wiener module", len(owned), self.device)
+                n = self.max_varbinds
+                try:
+                    chunks = await asyncio.gather(*(self._get([ObjectType(ObjectIdentity(oid)) for oid in owned[i:i + n]])
+                                                    for i in range(0, len(owned), n)))
+                except BaseException as e: # also cancellation, or the oids would stay claimed forever
+                    self.scheduler.resolve(owned, error=e)
+                    raise
+                values = [value for chunk in chunks for _, value in chunk]
+                self.scheduler.resolve(owned, values)
+                raw.update(zip(owned, values))
+            if shared:
+                raw.update(zip(shared, await asyncio.gather(*(self._shared(oid, future) for oid, future in shared.items()))))
+            with METRICS.timer("wicc_phase_seconds", phase="decode"):
+                decoded = dict(zip(missing, decode_values([self.oids.syntax(key[0]) for key in missing],
+                                                          [raw[oid] for oid in missing.values()])))
+        for key, oid in missing.items():
+            retv[key] = decoded[key]
+            if self.cache is not None:
+                self.cache.put(key[0], oid[-1], retv[key], since=token)
+        retv = {key: retv[key] for key in requests}
+        if self.recorder is not None:
+            self.recorder.record(self.host, self.slot, time.time(), retv)
+        return retv
+
+    async def _shared(self, oid : tuple, future : asyncio.Future):
+        """
+        Raw value of an oid another read_many is fetching (see RequestScheduler.claim). The future is shielded,
+        so cancelling this caller does not cancel the owner's read; if the owner was cancelled, read it here.
+        """
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() or not future.cancelled():
+                raise
+        return (await self._get([ObjectType(ObjectIdentity(oid))]))[0][1]
+
+    async def _get(self, var_binds : list) -> list:
+        errorIndication, errorStatus, errorIndex, varBinds = await self._send(
+            get_cmd, self.authData_public, *var_binds)
+        if not errorIndication and errorStatus == 1 and len(var_binds) > 1: # tooBig: split the PDU
+            half = len(var_binds) // 2
+            self.max_varbinds = min(self.max_varbinds, half)
+            first, second = await asyncio.gather(self._get(var_binds[:half]), self._get(var_binds[half:]))
+            return first + second
+        return self._check(get_cmd, f"of {len(var_binds)} varbinds", errorIndication, errorStatus, errorIndex, varBinds)
+
+    async def _read(self, command : str, channel : int | str):
+        """
+        Read a single object through read_many. Raises ValueError if the crate does not have it.
+        """
+        value = (await self.read_many([(command, channel)]))[(command, channel)]
+        if value is None:
+            raise ValueError(f"{command}.{channel} does not exist on the {self.device} Wiener module")
+        return value
+
+    @instrumented("snapshot", keys=lambda args, snap: [(column, ch) for column in snap if column != "channel"
+                                                       for ch in snap["channel"].tolist()])
+    async def snapshot(self, columns : tuple[str, ...] | None = None, max_repetitions : int = 8) -> dict:
+        """
+        Read whole outputTable columns for every channel of this module using GETBULK.
+        Returns a columnar dict: {"channel": array of channel numbers, column: array indexed like "channel"}.
+        Float columns are float64 (NaN where a channel did not answer), int/enum columns int64 and
+        everything else (outputStatus BITS, names) object arrays of the decoded values.
+        """
+        columns = tuple(columns or self.snapshot_columns)
+        rows = await self._walk(columns, max_repetitions)
+        channels = sorted({index for column in rows.values() for index in column})
+        snap = {"channel": np.array([self._channel_from_index(i) for i in channels], dtype=int)}
+        for column in columns:
+            syntax = self.oids.syntax(column)
+            values = [rows[column].get(i) for i in channels]
+            if syntax == "float":
+                snap[column] = np.array([np.nan if v is None else v for v in values], dtype=float)
+            elif syntax in ("int", "enum") and None not in values:
+                snap[column] = np.array(values, dtype=np.int64)
+            else:
+                snap[column] = np.array(values, dtype=object)
+        if self.recorder is not None:
+            self.recorder.record_snapshot(self.host, self.slot, time.time(), snap)
+        return snap
+
+    def _index_range(self) -> tuple[int, int]:
+        """
+        Range of outputTable indices [first, last] belonging to this module (see get_channel).
+        """
+        first = self.oids.index("outputVoltage", self.get_channel(1))
+        return first, first + 99
+
+    def _channel_from_index(self, index : int) -> int:
+        """
+        Inverse of get_channel for outputTable indices: u100 (index 101) -> HV channel 1
+        """
+        return index - self._index_range()[0] + 1
+
+    async def _walk(self, columns : tuple[str, ...], max_repetitions : int) -> dict:
+        """
+        GETBULK walk of the given outputTable columns, restricted to this module's channels.
+        All columns still in progress travel in the same PDU; returns {column: {index: decoded value}}.
+        On tooBig, max_repetitions is halved and then, when not even one row fits, the number of columns per PDU.
+        Other transports have no GETBULK, so there every channel the module reports is read with read_many.
+        """
+        first, last = self._index_range()
+        if self.transport is not None:
+            channels = range(1, await self.transport.channels() + 1)
+            values = await self.read_many([(column, ch) for column in columns for ch in channels])
+            return {column: {first + ch - 1: values[(column, ch)] for ch in channels if values[(column, ch)] is not None}
+                    for column in columns}
+        rows = {column: {} for column in columns}
+        cursor = {column: self.oids.oid(column, first - 1) for column in columns}
+        width = len(columns) # columns per PDU
+        while cursor:
+            active = list(cursor)[:width]
+            logger.debug("Sending GETBULK of %d columns x %d to %s Wiener module", len(active), max_repetitions, self.device)
+            errorIndication, errorStatus, errorIndex, varBinds = await self._send(
+                bulk_cmd, self.authData_public, 0, max_repetitions,
+                *(ObjectType(ObjectIdentity(cursor[column])) for column in active))
+            if not errorIndication and errorStatus == 1 and (max_repetitions > 1 or width > 1): # tooBig
+                if max_repetitions > 1:
+                    max_repetitions //= 2
+                else:
+                    width = (len(active) + 1) // 2
+                continue
+            varBinds = self._check(bulk_cmd, "of outputTable", errorIndication, errorStatus, errorIndex, varBinds)
+            if not varBinds:
+                break
+            for i, (oid, value) in enumerate(varBinds):
+                column = active[i % len(active)]
+                if column not in cursor:
+                    continue
+                prefix = tuple(self.oids[column]["oid"])
+                oid = tuple(oid)
+                if (oid[:-1] != prefix or not first <= oid[-1] <= last or oid <= cursor[column]
+                        or isinstance(value, EndOfMibView)):
+                    del cursor[column] # walked off the end of this column (or of the module)
+                    continue
+                rows[column][oid[-1]] = value
+                cursor[column] = oid
+        with METRICS.timer("wicc_phase_seconds", phase="decode"):
+            for column, values in rows.items(): # each column decoded at once (see utils.decode_floats)
+                rows[column] = dict(zip(values, decode_values([self.oids.syntax(column)] * len(values),
+                                                              list(values.values()))))
+        return rows
 
     # SNMP set commands must be executed with authorisation 'guru' 
     # i.e. snmpget -v 2c -M /usr/share/snmp/mibs -m +WIENER-CRATE-MIB -c public 10.179.59.29 outputVoltage.101 F 100.0
+    @instrumented("write", keys=lambda args, result: [args[:2]])
     @snmp_call("guru", set_cmd)
     async def write(self, oid, val : float | int):
+        return [ObjectType(oid, self._encode(val))]
+
+    @staticmethod
+    def _encode(val : float | int):
         # floats must be encoded using BER ASN.1 FLOATTYPE, as defined in WIENER-CRATE-MIB.txt
-        # integers are passed normally. 
+        # integers are passed as Integer32 (the MIB is not loaded, so pysnmp cannot infer the type). 
         if isinstance(val, float):
-            return [ObjectType(oid, FloatOpaque(val))]
-        return [ObjectType(oid, val)]
-        
+            return FloatOpaque(val)
+        return Integer32(val)
 
-    def set_voltage(self, channel: int, voltage: float):
+    @instrumented("write")
+    async def write_many(self, writes : list[tuple[str, int | str, float | int]], urgent : bool = False) -> dict:
+        """
+        Write several objects with as few SET PDUs as possible, e.g.
+            write_many([("outputVoltage", 1, 50.0), ("outputCurrent", 1, 0.001), ("outputSwitch", 1, 1)])
+        All writes to one channel travel in the same PDU, so the crate applies them together (an agent
+        applies a SET PDU all-or-nothing); channels are packed max_varbinds to a PDU and the PDUs sent concurrently.
+        urgent writes are not queued behind other requests (see _send).
+        Returns {(command, channel): decoded echoed value}.
+        """
+        if self.transport is not None:
+            return await self._transport_write(writes, urgent)
+        groups = {}
+        floats = iter(encode_floats([value for _, _, value in writes if isinstance(value, float)]))
+        with METRICS.timer("wicc_phase_seconds", phase="mib"):
+            for command, channel, value in writes:
+                mapped = self.get_channel(channel) if isinstance(channel, int) else channel
+                oid = self.oids.oid(command, mapped)
+                var_bind = ObjectType(ObjectIdentity(oid), next(floats) if isinstance(value, float) else self._encode(value))
+                groups.setdefault(mapped, []).append(((command, channel), oid[-1], var_bind))
+        pdus, pdu = [], []
+        for group in groups.values():
+            if pdu and len(pdu) + len(group) > self.max_varbinds:
+                pdus.append(pdu)
+                pdu = []
+            pdu = pdu + group
+        if pdu:
+            pdus.append(pdu)
+        logger.debug("Sending %d varbinds in %d SET PDUs to %s Wiener module", len(writes), len(pdus), self.device)
+        if self.cache is not None: # until the echoes arrive the crate's values are unknown
+            for pdu in pdus:
+                for (command, _), index, _ in pdu:
+                    self.cache.invalidate(command, index)
+        chunks = await asyncio.gather(*(self._set([var_bind for _, _, var_bind in pdu], urgent) for pdu in pdus))
+        retv = {}
+        for pdu, chunk in zip(pdus, chunks):
+            with METRICS.timer("wicc_phase_seconds", phase="decode"):
+                values = decode_values([self.oids.syntax(key[0]) for key, _, _ in pdu], [value for _, value in chunk])
+            for (key, index, _), value in zip(pdu, values):
+                retv[key] = value
+                if self.cache is not None:
+                    self.cache.written(key[0], index, retv[key])
+        return retv
+
+    async def _transport_write(self, writes : list[tuple[str, int | str, float | int]], urgent : bool = False) -> dict:
+        """
+        write_many over self.transport, which applies the writes in order and reports the resulting values.
+        """
+        mapped = [(command, self.get_channel(channel) if isinstance(channel, int) else channel, value)
+                  for command, channel, value in writes]
+        indices = {(command, instance): self.oids.index(command, instance) for command, instance, _ in mapped}
+        logger.debug("Sending %d writes to %s Wiener module", len(writes), self.device)
+        if self.cache is not None:
+            for command, instance in indices:
+                self.cache.invalidate(command, indices[(command, instance)])
+        echoed = await self.transport.write_many(mapped, urgent)
+        retv = {}
+        for (command, channel, _), (_, instance, _) in zip(writes, mapped):
+            retv[(command, channel)] = echoed[(command, instance)]
+            if self.cache is not None:
+                self.cache.written(command, indices[(command, instance)], retv[(command, channel)])
+        return retv
+
+    async def _set(self, var_binds : list, urgent : bool = False) -> list:
+        errorIndication, errorStatus, errorIndex, varBinds = await self._send(
+            set_cmd, self.authData_guru, *var_binds, urgent=urgent)
+        if not errorIndication and errorStatus == 1 and len(var_binds) > 1: # tooBig: split the PDU
+            half = len(var_binds) // 2
+            first, second = await asyncio.gather(self._set(var_binds[:half], urgent), self._set(var_binds[half:], urgent))
+            return first + second
+        return self._check(set_cmd, f"of {len(var_binds)} varbinds", errorIndication, errorStatus, errorIndex, varBinds)
+
+    async def set_voltage(self, channel: int, voltage: float):
         """
         Set the voltage on the device.
         """
-        if voltage == 0.0:
-            self.enable_output(channel, 0)
+        if voltage == 0.0: # switch off and zero the setpoint in one PDU
+            logger.debug(f"Setting output voltage of CH{channel} to 0 V and turning it OFF")
+            values = await self.write_many([("outputSwitch", channel, 0), ("outputVoltage", channel, 0.0)])
+            return values[("outputVoltage", channel)]
         elif isinstance(voltage, int):
             try:
                 voltage=float(voltage)
             except:
                 raise TypeError("Voltage setpoint cannot be cast to float")
         logger.debug(f"Setting output voltage of CH{channel} to {voltage} V ")
-        rval = asyncio.run(self.write('outputVoltage', channel, voltage))
-        return opaque_to_float(rval)
+        values = await self.write_many([("outputVoltage", channel, voltage)])
+        return values[("outputVoltage", channel)]
     
-    def get_voltage(self, channel: int) -> float:
+    async def get_voltage(self, channel: int) -> float:
         """
         Get the voltage from the device.
         
@@ -157,20 +469,17 @@ class Wiener:
             float: The current voltage.
         """
         logger.debug(f"Reading outputVoltage of CH{channel} ")
-        raw = asyncio.run(self.read("outputVoltage", channel))
-        return opaque_to_float(raw)
+        return await self._read("outputVoltage", channel)
   
-    def meas_term_voltage(self, channel: int):
+    async def meas_term_voltage(self, channel: int):
         logger.debug(f"Reading measured terminal voltage of CH{channel}")
-        raw = asyncio.run(self.read("outputMeasurementTerminalVoltage", channel))
-        return opaque_to_float(raw)
+        return await self._read("outputMeasurementTerminalVoltage", channel)
   
-    def meas_sense_voltage(self, channel: int):
+    async def meas_sense_voltage(self, channel: int):
         logger.debug("Reading measured sense voltage of CH{channel}")
-        raw = asyncio.run(self.read("outputMeasurementSenseVoltage", channel))
-        return opaque_to_float(raw)
+        return await self._read("outputMeasurementSenseVoltage", channel)
     
-    def set_current(self, channel: int, current: float):
+    async def set_current(self, channel: int, current: float):
         """
         Set the current on the device. Returns setpoint in mA.
         """
@@ -180,139 +489,348 @@ class Wiener:
                 current = float(current)
             except:
                 raise TypeError("Current could not be cast to float.")
-        rval = asyncio.run(self.write('outputCurrent', channel, current))
+        values = await self.write_many([("outputCurrent", channel, current)])
         mult = 1e3
         # mult = 1e6 if self.device == 'HV' else 1
-        return opaque_to_float(rval) * mult
+        return values[("outputCurrent", channel)] * mult
     
     
-    def get_current(self, channel: int) -> float:
+    async def get_current(self, channel: int) -> float:
         """
         Reads the current setpoint in mA. 
         Uncomment line to change to uA for HV and A for LV
         """
         logger.debug(f"Reading nominal output current of CH{channel}")
-        raw = asyncio.run(self.read("outputCurrent", channel))
         mult = 1e3
         # mult = 1e6 if self.device == 'HV' else 1
-        return opaque_to_float(raw) * mult
+        return await self._read("outputCurrent", channel) * mult
 
-    def meas_current(self, channel: int):
+    async def meas_current(self, channel: int):
         """
         Returns the current measured at the terminal in mA 
         Uncomment line to change to uA for HV and A for LV
         """
         logger.debug(f"Reading measured output current of CH{channel}")
-        raw = asyncio.run(self.read("outputMeasurementCurrent", channel))
         mult = 1e3
         # mult = 1e6 if self.device == 'HV' else 1
-        return opaque_to_float(raw) * mult
+        return await self._read("outputMeasurementCurrent", channel) * mult
 
-    def set_output(self, channel : int, voltage : float, current :float):
-        logger.debug(f"Setting CH{channel} to {voltage} V and {current} A")
-        v_set = self.set_voltage(channel, voltage)
-        i_set = self.set_current(channel, current)
-        return v_set, i_set
+    async def set_output(self, channel : int, voltage : float, current : float, rise_rate : float | None = None,
+                         fall_rate : float | None = None, switch : int | None = None):
+        """
+        Set voltage and current (and optionally rise/fall rates in V/s and outputSwitch) of a channel in one SET PDU.
+        A voltage of 0 also switches the channel off, in the same PDU.
+        Returns the echoed (voltage in V, current in mA).
+        """
+        return (await self.set_outputs({channel: (voltage, current)}, rise_rate, fall_rate, switch))[channel]
 
-    def output_enabled(self, channel : int):
+    @staticmethod
+    def output_writes(channel : int, voltage : float, current : float, rise_rate : float | None = None,
+                      fall_rate : float | None = None, switch : int | None = None) -> list[tuple]:
+        """
+        The (command, channel, value) writes of set_output, for write_many. A voltage of 0 also switches the channel off.
+        """
+        try:
+            voltage, current = float(voltage), float(current)
+        except (TypeError, ValueError):
+            raise TypeError("Voltage and current setpoints cannot be cast to float")
+        writes = []
+        if voltage == 0.0 and switch is None:
+            writes.append(("outputSwitch", channel, 0))
+        writes += [("outputVoltage", channel, voltage), ("outputCurrent", channel, current)]
+        if rise_rate is not None:
+            writes.append(("outputVoltageRiseRate", channel, float(rise_rate)))
+        if fall_rate is not None:
+            writes.append(("outputVoltageFallRate", channel, float(fall_rate)))
+        if switch is not None:
+            writes.append(("outputSwitch", channel, int(switch)))
+        return writes
+
+    async def set_outputs(self, outputs : dict[int, tuple[float, float]], rise_rate : float | None = None,
+                          fall_rate : float | None = None, switch : int | None = None) -> dict:
+        """
+        Multi-channel set_output: outputs = {channel: (voltage, current)}.
+        Each channel's settings are written in one PDU; returns {channel: (voltage in V, current in mA)}.
+        Switching on here is not supervised, use enable_output(s) to wait for the ramp.
+        """
+        writes = []
+        for channel, (voltage, current) in outputs.items():
+            logger.debug(f"Setting CH{channel} to {voltage} V and {current} A")
+            writes += self.output_writes(channel, voltage, current, rise_rate, fall_rate, switch)
+        values = await self.write_many(writes)
+        mult = 1e3
+        return {channel: (values[("outputVoltage", channel)], values[("outputCurrent", channel)] * mult)
+                for channel in outputs}
+
+    async def output_enabled(self, channel : int):
         logger.debug(f"Reading whether CH{channel} is on/off")
-        raw = asyncio.run(self.read("outputSwitch", channel))
-        if "on" in str(raw):
-            return True
-        return False
+        raw = await self._read("outputSwitch", channel)
+        return raw == self.oids["outputSwitch"]["values"]["on"]
 
-    def enable_output(self, channel : int, state : int | str | bool, tries : int = 3):
+    async def enable_output(self, channel : int, state : int | str | bool, tries : int = 3):
         """Accepts states 0 (off), 1 (on).  
-        Multiple retries in case voltage switching causes current spike.
-        Checks by waiting for the voltage to theoretically ramp up
-        and then checking error status and measured voltage.
+        Switching on is supervised by self.ramps (see ramp.RampSupervisor): the channel is polled until it
+        reaches constant-voltage mode at its setpoint, with retries (clear events, switch on again) in case
+        voltage switching causes a current spike or the ramp takes too long.
         """
         if state in ['off', 0, False, 'OFF']:
             logger.debug(f"Turning CH{channel} OFF")
-            raw = asyncio.run(self.write("outputSwitch", channel, 0))
+            raw = await self.write("outputSwitch", channel, 0)
             return raw
-        for i in range(tries):
-            logger.debug(f"Turning CH{channel} to {state}: Attempt {i+1}")
-            print(f"Try {i + 1}")
-            raw = asyncio.run(self.write("outputSwitch", channel, 1))
-            print("Ramping up...please wait")
-            first_delay = 7
-            time.sleep(first_delay)
-            status = self.get_output_status(channel)
-            print(status)
-            if "outputLowCurrentRange" in status:
-                print("Retry after first delay")
-                self.clear_events(channel)
-                continue
-            elif "outputConstantVoltage" in status:
-                return raw
-            volt_meas = self.meas_term_voltage(channel)
-            volt_set = self.get_voltage(channel)
-            delay = volt_set/5 - first_delay if volt_set/5 > first_delay else 1
-            status = self.get_output_status(channel)
-            time.sleep(delay)
-            if (volt_set - 1 <= volt_meas <= volt_set + 1) and ("outputConstantVoltage" in status): 
-                return raw
-            print("Retry after second delay")
-            self.clear_events(channel)
-            time.sleep(2)
-        return "Failed"
+        logger.debug(f"Turning CH{channel} to {state}")
+        return (await self.enable_outputs([channel], tries))[channel]
+
+    async def enable_outputs(self, channels : list[int], tries : int = 3) -> dict:
+        """
+        Switch several channels on and wait for all of their ramps, which run concurrently.
+        Returns {channel: 1 (on) or "Failed"}.
+        """
+        futures = self.ramps.enable(channels, tries=tries)
+        results = await asyncio.gather(*futures.values(), return_exceptions=True)
+        on = self.oids["outputSwitch"]["values"]["on"]
+        retv = {}
+        for channel, result in zip(futures, results):
+            if isinstance(result, RampError):
+                logger.warning(str(result))
+            elif isinstance(result, BaseException):
+                raise result
+            retv[channel] = "Failed" if isinstance(result, RampError) else on
+        return retv
     
-    def all_off(self):
+    async def all_off(self):
         logger.debug("Ramping down and turning off all channels")
         channel = 64 if self.device == "HV" else 128
-        raw = asyncio.run(self.write("groupsSwitch", channel, 0))
-        return raw
+        raw = await self.write_many([("groupsSwitch", channel, 0)], urgent=True)
+        return raw[("groupsSwitch", channel)]
     
-    def identify(self):
+    async def identify(self):
         logger.debug("Reading module description")
-        channel = 'ma0' if self.device == "LV" else 'ma1'
-        raw = asyncio.run(self.write("moduleDescription", channel))
+        raw = await self._read("moduleDescription", f"ma{self.slot}")
         return raw
 
-    def set_crate_power(self, state : int | str | bool):
+    async def set_crate_power(self, state : int | str | bool):
         logger.debug(f"Set crate power to {state}")
-        raw = asyncio.run(self.write("sysMainSwitch", 0, switch_to_int(state)))
+        raw = await self.write("sysMainSwitch", 0, switch_to_int(state))
         return raw
     
-    def get_crate_power(self):
+    async def get_crate_power(self):
         logger.debug("Read crate power state")
-        raw = asyncio.run(self.read("sysMainSwitch", 0))
-        if "on" in str(raw):
-            return True
-        return False
+        raw = await self._read("sysMainSwitch", 0)
+        return raw == self.oids["sysMainSwitch"]["values"]["on"]
     
-    def get_output_status(self, channel : int):
+    async def get_output_status(self, channel : int):
         """
-        Output status is output as a ASN BITS object which is a pain to interpret. 
-        The function returns 3 hex numbers (0x__ 0x__ 0x__) which needs to be split up into substrings.
-        Returns an array of status conditions 
+        Returns an array of the status conditions set on the channel (names from statusBits).
         """
         logger.debug(f"Reading output status of CH{channel}")
-        raw = asyncio.run(self.read("outputStatus", channel))
-        bs = str(bytes(raw).hex())
-        out = ""
-        for i in range(int(len(bs)/2)):
-            hx = int(bs[2*i:2*i+2], 16) # consider each 2-digit hex number in 
-            out += f"{hx:>08b}" #translate to binary, pad to little-endian 8 bits 
-        retv = []
-        for i, bit in enumerate(out):
-            # for each bit that is true (1), lookup the corresponding error code in the statusBits dictionary
-            logging.debug(f"Bit {i} : {bit} = {self.statusBits.get(int(i)) if bit == '1' else ''}")
-            retv.append(self.statusBits.get(int(i)) if bit == '1' else '') 
-        return [a for a in retv if a != '']
-    
-    def clear_events(self, channel : int):
+        raw = await self._read("outputStatus", channel)
+        return self.decode_status(raw)
+
+    async def get_output_flags(self, channel : int) -> OutputStatus:
+        """
+        Output status of the channel as an OutputStatus bitmask, e.g. flags & OutputStatus.outputOn
+        """
+        return from_bits(await self._read("outputStatus", channel))
+
+    @classmethod
+    def decode_status(cls, raw : bytes) -> list[str]:
+        """
+        Translate a raw outputStatus BITS value into the list of status conditions that are set.
+        """
+        return [flag.name for flag in from_bits(raw)]
+
+    async def status_matrix(self, channels : list[int] | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Output status of many channels as (channel numbers, bool matrix of channel x flag); column j is FLAGS[j].
+        Without channels, every channel of the module is read with one GETBULK walk.
+        """
+        if channels is None:
+            snap = await self.snapshot(("outputStatus",))
+            return snap["channel"], status_matrix(snap["outputStatus"])
+        values = await self.read_many([("outputStatus", channel) for channel in channels])
+        return np.array(channels, dtype=int), status_matrix(values.values())
+
+    async def any_tripped(self, channels : list[int] | None = None, mask : int = TRIPPED) -> bool:
+        """
+        True if any channel (by default every channel of the module) has a status bit of mask set.
+        """
+        if channels is None:
+            raws = (await self.snapshot(("outputStatus",)))["outputStatus"]
+        else:
+            raws = (await self.read_many([("outputStatus", channel) for channel in channels])).values()
+        return any_set(raws, mask)
+
+    async def clear_events(self, channel : int):
         logger.debug(f"Clearing events of CH{channel}")
-        raw = asyncio.run(self.write("outputSwitch", channel, 10))
+        raw = await self.write("outputSwitch", channel, 10)
         return raw
      
-    def clear_all_events(self):
+    async def clear_all_events(self):
         logger.debug(f"Clearing all events")
         channel = 64 if self.device == "HV" else 128
-        raw = asyncio.run(self.write("groupsSwitch", channel, 10))
+        raw = await self.write("groupsSwitch", channel, 10)
         return raw
-    
+
+
+class Wiener:
+    """
+    Synchronous interface to one module (HV or LV) of a Wiener crate: a thin wrapper that runs the AsyncWiener
+    coroutines on a private event loop. The loop, SNMP engine and transport stay open until close().
+    """
+    statusBits = AsyncWiener.statusBits
+
+    def __init__(self, host: str, mib_dir: str, mib_name: str, device : str, port : int = 161, max_in_flight : int = 8,
+                 cache : bool | SetpointCache = False, scheduler : RequestScheduler | None = None, slot : int | None = None,
+                 transport : str | Transport = "snmp", scpi_port : int = 10001, store : Store | None = None):
+        self.aio = AsyncWiener(host, mib_dir, mib_name, device, port=port, max_in_flight=max_in_flight, cache=cache,
+                               scheduler=scheduler, slot=slot, transport=transport, scpi_port=scpi_port, store=store)
+        self._loop = None
+
+    @property
+    def host(self) -> str:
+        return self.aio.host
+
+    @property
+    def cache(self) -> SetpointCache | None:
+        return self.aio.cache
+
+    @property
+    def device(self) -> str:
+        return self.aio.device
+
+    @property
+    def oids(self) -> OidTable:
+        return self.aio.oids
+
+    @property
+    def session(self) -> SnmpSession:
+        return self.aio.session
+
+    @property
+    def transport(self) -> Transport | None:
+        return self.aio.transport
+
+    def open(self):
+        """
+        Open the SNMP session: one event loop, one engine and one transport reused by every request until close().
+        Called implicitly by the first request if the session is not already open.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self.aio.open())
+        return self
+
+    def close(self):
+        if self._loop is None:
+            return
+        self._loop.run_until_complete(self.aio.close())
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self, coro):
+        """
+        Run a coroutine to completion on the session's event loop.
+        """
+        if self._loop is None or not self.aio.is_open:
+            self.open()
+        return self._loop.run_until_complete(coro)
+
+    def cli_store_channel(self, channel : int):
+        if 1 <= channel <= 8: 
+            self.channel = self.get_channel(channel)
+        else:
+            raise ValueError("Channels range from 1 to 8")
+
+    def get_channel(self, channel : int) -> str | int:
+        return self.aio.get_channel(channel)
+
+    def read_many(self, requests : list[tuple[str, int | str]]) -> dict:
+        return self._run(self.aio.read_many(requests))
+
+    def snapshot(self, columns : tuple[str, ...] | None = None, max_repetitions : int = 8) -> dict:
+        return self._run(self.aio.snapshot(columns, max_repetitions))
+
+    def set_voltage(self, channel: int, voltage: float):
+        return self._run(self.aio.set_voltage(channel, voltage))
+
+    def get_voltage(self, channel: int) -> float:
+        return self._run(self.aio.get_voltage(channel))
+
+    def meas_term_voltage(self, channel: int):
+        return self._run(self.aio.meas_term_voltage(channel))
+
+    def meas_sense_voltage(self, channel: int):
+        return self._run(self.aio.meas_sense_voltage(channel))
+
+    def set_current(self, channel: int, current: float):
+        return self._run(self.aio.set_current(channel, current))
+
+    def get_current(self, channel: int) -> float:
+        return self._run(self.aio.get_current(channel))
+
+    def meas_current(self, channel: int):
+        return self._run(self.aio.meas_current(channel))
+
+    def write_many(self, writes : list[tuple[str, int | str, float | int]]) -> dict:
+        return self._run(self.aio.write_many(writes))
+
+    def set_output(self, channel : int, voltage : float, current : float, rise_rate : float | None = None,
+                   fall_rate : float | None = None, switch : int | None = None):
+        return self._run(self.aio.set_output(channel, voltage, current, rise_rate, fall_rate, switch))
+
+    def set_outputs(self, outputs : dict[int, tuple[float, float]], rise_rate : float | None = None,
+                    fall_rate : float | None = None, switch : int | None = None) -> dict:
+        return self._run(self.aio.set_outputs(outputs, rise_rate, fall_rate, switch))
+
+    def output_enabled(self, channel : int):
+        return self._run(self.aio.output_enabled(channel))
+
+    def enable_output(self, channel : int, state : int | str | bool, tries : int = 3):
+        return self._run(self.aio.enable_output(channel, state, tries))
+
+    def enable_outputs(self, channels : list[int], tries : int = 3) -> dict:
+        return self._run(self.aio.enable_outputs(channels, tries))
+
+    def all_off(self):
+        return self._run(self.aio.all_off())
+
+    def identify(self):
+        return self._run(self.aio.identify())
+
+    def set_crate_power(self, state : int | str | bool):
+        return self._run(self.aio.set_crate_power(state))
+
+    def get_crate_power(self):
+        return self._run(self.aio.get_crate_power())
+
+    def get_output_status(self, channel : int):
+        return self._run(self.aio.get_output_status(channel))
+
+    def get_output_flags(self, channel : int) -> OutputStatus:
+        return self._run(self.aio.get_output_flags(channel))
+
+    def decode_status(self, raw : bytes) -> list[str]:
+        return self.aio.decode_status(raw)
+
+    def status_matrix(self, channels : list[int] | None = None) -> tuple[np.ndarray, np.ndarray]:
+        return self._run(self.aio.status_matrix(channels))
+
+    def any_tripped(self, channels : list[int] | None = None, mask : int = TRIPPED) -> bool:
+        return self._run(self.aio.any_tripped(channels, mask))
+
+    def clear_events(self, channel : int):
+        return self._run(self.aio.clear_events(channel))
+
+    def clear_all_events(self):
+        return self._run(self.aio.clear_all_events())
+
 def main():
     wiener = Wiener(host='10.179.59.29', mib_dir='/usr/share/snmp/mibs', mib_name='WIENER-CRATE-MIB', device ='HV')
     
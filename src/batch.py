@@ -0,0 +1,213 @@
+"""
+Batch execution of wicc commands for many channels of both modules, e.g.
+    HV 1-8 set 50 0.001; HV 1-8 enable 1
+    LV * meas-current   # '*' = every channel of the module
+Statements are separated by ';' or new lines. Each line of output is a JSON object per statement and channel.
+"""
+
+import asyncio, json, logging, re
+
+from Wiener import AsyncWiener
+
+logger = logging.getLogger("WienerBatch")
+
+# command -> (MIB object read, multiplier)
+READS = {
+    "get-current": ("outputCurrent", 1e3), # mA, as wicc_cli.py
+    "get-voltage": ("outputVoltage", 1),
+    "meas-current": ("outputMeasurementCurrent", 1e3),
+    "meas-voltage": ("outputMeasurementTerminalVoltage", 1),
+    "status": ("outputStatus", None),
+}
+# command -> number of arguments
+WRITES = {"set": 2, "enable": 1, "clear-events": 0}
+# enable argument -> outputSwitch value
+SWITCH = {"on": 1, "1": 1, "off": 0, "0": 0}
+
+
+class Statement:
+    def __init__(self, device : str, channels : list[int] | None, command : str, args : list[str], text : str,
+                 values : list | None = None):
+        self.device = device
+        self.channels = channels # None for '*'
+        self.command = command
+        self.args = args
+        self.text = text
+        self.values = values if values is not None else args # args converted: floats for set, 0/1 for enable
+
+
+def parse_channels(spec : str) -> list[int] | None:
+    """
+    "1,3,5-8" -> [1, 3, 5, 6, 7, 8]; "*" -> None (all channels)
+    """
+    if spec == "*":
+        return None
+    channels = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        channels += list(range(int(first), int(last or first) + 1))
+    return channels
+
+
+def parse_statement(raw : str) -> Statement:
+    words = raw.split()
+    if len(words) < 3:
+        raise ValueError(f"Expected 'DEVICE CHANNELS COMMAND [ARGS]': {raw.strip()}")
+    device, channels, command, args = words[0].upper(), words[1], words[2], words[3:]
+    if device not in ("HV", "LV"):
+        raise ValueError(f"Unknown device {device}: {raw.strip()}")
+    values = args
+    if command in WRITES:
+        if len(args) != WRITES[command]:
+            raise ValueError(f"{command} takes {WRITES[command]} arguments: {raw.strip()}")
+        if command == "set":
+            try:
+                values = [float(arg) for arg in args]
+            except ValueError:
+                raise ValueError(f"set takes a voltage and a current: {raw.strip()}")
+        elif command == "enable":
+            if args[0].lower() not in SWITCH:
+                raise ValueError(f"enable takes on, off, 1 or 0: {raw.strip()}")
+            values = [SWITCH[args[0].lower()]]
+    elif command not in READS or args:
+        raise ValueError(f"Unknown command {command}: {raw.strip()}")
+    try:
+        channels = parse_channels(channels)
+    except ValueError:
+        raise ValueError(f"Expected channels as 1, 1,3, 1-8 or *: {raw.strip()}")
+    return Statement(device, channels, command, args, raw.strip(), values)
+
+
+def parse(text : str) -> list[Statement]:
+    """
+    Parse and validate a whole script, so a bad statement fails before any module is touched.
+    Raises ValueError naming the line.
+    """
+    statements = []
+    for number, line in enumerate(text.split("\n"), 1):
+        for raw in re.sub(r"#.*", "", line).split(";"):
+            if not raw.strip():
+                continue
+            try:
+                statements.append(parse_statement(raw))
+            except ValueError as e:
+                raise ValueError(f"Line {number}: {e}")
+    return statements
+
+
+def stages(ops : list[tuple[Statement, int]]) -> list[list[tuple[Statement, int]]]:
+    """
+    Split (statement, channel) operations into stages that can run concurrently:
+    a stage ends when an operation touches a channel the stage already touches, so per-channel order is kept.
+    """
+    result, stage, touched = [], [], set()
+    for statement, channel in ops:
+        key = (statement.device, channel)
+        if key in touched:
+            result.append(stage)
+            stage, touched = [], set()
+        stage.append((statement, channel))
+        touched.add(key)
+    if stage:
+        result.append(stage)
+    return result
+
+
+async def run_device(wiener : AsyncWiener, ops : list[tuple[Statement, int]]) -> dict:
+    """
+    Execute one stage on one module: all writes in one write_many (one SET PDU per channel, channels packed together),
+    all reads in one read_many, and switch-ons through the ramp supervisor, concurrently.
+    Returns {(statement, channel): result or exception}.
+    """
+    writes, reads, switch_on = [], [], []
+    for statement, channel in ops:
+        if statement.command == "set":
+            writes += wiener.output_writes(channel, *statement.values)
+        elif statement.command == "enable":
+            if statement.values[0]:
+                switch_on.append(channel)
+            else:
+                writes.append(("outputSwitch", channel, 0))
+        elif statement.command == "clear-events":
+            writes.append(("outputSwitch", channel, 10))
+        else:
+            reads.append((READS[statement.command][0], channel))
+
+    async def nothing():
+        return {}
+    written, read, enabled = await asyncio.gather(
+        wiener.write_many(writes) if writes else nothing(),
+        wiener.read_many(reads) if reads else nothing(),
+        wiener.enable_outputs(switch_on) if switch_on else nothing(),
+        return_exceptions=True)
+
+    results = {}
+    for statement, channel in ops:
+        command = statement.command
+        try:
+            if command == "set":
+                if isinstance(written, Exception):
+                    raise written
+                results[(statement, channel)] = {"voltage": written[("outputVoltage", channel)],
+                                                 "current": written[("outputCurrent", channel)] * 1e3}
+            elif channel in switch_on and command == "enable":
+                if isinstance(enabled, Exception):
+                    raise enabled
+                results[(statement, channel)] = enabled[channel]
+            elif command in WRITES:
+                if isinstance(written, Exception):
+                    raise written
+                results[(statement, channel)] = written[("outputSwitch", channel)]
+            else:
+                if isinstance(read, Exception):
+                    raise read
+                name, mult = READS[command]
+                value = read[(name, channel)]
+                if value is None:
+                    raise ValueError(f"{name}.{channel} does not exist on the {wiener.device} Wiener module")
+                results[(statement, channel)] = wiener.decode_status(value) if mult is None else value * mult
+        except Exception as e:
+            results[(statement, channel)] = e
+    return results
+
+
+async def run(text : str, host : str, mib_dir : str, mib_name : str, port : int = 161, transport : str = "snmp",
+              scpi_port : int = 10001, out=print) -> int:
+    """
+    Parse and execute a batch script against the crate (over SNMP or, with transport="scpi", SCPI on scpi_port),
+    calling out() with one JSON line per statement and channel in script order. Returns the number of failed
+    operations.
+    """
+    statements = parse(text)
+    wieners = {device: AsyncWiener(host, mib_dir, mib_name, device, port=port, transport=transport, scpi_port=scpi_port)
+               for device in {s.device for s in statements}}
+    failed = 0
+    try:
+        for device in wieners: # resolve '*' to the channels the module has
+            if any(s.channels is None for s in statements if s.device == device):
+                channels = (await wieners[device].snapshot(("outputSwitch",)))["channel"].tolist()
+                for s in statements:
+                    if s.device == device and s.channels is None:
+                        s.channels = channels
+        ops = [(s, channel) for s in statements for channel in s.channels]
+        for stage in stages(ops):
+            logger.info(f"Running {len(stage)} operations")
+            by_device = {device: [op for op in stage if op[0].device == device] for device in wieners}
+            results = {}
+            for partial in await asyncio.gather(*(run_device(wieners[d], o) for d, o in by_device.items() if o)):
+                results.update(partial)
+            for statement, channel in stage:
+                line = {"device": statement.device, "channel": channel, "command": statement.command}
+                if statement.args:
+                    line["args"] = statement.args
+                result = results[(statement, channel)]
+                if isinstance(result, Exception):
+                    failed += 1
+                    line["error"] = str(result)
+                else:
+                    line["result"] = result
+                out(json.dumps(line))
+    finally:
+        for wiener in wieners.values():
+            await wiener.close()
+    return failed
@@ -0,0 +1,276 @@
+"""
+Latency and throughput benchmark of the Wiener client against simulator.py (or a real crate with --host).
+Results are written as JSON so runs can be compared with --compare.
+"""
+
+import asyncio, json, logging, os, platform, statistics, subprocess, sys, tempfile, threading, time
+
+import click
+import numpy as np
+from pysnmp.hlapi.v3arch.asyncio import get_cmd, CommunityData, ContextData, ObjectType, ObjectIdentity
+import simulator
+from oids import OidTable
+from scheduler import RequestScheduler
+from session import SnmpSession
+from Wiener import AsyncWiener, Wiener
+from log import verbosity, LoggingFormat
+
+logger = logging.getLogger("WienerBench")
+
+# operation -> coroutine factory (wiener, channel, i) run once per call
+OPERATIONS = {
+    "read": lambda w, ch, i: w.meas_current(ch),
+    "write": lambda w, ch, i: w.set_current(ch, 1e-4 * (1 + i % 2)),
+    "get_output_status": lambda w, ch, i: w.get_output_status(ch),
+    "set_output": lambda w, ch, i: w.set_output(ch, float(i % 2), 1e-4),
+    "all_off": lambda w, ch, i: w.all_off(),
+    "read_many": lambda w, ch, i: w.read_many([("outputMeasurementCurrent", ch), ("outputMeasurementTerminalVoltage", ch),
+                                              ("outputStatus", ch)]),
+}
+
+
+def _stats(latencies : list[float], elapsed : float) -> dict:
+    lat = np.array(latencies) * 1e3
+    return {"calls": len(lat),
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p99_ms": float(np.percentile(lat, 99)),
+            "mean_ms": float(lat.mean()),
+            "ops_per_s": len(lat) / elapsed}
+
+
+async def _timed(coro, latencies : list[float]):
+    start = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_operation(wiener : AsyncWiener, op : str, channels : int, duration : float) -> dict:
+    """
+    Run op on channels concurrently (one call per channel in flight) for duration seconds.
+    """
+    factory = OPERATIONS[op]
+    latencies = []
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        await asyncio.gather(*(_timed(factory(wiener, ch, calls), latencies) for ch in range(1, channels + 1)))
+        calls += 1
+    return {"op": op, "channels": channels, **_stats(latencies, time.perf_counter() - start)}
+
+
+async def run_fresh_session(host : str, port : int, oids : OidTable, device : str, duration : float) -> dict:
+    """
+    Baseline of a request paying for its own SnmpEngine and transport, as every request did before sessions were reused.
+    """
+    oid = ObjectIdentity(oids.oid("outputMeasurementCurrent", "u100" if device == "HV" else "u0"))
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        t = time.perf_counter()
+        session = SnmpSession(host, port)
+        await session.send(get_cmd, CommunityData("public", mpModel=1), ContextData(), ObjectType(oid))
+        session.close()
+        latencies.append(time.perf_counter() - t)
+    return {"op": "read_fresh_session", "channels": 1, **_stats(latencies, time.perf_counter() - start)}
+
+
+def cold_start(host : str, port : int, mib_dir : str, mib_name : str, device : str, **options) -> dict:
+    """
+    Time to the first reply for a new client: compiling the MIB without a cached OID table, loading the table
+    shipped in docs/ (empty cache) and the cached one, and constructing a Wiener and reading one value.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        OidTable.load(mib_dir, mib_name, cache_dir=cache_dir, shipped=False)
+        compile_s = time.perf_counter() - start
+        start = time.perf_counter()
+        OidTable.load(mib_dir, mib_name, cache_dir=cache_dir)
+        cached_s = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        OidTable.load(mib_dir, mib_name, cache_dir=cache_dir)
+        shipped_s = time.perf_counter() - start
+    start = time.perf_counter()
+    with Wiener(host=host, mib_dir=mib_dir, mib_name=mib_name, device=device, port=port, **options) as wiener:
+        wiener.meas_current(1)
+        first_s = time.perf_counter() - start
+    return {"mib_compile_ms": compile_s * 1e3, "oid_table_cached_ms": cached_s * 1e3,
+            "oid_table_shipped_ms": shipped_s * 1e3, "first_read_ms": first_s * 1e3}
+
+
+# modules wicc_cli.py must not import before a command runs (see startup)
+HEAVY_MODULES = ("pysnmp", "pyasn1", "numpy", "asyncio", "Wiener")
+# wicc_cli.py arguments that must return without them: help of the group and of a subcommand, usage errors
+LIGHT_INVOCATIONS = ((), ("--help",), ("channel", "--help"), ("set", "--help"), ("bogus-cmd",),
+                     ("channel", "notanint"))
+
+
+def startup(runs : int = 5) -> dict:
+    """
+    Startup cost of the CLI in fresh interpreters: median wall time of 'wicc_cli.py --help' (and of a bare
+    interpreter, for reference), and which HEAVY_MODULES 'import wicc_cli' and each of LIGHT_INVOCATIONS load,
+    as {"wicc_cli.py ARGS": modules} for the invocations loading any.
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wicc_cli.py")
+
+    def median_ms(*args):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        return statistics.median(times) * 1e3
+
+    heavy = {}
+    for args in LIGHT_INVOCATIONS:
+        # an existing -M, so the subcommand is what gets parsed; () only imports the module
+        run = f"wicc_cli.wicc.main({['-M', os.path.dirname(cli), *args]!r}, prog_name='wicc_cli.py')" if args else ""
+        probe = (f"import sys; sys.path.insert(0, {os.path.dirname(cli)!r}); import wicc_cli\n"
+                 f"try:\n    {run or 'pass'}\nexcept SystemExit:\n    pass\n"
+                 f"print('loaded:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True).stdout
+        loaded = [line[len("loaded:"):] for line in output.splitlines() if line.startswith("loaded:")]
+        if not loaded or loaded[-1]: # no line at all: the probe crashed
+            heavy[" ".join(("wicc_cli.py",) + args) if args else "import wicc_cli"] = \
+                loaded[-1].split(",") if loaded else ["?"]
+    return {"python_ms": median_ms("-c", "pass"), "cli_help_ms": median_ms(cli, "--help"), "cli_heavy_imports": heavy}
+
+
+def check_startup(result : dict, max_ms : float | None):
+    """
+    Fail if the CLI imports heavy modules up front, for help or for a usage error or, with max_ms, if --help
+    takes longer than that.
+    """
+    if result["cli_heavy_imports"]:
+        raise click.ClickException("wicc_cli imports heavy modules without running a command: " + "; ".join(
+            f"{', '.join(modules)} for '{invocation}'" for invocation, modules in result["cli_heavy_imports"].items()))
+    if max_ms is not None and result["cli_help_ms"] > max_ms:
+        raise click.ClickException(f"wicc_cli --help took {result['cli_help_ms']:.0f} ms (limit {max_ms:.0f} ms)")
+
+
+def start_simulator(port : int, oids : OidTable, channels : int, latency : float, jitter : float, loss : float,
+                    scpi_port : int | None = None):
+    """
+    Run the simulator (and on scpi_port its SCPI stand-in) on its own event loop in a daemon thread,
+    so the sync client can be benchmarked too.
+    """
+    ready = threading.Event()
+
+    async def start():
+        _, protocol = await simulator.start(port=port, oids=oids, channels=channels,
+                                            latency=latency, jitter=jitter, loss=loss)
+        if scpi_port is not None:
+            await simulator.start_scpi(port=scpi_port, crate=protocol.crate, latency=latency)
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+
+
+def compare(old : dict, new : dict):
+    """
+    Print the change of p50 latency and throughput per (op, channels) between two result files.
+    """
+    if "startup" in old and "startup" in new:
+        print(f"{'cli --help ms':<29}{old['startup']['cli_help_ms']:>8.1f} -> {new['startup']['cli_help_ms']:<6.1f}")
+    before = {(r["op"], r["channels"]): r for r in old["results"]}
+    print(f"{'op':<20}{'channels':>9}{'p50 ms':>18}{'ops/s':>22}")
+    for r in new["results"]:
+        o = before.get((r["op"], r["channels"]))
+        if o is None:
+            continue
+        print(f"{r['op']:<20}{r['channels']:>9}"
+              f"{o['p50_ms']:>8.2f} -> {r['p50_ms']:<6.2f}{o['ops_per_s']:>10.0f} -> {r['ops_per_s']:<8.0f}")
+
+
+@click.command()
+@click.option('-H', "--host", default=None, help="Benchmark a real crate instead of starting simulator.py")
+@click.option('-p', "--port", default=11161, type=click.INT, help="SNMP port (of the simulator). Default: 11161")
+@click.option('-d', "--device", default="HV", help="HV or LV. Default: HV")
+@click.option('-M', "--mib-path", default="/usr/share/snmp/mibs", help="Path to MIB files. Default: /usr/share/snmp/mibs")
+@click.option('-m', "--mib-name", default="WIENER-CRATE-MIB", help="Name of Wiener Crate MIB file. Default: WIENER-CRATE-MIB")
+@click.option("--ops", default=",".join(OPERATIONS), help="Comma separated operations to run. Default: all")
+@click.option("--channels", default="1,8,16", help="Comma separated channel counts. Default: 1,8,16")
+@click.option("--duration", default=2.0, type=click.FLOAT, help="Seconds per operation and channel count. Default: 2")
+@click.option("--latency", default=0.0, type=click.FLOAT, help="Simulated response delay in s. Default: 0")
+@click.option("--jitter", default=0.0, type=click.FLOAT, help="Simulated extra delay in s. Default: 0")
+@click.option("--loss", default=0.0, type=click.FLOAT, help="Simulated packet loss probability. Default: 0")
+@click.option('-t', "--transport", default="snmp", type=click.Choice(["snmp", "scpi"]), help="Client transport. Default: snmp")
+@click.option("--scpi-port", default=11001, type=click.INT, help="SCPI port (of the simulator). Default: 11001")
+@click.option("--rate", default=None, type=click.FLOAT, help="Client request rate limit per second. Default: none")
+@click.option('-o', "--output", default=None, type=click.Path(), help="Write results as JSON to this file (default: stdout)")
+@click.option("--compare", "baseline", default=None, type=click.Path(exists=True), help="Compare with a previous JSON result")
+@click.option("--startup-only", is_flag=True, help="Only measure the CLI startup (no simulator or crate needed)")
+@click.option("--max-startup-ms", default=None, type=click.FLOAT,
+              help="Fail if 'wicc_cli.py --help' takes longer, or if the CLI imports pysnmp/numpy/asyncio up front")
+@click.option('-v', "--verbose", count=True, help="Verbose output (-v = INFO, -vv = DEBUG)")
+def main(host, port, device, mib_path, mib_name, ops, channels, duration, latency, jitter, loss, transport, scpi_port, rate,
+         output, baseline, startup_only, max_startup_ms, verbose):
+    """
+    Measure CLI startup, cold start, per-call p50/p99 latency and sustained ops/s of the Wiener client.
+    """
+    logger.setLevel(verbosity(verbose))
+    ch = logging.StreamHandler()
+    ch.setFormatter(LoggingFormat())
+    logger.addHandler(ch)
+    logging.getLogger("WienerClass").setLevel(logging.ERROR) # per-request messages would dominate the timings
+
+    results = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                        "pid": os.getpid()},
+               "startup": startup(),
+               "results": []}
+    logger.info(f"wicc_cli --help: {results['startup']['cli_help_ms']:.0f} ms")
+    if not startup_only:
+        run_benchmark(results, host, port, device, mib_path, mib_name, ops.split(","),
+                      [int(n) for n in channels.split(",")], duration, latency, jitter, loss, transport, scpi_port, rate)
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
+    check_startup(results["startup"], max_startup_ms)
+
+
+def run_benchmark(results : dict, host : str | None, port : int, device : str, mib_path : str, mib_name : str,
+                  ops : list[str], channel_counts : list[int], duration : float, latency : float, jitter : float,
+                  loss : float, transport : str, scpi_port : int, rate : float | None):
+    """
+    Cold start and per-operation latency/throughput, added to results.
+    """
+    oids = OidTable.load(mib_path, mib_name)
+    if host is None:
+        host = "127.0.0.1"
+        start_simulator(port, oids, max(channel_counts), latency, jitter, loss, scpi_port)
+        logger.info(f"Simulator running on {host}:{port}")
+    scheduler = RequestScheduler.for_crate(host, port, rate=rate) # shared by every Wiener of the benchmark
+
+    results["meta"].update({"host": host, "port": port, "device": device, "duration": duration, "transport": transport,
+                            "rate": rate, "simulator": {"latency": latency, "jitter": jitter, "loss": loss}})
+    results["cold_start"] = cold_start(host, port, mib_path, mib_name, device, transport=transport, scpi_port=scpi_port)
+
+    async def run():
+        async with AsyncWiener(host, mib_path, mib_name, device, port=port, max_in_flight=max(channel_counts),
+                               transport=transport, scpi_port=scpi_port) as wiener:
+            for op in ops:
+                for n in channel_counts:
+                    result = await run_operation(wiener, op, n, duration)
+                    logger.info(f"{op} x {n}: p50 {result['p50_ms']:.2f} ms, {result['ops_per_s']:.0f} ops/s")
+                    results["results"].append(result)
+            await wiener.all_off()
+        results["results"].append(await run_fresh_session(host, port, oids, device, duration))
+        results["scheduler"] = scheduler.stats()
+
+    asyncio.run(run())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import time
+
+
+class SetpointCache:
+    """
+    Read-through cache of configuration objects (setpoints, rise/fall rates, supervision limits, names, switches).
+
+    Entries are keyed by (command, numeric index), filled by reads, updated with the values the crate echoes
+    back to writes, and expire after a per-object TTL (ttls, otherwise default_ttl). Only read-write objects
+    of the MIB (plus the static names in static) are cached, so measurements and outputStatus always go to the crate.
+    Switches change without a write from this client (trips, interlocks, front panel) and so get a short TTL.
+    A read that was sent before a write or invalidation of its entry completed may carry the old value, so reads
+    fill the cache with the token() taken when they started and put() drops them if the entry changed since.
+    """
+    default_ttl = 60.0
+    ttls = {
+        "outputSwitch": 1.0,
+        "sysMainSwitch": 1.0,
+    }
+    static = ("moduleDescription", "outputName")
+    uncached = ("groupsSwitch",) # write-only
+
+    def __init__(self, oids, default_ttl : float | None = None, ttls : dict | None = None):
+        self.oids = oids # OidTable
+        if default_ttl is not None:
+            self.default_ttl = default_ttl
+        self.ttls = {**self.ttls, **(ttls or {})}
+        self._entries = {} # (command, index) -> (value, expiry)
+        self._clock = 0 # counts writes and invalidations
+        self._changed = {} # (command, index), command or None (everything) -> _clock of its last change
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, command : str) -> bool:
+        if command in self.uncached:
+            return False
+        return command in self.static or self.oids[command]["access"] == "read-write"
+
+    def get(self, command : str, index : int) -> tuple[bool, object]:
+        """
+        (True, value) for a live entry, (False, None) otherwise.
+        """
+        entry = self._entries.get((command, index))
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            return True, entry[0]
+        self.misses += 1
+        return False, None
+
+    def token(self) -> int:
+        """
+        Taken before a read is sent and passed to put() with its result.
+        """
+        return self._clock
+
+    def _touch(self, key):
+        self._clock += 1
+        self._changed[key] = self._clock
+
+    def put(self, command : str, index : int, value, since : int | None = None):
+        """
+        Cache a value read from the crate. With since (a token()), the value is dropped if the entry was
+        written or invalidated after the read started.
+        """
+        if value is None or not self.cacheable(command):
+            return
+        if since is not None and max(self._changed.get((command, index), 0), self._changed.get(command, 0),
+                                     self._changed.get(None, 0)) > since:
+            return
+        self._entries[(command, index)] = (value, time.monotonic() + self.ttls.get(command, self.default_ttl))
+
+    def written(self, command : str, index : int, value):
+        """
+        Update the cache with the value echoed by a SET.
+        Writes that act on other objects (outputSwitch commands such as clearEvents, groupsSwitch, sysMainSwitch)
+        invalidate the switches they may have changed instead.
+        """
+        if command in ("groupsSwitch", "sysMainSwitch"):
+            self.invalidate("outputSwitch")
+            self.invalidate("sysMainSwitch")
+        elif command == "outputSwitch" and value not in (0, 1):
+            self.invalidate(command, index)
+        else:
+            self._touch((command, index))
+            self.put(command, index, value)
+
+    def invalidate(self, command : str | None = None, index : int | None = None):
+        """
+        Drop one entry, every entry of command, or (without arguments) everything.
+        """
+        self._touch(command if index is None else (command, index))
+        if command is None:
+            self._entries.clear()
+        elif index is None:
+            for key in [key for key in self._entries if key[0] == command]:
+                del self._entries[key]
+        else:
+            self._entries.pop((command, index), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
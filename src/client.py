@@ -0,0 +1,133 @@
+"""
+Thin client for the wicc daemon (wicc_cli.py serve). Only the standard library is imported, so a call costs
+Python startup plus the crate round trip. Takes the same arguments as wicc_cli.py, e.g.
+    python client.py -d HV channel 1 set 50 0.001 enable 1 meas-current
+and falls back to running wicc_cli.py directly if the daemon is not running (or the command is not supported).
+"""
+
+import json, os, socket, sys
+
+
+def default_socket() -> str:
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(base, f"wicc-{os.getuid()}.sock")
+
+
+class WiccClient:
+    """
+    Sends requests to the daemon over its Unix socket, one JSON object per line:
+        {"id": 1, "host": ..., "port": 161, "device": "HV", "method": "meas_current", "args": [1]}
+    """
+    def __init__(self, path : str | None = None, host : str | None = None, port : int | None = None,
+                 device : str = "LV", timeout : float = 30):
+        self.path = path or os.environ.get("WICC_SOCKET") or default_socket()
+        self.host = host
+        self.port = port
+        self.device = device
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.path)
+        self._file = self._sock.makefile("rb")
+        self._id = 0
+
+    def call(self, method : str, *args, **kwargs):
+        self._id += 1
+        request = {"id": self._id, "device": self.device, "method": method, "args": args, "kwargs": kwargs}
+        if self.host is not None:
+            request["host"] = self.host
+        if self.port is not None:
+            request["port"] = self.port
+        self._sock.sendall(json.dumps(request).encode() + b"\n")
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError(f"wicc daemon at {self.path} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise Exception(response["error"])
+        return response["result"]
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# wicc_cli.py commands: name -> number of arguments
+COMMANDS = {"channel": 1, "set": 2, "enable": 1, "get-current": 0, "get-voltage": 0, "meas-current": 0, "meas-voltage": 0}
+OPTIONS = {"-d": "device", "--device": "device", "-i": "ip", "--ip": "ip", "-p": "port", "--port": "port",
+           "-M": None, "--mib-path": None, "-m": None, "--mib-name": None}
+
+
+def parse(argv : list[str]) -> tuple[dict, list[tuple[str, list[str]]]]:
+    """
+    Split wicc_cli.py arguments into options and chained commands. Raises ValueError for anything
+    the thin client does not handle (which is then left to wicc_cli.py).
+    """
+    options = {"device": "LV", "ip": None, "port": None}
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        if argv[i] not in OPTIONS or i + 1 == len(argv):
+            raise ValueError(argv[i])
+        if OPTIONS[argv[i]]:
+            options[OPTIONS[argv[i]]] = argv[i + 1]
+        i += 2
+    commands = []
+    while i < len(argv):
+        name = argv[i]
+        if name not in COMMANDS:
+            raise ValueError(name)
+        n = COMMANDS[name]
+        args = argv[i + 1:i + 1 + n]
+        if len(args) < n:
+            raise ValueError(name)
+        commands.append((name, args))
+        i += 1 + len(args)
+    if not commands:
+        raise ValueError("no command")
+    return options, commands
+
+
+def run(client : WiccClient, commands : list[tuple[str, list[str]]]):
+    """
+    Execute the chained commands, printing what wicc_cli.py prints.
+    """
+    channel = 1
+    for name, args in commands:
+        if name == "channel":
+            channel = int(args[0])
+        elif name == "set":
+            v_set, i_set = client.call("set_output", channel, *(float(a) for a in args))
+            print(f"CH{channel}: {i_set:.2f} mA, {v_set:.2f} V")
+        elif name == "enable":
+            state = 1 if args[0] in ("on", "ON", "1") else 0
+            retv = client.call("enable_output", channel, state)
+            print(f"{retv=}")
+        elif name == "get-current":
+            print(f"{client.call('get_current', channel)} mA")
+        elif name == "get-voltage":
+            print(f"{client.call('get_voltage', channel):.2f} V")
+        elif name == "meas-current":
+            print(f"{client.call('meas_current', channel)} mA")
+        elif name == "meas-voltage":
+            print(f"{client.call('meas_term_voltage', channel):.2f} V")
+
+
+def main(argv : list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        options, commands = parse(argv)
+        client = WiccClient(host=options["ip"], port=int(options["port"]) if options["port"] else None,
+                            device=options["device"])
+    except (ValueError, OSError):
+        from wicc_cli import wicc # no daemon (or not a thin client command): do it in-process
+        return wicc(argv)
+    with client:
+        run(client, commands)
+
+if __name__ == '__main__':
+    main()
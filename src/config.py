@@ -0,0 +1,162 @@
+"""
+Export of the writable state of a module's channels to a JSON file, and restore writing only what differs, e.g.
+{
+    "version": 1, "created": "2026-10-17T09:30:00", "host": "10.179.59.29",
+    "modules": {"HV": {"slot": 1, "channels": {"1": {"outputVoltage": 50.0, "outputSwitch": 1, ...}, ...}}}
+}
+"""
+
+import asyncio, json, logging, math, time
+
+import numpy as np
+from ramp import RampError
+
+logger = logging.getLogger("WienerConfig")
+
+VERSION = 1
+
+# Restore order: limits, trip times/actions and groups first, so the new setpoints are supervised by the new limits,
+# then currents and ramp rates, then voltages. Switches come last (switch-offs first, see restore()).
+PHASES = (
+    ("limits", ("outputSupervisionBehavior",
+                "outputSupervisionMinSenseVoltage",
+                "outputSupervisionMaxSenseVoltage",
+                "outputSupervisionMaxTerminalVoltage",
+                "outputSupervisionMaxCurrent",
+                "outputSupervisionMaxTemperature",
+                "outputSupervisionMaxPower",
+                "outputTripTimeMaxCurrent",
+                "outputTripTimeMinSenseVoltage",
+                "outputTripTimeMaxSenseVoltage",
+                "outputTripTimeMaxTerminalVoltage",
+                "outputTripTimeMaxTemperature",
+                "outputTripTimeMaxPower",
+                "outputTripTimeTimeout",
+                "outputTripActionMinSenseVoltage",
+                "outputTripActionMaxSenseVoltage",
+                "outputTripActionMaxTerminalVoltage",
+                "outputTripActionMaxCurrent",
+                "outputTripActionMaxTemperature",
+                "outputTripActionMaxPower",
+                "outputTripActionExternalInhibit",
+                "outputTripActionTimeout",
+                "outputGroup")),
+    ("currents", ("outputCurrent",
+                  "outputCurrentRiseRate",
+                  "outputCurrentFallRate",
+                  "outputVoltageRiseRate",
+                  "outputVoltageFallRate")),
+    ("voltages", ("outputVoltage",)),
+    ("switches", ("outputSwitch",)),
+)
+COLUMNS = tuple(column for _, columns in PHASES for column in columns)
+
+
+def _clean(value):
+    """
+    JSON-friendly Python value of a snapshot cell, None if the channel does not have the object.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+async def read_state(wiener, channels : list[int] | None = None) -> dict:
+    """
+    Current writable state of the module's channels with GETBULK walks: {channel: {column: value}}.
+    """
+    columns = tuple(column for column in COLUMNS if column in wiener.oids)
+    snap = await wiener.snapshot(columns)
+    state = {}
+    for i, channel in enumerate(snap["channel"].tolist()):
+        if channels is not None and channel not in channels:
+            continue
+        values = {column: _clean(snap[column][i]) for column in columns}
+        state[channel] = {column: value for column, value in values.items() if value is not None}
+    return state
+
+
+async def export(wieners : list, channels : list[int] | None = None) -> dict:
+    """
+    Configuration file contents of the given AsyncWieners (modules of one crate).
+    """
+    states = await asyncio.gather(*(read_state(wiener, channels) for wiener in wieners))
+    return {"version": VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": wieners[0].host,
+            "modules": {wiener.device: {"slot": wiener.slot,
+                                        "channels": {str(ch): values for ch, values in state.items()}}
+                        for wiener, state in zip(wieners, states)}}
+
+
+def save(config : dict, path : str):
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def load(path : str) -> dict:
+    with open(path) as f:
+        config = json.load(f)
+    if config.get("version") != VERSION:
+        raise ValueError(f"Unsupported configuration version {config.get('version')} in {path} (expected {VERSION})")
+    return config
+
+
+def _equal(saved, live) -> bool:
+    if isinstance(saved, float) or isinstance(live, float): # float32 on the crate
+        return live is not None and math.isclose(saved, live, rel_tol=1e-6, abs_tol=1e-9)
+    return saved == live
+
+
+def diff(saved : dict, live : dict) -> list[tuple[str, int, object, object]]:
+    """
+    (command, channel, saved value, live value) of every saved value that differs from the live state,
+    in restore order (see PHASES). saved and live are {channel: {column: value}}.
+    """
+    changes = []
+    for _, columns in PHASES:
+        for column in columns:
+            for channel, values in saved.items():
+                channel = int(channel)
+                if column not in values:
+                    continue
+                current = live.get(channel, {}).get(column)
+                if column == "outputSwitch" and values[column] not in (0, 1):
+                    continue
+                if not _equal(values[column], current):
+                    changes.append((column, channel, values[column], current))
+    return changes
+
+
+async def restore(wiener, config : dict, dry_run : bool = False, tries : int = 3) -> list[tuple]:
+    """
+    Bring the module to the state saved for it in config, writing only the values that differ from the crate's.
+    Each phase is one write_many (all writes of a channel in one SET PDU, channels packed together), in the order
+    switch-offs, limits, currents and rates, voltages, supervised switch-ons (enable_outputs).
+    Returns the changes (see diff); with dry_run nothing is written.
+    """
+    module = config["modules"].get(wiener.device)
+    if module is None:
+        raise ValueError(f"No {wiener.device} module in the configuration")
+    saved = {int(ch): values for ch, values in module["channels"].items()}
+    changes = diff(saved, await read_state(wiener, list(saved)))
+    logger.info(f"{len(changes)} of {sum(map(len, saved.values()))} values differ on the {wiener.device} module")
+    if dry_run or not changes:
+        return changes
+
+    switch_off = [(column, ch, value) for column, ch, value, _ in changes if column == "outputSwitch" and value == 0]
+    switch_on = [ch for column, ch, value, _ in changes if column == "outputSwitch" and value == 1]
+    if switch_off:
+        await wiener.write_many(switch_off)
+    for phase, columns in PHASES:
+        writes = [(column, ch, value) for column, ch, value, _ in changes if column in columns and column != "outputSwitch"]
+        if writes:
+            logger.info(f"Restoring {len(writes)} {phase} values")
+            await wiener.write_many([(column, ch, float(value) if wiener.oids.syntax(column) == "float" else int(value))
+                                     for column, ch, value in writes])
+    if switch_on:
+        results = await wiener.enable_outputs(switch_on, tries)
+        failed = [ch for ch, result in results.items() if result == "Failed"]
+        if failed:
+            raise RampError(f"Channels {failed} of the {wiener.device} module did not ramp up")
+    return changes
@@ -0,0 +1,164 @@
+import asyncio, enum, inspect, json, logging, os, signal
+
+import numpy as np
+from Wiener import AsyncWiener
+from client import default_socket
+import metrics
+
+logger = logging.getLogger("WienerDaemon")
+
+# AsyncWiener coroutines that can be called through the socket
+METHODS = {name for name, member in inspect.getmembers(AsyncWiener, inspect.iscoroutinefunction)
+           if not name.startswith("_") and name not in ("open", "close")}
+
+
+def to_json(value):
+    """
+    Make an AsyncWiener result JSON serializable: arrays -> lists, bytes -> hex, SNMP values -> int/str,
+    dicts keyed by (command, channel) -> lists of [command, channel, value].
+    """
+    if value is None or isinstance(value, (bool, str, float)):
+        return value
+    if isinstance(value, enum.Enum):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, np.ndarray):
+        return [to_json(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, dict):
+        if any(isinstance(key, tuple) for key in value):
+            return [[*key, to_json(v)] for key, v in value.items()]
+        return {str(key): to_json(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    try:
+        return int(value) # pysnmp Integer32 etc.
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def from_json(value):
+    """
+    Inverse of to_json for arguments: lists -> tuples (usable as (command, channel) keys), "1" dict keys -> 1.
+    """
+    if isinstance(value, list):
+        return tuple(from_json(v) for v in value)
+    if isinstance(value, dict):
+        return {int(key) if key.lstrip("-").isdigit() else key: from_json(v) for key, v in value.items()}
+    return value
+
+
+class WienerDaemon:
+    """
+    Keeps one warm AsyncWiener (SNMP session) per crate and module, and serves their coroutines to local
+    clients (client.WiccClient) over a Unix socket as JSON lines. Requests from all clients share the sessions,
+    so a client's call only costs the crate round trip.
+    """
+    def __init__(self, host : str, mib_dir : str, mib_name : str, port : int = 161, path : str | None = None,
+                 metrics_port : int | None = None, transport : str = "snmp", scpi_port : int = 10001):
+        self.host = host
+        self.port = port
+        self.transport = transport # "snmp" or "scpi" (see AsyncWiener), for every crate the daemon talks to
+        self.scpi_port = scpi_port
+        self.mib_dir = mib_dir
+        self.mib_name = mib_name
+        self.path = path or default_socket()
+        self.metrics_port = metrics_port # serve metrics.METRICS over HTTP on this port
+        self.wieners = {}
+        self.server = None
+
+    def wiener(self, host : str, port : int, device : str) -> AsyncWiener:
+        key = (host, port, device)
+        if key not in self.wieners:
+            logger.info(f"Opening {device} session to {host}:{port}")
+            self.wieners[key] = AsyncWiener(host, self.mib_dir, self.mib_name, device, port=port,
+                                            transport=self.transport, scpi_port=self.scpi_port)
+        return self.wieners[key]
+
+    async def handle(self, request : dict) -> dict:
+        response = {"id": request.get("id")}
+        try:
+            method = request["method"]
+            if method == "metrics": # counters and latency histograms (see metrics.Metrics.snapshot)
+                response["result"] = to_json(metrics.METRICS.snapshot())
+                return response
+            if method not in METHODS:
+                raise ValueError(f"Unknown method {method}")
+            device = request.get("device", "LV")
+            if device not in ("HV", "LV"):
+                raise ValueError(f"Unknown device {device}")
+            wiener = self.wiener(request.get("host", self.host), int(request.get("port", self.port)), device)
+            args = from_json(request.get("args", []))
+            kwargs = from_json(request.get("kwargs", {}))
+            response["result"] = to_json(await getattr(wiener, method)(*args, **kwargs))
+        except Exception as e:
+            logger.info(f"Request {request} failed: {e}")
+            response["error"] = f"{type(e).__name__}: {e}"
+        return response
+
+    async def _connection(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        """
+        Requests on one connection are answered in order; separate connections run concurrently.
+        """
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"id": None, "error": f"Invalid request: {e}"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """
+        Listen on self.path until cancelled or stopped by SIGTERM/SIGINT, then close the sessions and remove
+        the socket. Raises FileExistsError if a daemon is already listening there.
+        """
+        if os.path.exists(self.path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path) # stale socket of a previous daemon
+            else:
+                writer.close()
+                raise FileExistsError(f"A wicc daemon is already listening on {self.path}")
+        self.server = await asyncio.start_unix_server(self._connection, self.path)
+        os.chmod(self.path, 0o600)
+        logger.warning(f"wicc daemon for {self.host}:{self.port} listening on {self.path}")
+        exporter = None
+        if self.metrics_port is not None:
+            metrics.enable()
+            exporter = asyncio.create_task(metrics.METRICS.serve("127.0.0.1", self.metrics_port))
+        loop, stopped = asyncio.get_running_loop(), []
+
+        def stop(signum : int):
+            logger.warning(f"Stopping on {signal.Signals(signum).name}")
+            stopped.append(signum)
+            self.server.close() # serve_forever raises CancelledError
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop, signum)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            if not stopped:
+                raise
+        finally:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+            if exporter is not None:
+                exporter.cancel()
+            for wiener in self.wieners.values():
+                await wiener.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
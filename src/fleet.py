@@ -0,0 +1,234 @@
+"""
+Several crates with several modules each, driven from one JSON config, e.g.
+{
+    "crates": {
+        "cc1": {"host": "10.179.59.29", "max_in_flight": 8, "rate": 100,
+                "modules": {"hv": {"device": "HV", "slot": 1}, "lv": {"device": "LV", "slot": 0}}},
+        "cc2": {"host": "10.179.59.30", "modules": {"hv": {"device": "HV"}}}
+    },
+    "aliases": {"tracker_bias": "cc1/hv/1"}
+}
+Channels are named globally as crate/module/channel ("cc1/hv/3"); "*" matches every crate, module or channel
+("cc1/hv/*", "*/lv/1", "*"), and aliases map to such names.
+"""
+
+import asyncio, json, logging
+
+import click
+from scheduler import RequestScheduler
+from utils import verbosity, LoggingFormat
+from Wiener import AsyncWiener
+
+logger = logging.getLogger("WienerFleet")
+
+
+class Fleet:
+    """
+    One AsyncWiener per crate module. Operations are grouped per module into batched PDUs (read_many/write_many)
+    and run concurrently across crates and modules, at most max_in_flight module operations per crate at a time.
+    """
+    def __init__(self, config : dict, mib_dir : str, mib_name : str):
+        self.config = config
+        self.aliases = config.get("aliases", {})
+        self.modules = {} # (crate, module) -> AsyncWiener
+        self.channels = {} # (crate, module) -> channels the module reports, read on first use
+        self._limits = {} # crate -> max_in_flight
+        self._semaphores = {}
+        for crate, c in config["crates"].items():
+            port = c.get("port", 161)
+            scheduler = RequestScheduler.for_crate(c["host"], port, rate=c.get("rate", 100.0), burst=c.get("burst", 16))
+            self._limits[crate] = c.get("max_in_flight", 8)
+            for module, m in c["modules"].items():
+                self.modules[(crate, module)] = AsyncWiener(c["host"], mib_dir, mib_name, m["device"], port=port,
+                                                            max_in_flight=self._limits[crate], scheduler=scheduler,
+                                                            slot=m.get("slot"))
+
+    @classmethod
+    def load(cls, path : str, mib_dir : str, mib_name : str, **kwargs) -> "Fleet":
+        with open(path) as f:
+            return cls(json.load(f), mib_dir, mib_name, **kwargs)
+
+    async def close(self):
+        await asyncio.gather(*(wiener.close() for wiener in self.modules.values()))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def resolve(self, names : list[str]) -> list[tuple[str, str, int]]:
+        """
+        Expand global channel names (with aliases and '*') into (crate, module, channel), against the channels
+        each module reports (one GETBULK walk per module, the first time it is needed).
+        Raises ValueError for names that match no module or a channel a module does not have.
+        """
+        parsed = []
+        for name in names:
+            name = self.aliases.get(name, name)
+            parts = name.split("/") if name != "*" else ["*", "*", "*"]
+            if len(parts) != 3:
+                raise ValueError(f"Channel names are crate/module/channel: {name}")
+            crate, module, channel = parts
+            matches = [key for key in self.modules if crate in ("*", key[0]) and module in ("*", key[1])]
+            if not matches:
+                raise ValueError(f"No module matches {name}")
+            if channel != "*" and not channel.isdigit():
+                raise ValueError(f"Channel names are crate/module/channel: {name}")
+            parsed.append((name, matches, channel))
+        missing = list(dict.fromkeys(key for _, matches, _ in parsed for key in matches if key not in self.channels))
+        snaps = await asyncio.gather(*(self._limited(key[0], self.modules[key].snapshot(("outputSwitch",)))
+                                       for key in missing))
+        for key, snap in zip(missing, snaps):
+            self.channels[key] = snap["channel"].tolist()
+        resolved = []
+        for name, matches, channel in parsed:
+            for c, m in matches:
+                if channel == "*":
+                    resolved += [(c, m, ch) for ch in self.channels[(c, m)]]
+                elif int(channel) in self.channels[(c, m)]:
+                    resolved.append((c, m, int(channel)))
+                else:
+                    raise ValueError(f"Channel {channel} does not exist on {c}/{m} ({name})")
+        return list(dict.fromkeys(resolved))
+
+    @staticmethod
+    def name(crate : str, module : str, channel : int) -> str:
+        return f"{crate}/{module}/{channel}"
+
+    async def _limited(self, crate : str, coro):
+        if crate not in self._semaphores: # created on the running loop
+            self._semaphores[crate] = asyncio.Semaphore(self._limits[crate])
+        async with self._semaphores[crate]:
+            return await coro
+
+    async def _per_module(self, items : dict, operation) -> dict:
+        """
+        Run operation(wiener, [items of that module]) for every module concurrently; items maps (crate, module, ...) keys.
+        """
+        groups = {}
+        for key in items:
+            groups.setdefault(key[:2], []).append(key)
+        results = await asyncio.gather(*(self._limited(crate, operation(self.modules[(crate, module)], keys))
+                                         for (crate, module), keys in groups.items()))
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return merged
+
+    async def read(self, command : str, names : list[str]) -> dict:
+        """
+        Read command of every channel in names: {"crate/module/channel": decoded value}
+        """
+        async def operation(wiener, keys):
+            values = await wiener.read_many([(command, ch) for _, _, ch in keys])
+            return {self.name(*key): values[(command, key[2])] for key in keys}
+        return await self._per_module(dict.fromkeys(await self.resolve(names)), operation)
+
+    async def write(self, command : str, values : dict[str, float | int]) -> dict:
+        """
+        Write {"crate/module/channel": value} (names may use '*' and aliases); returns the echoed values.
+        """
+        items = {}
+        for name, value in values.items():
+            for key in await self.resolve([name]):
+                items[key] = value
+
+        async def operation(wiener, keys):
+            echoed = await wiener.write_many([(command, key[2], items[key]) for key in keys])
+            return {self.name(*key): echoed[(command, key[2])] for key in keys}
+        return await self._per_module(items, operation)
+
+    async def set_outputs(self, outputs : dict[str, tuple[float, float]]) -> dict:
+        """
+        {"crate/module/channel": (voltage, current)} -> {"crate/module/channel": (voltage in V, current in mA)}
+        """
+        items = {}
+        for name, setting in outputs.items():
+            for key in await self.resolve([name]):
+                items[key] = setting
+
+        async def operation(wiener, keys):
+            echoed = await wiener.set_outputs({key[2]: items[key] for key in keys})
+            return {self.name(*key): echoed[key[2]] for key in keys}
+        return await self._per_module(items, operation)
+
+    async def all_off(self) -> dict:
+        """
+        Ramp down and switch off every module of every crate. All SETs go out at once, bypassing the per-crate
+        limits and rate limits, so this takes about one round trip to the slowest crate.
+        Returns {"crate/module": echoed value or the error}.
+        """
+        keys = list(self.modules)
+        results = await asyncio.gather(*(self.modules[key].all_off() for key in keys), return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"all_off of {key[0]}/{key[1]} failed: {result}")
+        return {f"{crate}/{module}": result if not isinstance(result, Exception) else str(result)
+                for (crate, module), result in zip(keys, results)}
+
+
+@click.group()
+@click.option('-c', "--config", required=True, type=click.Path(exists=True), help="Fleet configuration (JSON)")
+@click.option('-M', "--mib-path", default="/usr/share/snmp/mibs", help="Path to MIB files. Default: /usr/share/snmp/mibs")
+@click.option('-m', "--mib-name", default="WIENER-CRATE-MIB", help="Name of Wiener Crate MIB file. Default: WIENER-CRATE-MIB")
+@click.option('-v', "--verbose", count=True, help="Verbose output (-v = INFO, -vv = DEBUG)")
+@click.pass_context
+def main(ctx, config, mib_path, mib_name, verbose):
+    """
+    Control several Wiener crates at once. Channels are named crate/module/channel, '*' matches everything.
+    """
+    logger.setLevel(verbosity(verbose))
+    ch = logging.StreamHandler()
+    ch.setFormatter(LoggingFormat())
+    logger.addHandler(ch)
+    ctx.obj = (config, mib_path, mib_name)
+
+
+def _run(obj, method : str, *args):
+    config, mib_path, mib_name = obj
+
+    async def run():
+        async with Fleet.load(config, mib_path, mib_name) as fleet:
+            return await getattr(fleet, method)(*args)
+    try:
+        result = asyncio.run(run())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name, value in result.items(): # outputStatus (BITS) as the names of the flags set, like batch.py prints it
+        print(json.dumps({"channel": name, "result": AsyncWiener.decode_status(value) if isinstance(value, bytes) else value}))
+
+
+@main.command("read")
+@click.argument("command")
+@click.argument("names", nargs=-1, required=True)
+@click.pass_obj
+def cli_read(obj, command : str, names : tuple[str, ...]):
+    """
+    Read COMMAND (e.g. outputMeasurementCurrent) of the channels NAMES.
+    """
+    _run(obj, "read", command, list(names))
+
+
+@main.command("set")
+@click.argument("voltage", type=click.FLOAT)
+@click.argument("current", type=click.FLOAT)
+@click.argument("names", nargs=-1, required=True)
+@click.pass_obj
+def cli_set(obj, voltage : float, current : float, names : tuple[str, ...]):
+    """
+    Set VOLTAGE (V) and CURRENT (A) of the channels NAMES.
+    """
+    _run(obj, "set_outputs", {name: (voltage, current) for name in names})
+
+
+@main.command("all-off")
+@click.pass_obj
+def cli_all_off(obj):
+    """
+    Ramp down and switch off every module of every crate.
+    """
+    _run(obj, "all_off")
+
+if __name__ == '__main__':
+    main()
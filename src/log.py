@@ -0,0 +1,37 @@
+import logging
+
+
+def verbosity(level : int):
+    if level == 0:
+        return logging.WARNING
+    elif level == 1:
+        return logging.INFO
+    else:
+        return logging.DEBUG
+    
+
+class LoggingFormat(logging.Formatter):
+    """
+    Use ANSI colour codes to format logging messages
+    """
+    grey = "\x1b[38;20m"
+    yellow = "\x1b[33;20m"
+    red = "\x1b[31;20m"
+    bold_red = "\x1b[31;1m"
+    reset = "\x1b[0m"
+    format = "[%(asctime)s][%(name)s][%(levelname)s] - %(message)s @ (%(filename)s:%(lineno)d)"
+
+    formats = {
+        logging.DEBUG: grey + format + reset,
+        logging.INFO: grey + format + reset,
+        logging.WARNING: yellow + format + reset,
+        logging.ERROR: red + format + reset,
+        logging.CRITICAL: bold_red + format + reset
+    }
+        
+    def format(self, record):
+        log_fmt = self.formats.get(record.levelno)
+        formatter = logging.Formatter(log_fmt)
+        return formatter.format(record)
+    
+# def decode_output_status(bits : str):
@@ -0,0 +1,238 @@
+"""
+Counters and latency histograms of the requests to the crates, exposed in the Prometheus text format.
+Off by default: the instrumented code checks METRICS.enabled before taking any timestamp, e.g.
+    metrics.enable()
+    ... use Wiener/AsyncWiener ...
+    print(metrics.METRICS.prometheus())
+Series (labels in braces):
+    wicc_requests_total{op, device}                requests made through read_many/write_many/snapshot/...
+    wicc_request_seconds{op, device}               their latency
+    wicc_objects_total{op, device, object, channel} objects read/written
+    wicc_object_seconds{op, device, object}        time until the object's value was available (its batch's latency)
+    wicc_phase_seconds{phase}                      engine (SNMP engine and transport setup), mib (OID table load
+                                                   and OID resolution), network (one round trip), decode
+    wicc_timeouts_total{host}, wicc_retries_total{host}, wicc_errors_total{op, device}
+"""
+
+import asyncio, bisect, logging, math, os, time
+from contextlib import nullcontext
+from functools import wraps
+
+logger = logging.getLogger("WienerMetrics")
+
+# latency buckets in s, from a fast local agent to a retried request
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Cumulative-at-export histogram: counts per bucket (last one +Inf), sum and count.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets : tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value : float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q : float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (NaN if empty).
+        """
+        if not self.count:
+            return math.nan
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name : str, labels : dict):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+_NOT_TIMED = nullcontext()
+
+
+class Metrics:
+    """
+    Registry of counters and histograms keyed by (name, labels), labels being a tuple of (label, value) pairs.
+    """
+    def __init__(self, enabled : bool = False):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def inc(self, name : str, value : float = 1, **labels):
+        key = (name, tuple(labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name : str, value : float, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def timer(self, name : str, **labels):
+        """
+        Context manager observing the duration of the with block into the histogram name
+        (a shared no-op while disabled).
+        """
+        return _Timer(self, name, labels) if self.enabled else _NOT_TIMED
+
+    def objects(self, op : str, device : str, keys, seconds : float):
+        """
+        Count the (object, channel) keys of one batch and observe its latency for every object in it.
+        """
+        for command, channel in keys:
+            self.inc("wicc_objects_total", op=op, device=device, object=command, channel=str(channel))
+        for command in dict.fromkeys(command for command, _ in keys):
+            self.observe("wicc_object_seconds", seconds, op=op, device=device, object=command)
+
+    def request(self, op : str, device : str, seconds : float, keys=None, error : bool = False):
+        """
+        Record one read_many/write_many/... call: its latency, and per object if keys are given.
+        """
+        self.inc("wicc_requests_total", op=op, device=device)
+        self.observe("wicc_request_seconds", seconds, op=op, device=device)
+        if error:
+            self.inc("wicc_errors_total", op=op, device=device)
+        elif keys:
+            self.objects(op, device, keys, seconds)
+
+    def snapshot(self) -> dict:
+        """
+        Plain Python view: {"counters": {name: {labels: value}}, "histograms": {name: {labels: {count, sum, p50, p99}}}}
+        with labels as "label=value,..." strings.
+        """
+        def labels(key):
+            return ",".join(f"{label}={value}" for label, value in key)
+        counters, histograms = {}, {}
+        for (name, key), value in sorted(self.counters.items()):
+            counters.setdefault(name, {})[labels(key)] = value
+        for (name, key), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(name, {})[labels(key)] = {
+                "count": histogram.count, "sum": histogram.sum,
+                "p50": histogram.quantile(0.5), "p99": histogram.quantile(0.99)}
+        return {"counters": counters, "histograms": histograms}
+
+    @staticmethod
+    def _labels(key, extra : str = "") -> str:
+        parts = [f'{label}="{_escape(value)}"' for label, value in key]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def prometheus(self) -> str:
+        """
+        All series in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines, seen = [], set()
+        for (name, key), value in sorted(self.counters.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(key)} {value}")
+        for (name, key), histogram in sorted(self.histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                le = f'le="{"+Inf" if bound == math.inf else repr(bound)}"'
+                lines.append(f"{name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+            lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path : str):
+        """
+        Write prometheus() to path atomically (e.g. for the node_exporter textfile collector).
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    async def serve(self, host : str = "127.0.0.1", port : int = 9464):
+        """
+        Serve prometheus() over HTTP (any path) on the running event loop until cancelled.
+        """
+        async def handle(reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+            try:
+                while (await reader.readline()).strip(): # request line and headers
+                    pass
+                body = self.prometheus().encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+METRICS = Metrics()
+
+
+def enable():
+    METRICS.enabled = True
+
+
+def disable():
+    METRICS.enabled = False
+
+
+def instrumented(op : str, keys=None):
+    """
+    Decorator recording every call of an AsyncWiener coroutine as a request of type op (see Metrics.request).
+    keys(args, result) gives the (object, channel) pairs of the call; by default the keys of the result dict.
+    While disabled the only cost is one attribute check.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if not METRICS.enabled:
+                return await func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = await func(self, *args, **kwargs)
+            except Exception:
+                METRICS.request(op, self.device, time.perf_counter() - start, error=True)
+                raise
+            METRICS.request(op, self.device, time.perf_counter() - start,
+                            keys(args, result) if keys is not None else list(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,228 @@
+import hashlib, json, logging, os, re
+from pathlib import Path
+
+logger = logging.getLogger("WienerOids")
+
+# roots of the OID tree that the WIENER-CRATE-MIB hangs off (imported from SNMPv2-SMI)
+_ROOTS = {
+    "iso": (1,),
+    "internet": (1, 3, 6, 1),
+    "enterprises": (1, 3, 6, 1, 4, 1),
+}
+_INT_TYPES = ("Integer32", "INTEGER", "Counter32", "Gauge32", "Unsigned32", "TimeTicks")
+_STRING_TYPES = ("DisplayString", "OCTET STRING", "MacAddress")
+
+_STRINGS_AND_COMMENTS = re.compile(r'"[^"]*"|--[^\n]*')
+_DEFINITION = re.compile(
+    r'\b([a-z][\w-]*)\s+(OBJECT-TYPE|OBJECT-IDENTITY|MODULE-IDENTITY|OBJECT\s+IDENTIFIER)\b'
+    r'(.*?)::=\s*\{\s*([\w-]+)\s+(\d+)\s*\}', re.S)
+_TEXTUAL_CONVENTION = re.compile(r'\b([A-Z][\w-]*)\s*::=\s*TEXTUAL-CONVENTION(.*?)SYNTAX\s+(.*?)\n\s*\n', re.S)
+_SYNTAX = re.compile(r'SYNTAX\s+(.*?)\s*(?=UNITS|MAX-ACCESS|ACCESS|STATUS)', re.S)
+_ACCESS = re.compile(r'MAX-ACCESS\s+([\w-]+)')
+_INDEX = re.compile(r'INDEX\s*\{\s*([\w-]+)')
+_NAMED_VALUE = re.compile(r'([a-zA-Z][\w-]*)\s*\(\s*(-?\d+)\s*\)')
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "wicc"
+
+
+def shipped_dir() -> Path:
+    """
+    docs/, which holds the MIB and its precompiled OID table.
+    """
+    return Path(__file__).resolve().parent.parent / "docs"
+
+
+def find_mib(mib_dir: str, mib_name: str) -> Path:
+    """
+    Locate the MIB text file in mib_dir (with or without a .txt/.mib extension).
+    Falls back to the copy of the MIB shipped in docs/.
+    """
+    shipped = shipped_dir()
+    for directory in (Path(mib_dir), shipped):
+        for suffix in ("", ".txt", ".mib", ".my"):
+            path = directory / f"{mib_name}{suffix}"
+            if path.is_file():
+                return path
+    raise FileNotFoundError(f"Could not find {mib_name} in {mib_dir} or {shipped}")
+
+
+def _classify(syntax: str, conventions: dict) -> tuple[str, dict]:
+    """
+    Reduce a SYNTAX clause to one of: float, int, enum, bits, string, ipaddress, table, other.
+    Named values (for enum and bits) are returned alongside.
+    """
+    syntax = syntax.strip()
+    head = syntax.split("{")[0].split("(")[0].strip()
+    if head == "BITS" or (head == "INTEGER" and "{" in syntax):
+        values = {name: int(num) for name, num in _NAMED_VALUE.findall(syntax)}
+        return ("bits" if head == "BITS" else "enum"), values
+    if head == "Float":
+        return "float", {}
+    if head in conventions:
+        return _classify(conventions[head], conventions)
+    if head in _INT_TYPES:
+        return "int", {}
+    if head in _STRING_TYPES:
+        return "string", {}
+    if head == "IpAddress":
+        return "ipaddress", {}
+    if head.startswith("SEQUENCE OF"):
+        return "table", {}
+    return "other", {}
+
+
+def compile_mib(text: str) -> dict:
+    """
+    Compile the MIB text into a symbol table:
+        {name: {"oid": [...], "syntax": str, "access": str | None, "index": str | None, "values": {...}}}
+    Only the subset of SMI used by WIENER-CRATE-MIB is understood.
+    """
+    text = _STRINGS_AND_COMMENTS.sub(lambda m: '""' if m.group().startswith('"') else "", text)
+    conventions = {name: syntax.strip() for name, _, syntax in _TEXTUAL_CONVENTION.findall(text)}
+
+    parents = {}
+    objects = {}
+    for name, kind, body, parent, sub_id in _DEFINITION.findall(text):
+        parents[name] = (parent, int(sub_id))
+        syntax = _SYNTAX.search(body)
+        access = _ACCESS.search(body)
+        index = _INDEX.search(body)
+        kind, values = _classify(syntax.group(1), conventions) if syntax else ("node", {})
+        if index:
+            kind = "entry"
+        objects[name] = {"syntax": kind,
+                         "access": access.group(1) if access else None,
+                         "index": index.group(1) if index else None,
+                         "values": values}
+
+    def resolve(name):
+        if name in _ROOTS:
+            return _ROOTS[name]
+        parent, sub_id = parents[name]
+        return resolve(parent) + (sub_id,)
+
+    for name, obj in objects.items():
+        obj["oid"] = list(resolve(name))
+        parent = parents[name][0]
+        # columns inherit the INDEX of their table row (e.g. outputVoltage -> outputEntry -> outputIndex)
+        if obj["index"] is None and parent in objects and objects[parent]["syntax"] == "entry":
+            obj["index"] = objects[parent]["index"]
+    return objects
+
+
+class OidTable:
+    """
+    Symbol -> numeric OID table for the WIENER-CRATE-MIB.
+
+    The MIB is parsed once and the result cached on disk (keyed by a hash of the MIB file),
+    so building a request is a dictionary lookup rather than a pysnmp MIB load.
+    """
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self._by_oid = {tuple(obj["oid"]): name for name, obj in objects.items()}
+
+    @classmethod
+    def load(cls, mib_dir: str, mib_name: str, cache_dir: str | Path | None = None, shipped: bool = True) -> "OidTable":
+        """
+        Table of the MIB, from the user's cache, else (shipped=True) from the table precompiled into docs/
+        for the same MIB file (see write_shipped), else compiled and cached.
+        """
+        path = find_mib(mib_dir, mib_name)
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()[:16]
+        cache_file = Path(cache_dir or default_cache_dir()) / f"{mib_name}-{digest}.json"
+        for table in (cache_file, shipped_dir() / cache_file.name) if shipped else (cache_file,):
+            try:
+                with open(table) as f:
+                    return cls(json.load(f))
+            except (OSError, ValueError):
+                pass
+        logger.info(f"Compiling {path} into OID table {cache_file}")
+        objects = compile_mib(raw.decode("utf-8", errors="replace"))
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(objects, f, separators=(",", ":"))
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not write OID cache {cache_file}: {e}")
+        return cls(objects)
+
+    def __getitem__(self, command: str) -> dict:
+        try:
+            return self.objects[command]
+        except KeyError:
+            raise KeyError(f"{command} is not defined in the MIB") from None
+
+    def __contains__(self, command: str) -> bool:
+        return command in self.objects
+
+    def index(self, command: str, channel: str | int | None) -> int:
+        """
+        Translate a channel identifier (e.g. 'u101', 'ma0', 64) into the numeric index of command's table.
+        Scalars (sysMainSwitch, ...) always use instance 0.
+        """
+        index = self[command]["index"]
+        if index is None:
+            return 0
+        if isinstance(channel, str):
+            try:
+                return self[index]["values"][channel]
+            except KeyError:
+                if channel.isdigit():
+                    return int(channel)
+                raise ValueError(f"Unknown {index} '{channel}' for {command}") from None
+        if channel is None:
+            raise ValueError(f"{command} is a table column and needs a channel")
+        return int(channel)
+
+    def oid(self, command: str, channel: str | int | None = None) -> tuple:
+        """
+        Numeric OID of command.channel, e.g. oid('outputVoltage', 'u101') -> (1,3,6,1,4,1,19947,1,3,2,1,10,102)
+        """
+        return tuple(self[command]["oid"]) + (self.index(command, channel),)
+
+    def symbol(self, oid) -> tuple[str, int]:
+        """
+        Reverse lookup of an instance OID: returns (command, index).
+        """
+        oid = tuple(oid)
+        name = self._by_oid.get(oid[:-1])
+        if name is None:
+            raise KeyError(f"{'.'.join(map(str, oid))} is not an instance of a known MIB object")
+        return name, oid[-1]
+
+    def syntax(self, command: str) -> str:
+        return self[command]["syntax"]
+
+
+def write_shipped(mib_dir: str, mib_name: str) -> Path:
+    """
+    Compile the MIB into docs/{mib_name}-{hash}.json, the table OidTable.load uses when the user's cache is empty.
+    Rerun after updating the MIB in docs/.
+    """
+    path = find_mib(mib_dir, mib_name)
+    raw = path.read_bytes()
+    table = shipped_dir() / f"{mib_name}-{hashlib.sha256(raw).hexdigest()[:16]}.json"
+    with open(table, "w") as f:
+        json.dump(compile_mib(raw.decode("utf-8", errors="replace")), f, separators=(",", ":"))
+    return table
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.option('-M', "--mib-path", default="/usr/share/snmp/mibs", help="Path to MIB files. Default: /usr/share/snmp/mibs")
+    @click.option('-m', "--mib-name", default="WIENER-CRATE-MIB", help="Name of Wiener Crate MIB file. Default: WIENER-CRATE-MIB")
+    def main(mib_path, mib_name):
+        """
+        Precompile the MIB into the OID table shipped in docs/.
+        """
+        click.echo(write_shipped(mib_path, mib_name))
+
+    main()
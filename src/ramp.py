@@ -0,0 +1,173 @@
+import asyncio, logging, time
+
+from status import OutputStatus, from_bits
+
+logger = logging.getLogger("WienerRamp")
+
+
+class RampError(Exception):
+    """
+    Raised (through the channel's future) when a channel did not reach its voltage setpoint.
+    """
+
+
+class _Ramp:
+    def __init__(self, channel : int, future : asyncio.Future, callback, tries : int):
+        self.channel = channel
+        self.future = future
+        self.callback = callback
+        self.tries = tries
+        self.attempt = 0
+        self.switched = False # outputSwitch on has been sent for the current attempt
+        self.setpoint = None
+        self.rate = None # V/s
+        self.deadline = None
+        self.remaining = None # estimated seconds until the ramp finishes
+
+
+class RampSupervisor:
+    """
+    Switches channels on and supervises their voltage ramps concurrently, without blocking.
+
+    All supervised channels are polled together (outputStatus and measured terminal voltage in one batched
+    read) at a rate adapted to the time the ramps still need, clamped to [min_interval, max_interval].
+    A channel succeeds as soon as it reports outputConstantVoltage with the measured voltage within
+    tolerance of the setpoint. If a bit of retry_mask appears, or the ramp takes longer than
+    setpoint / outputVoltageRiseRate * slack + grace, the channel's events are cleared and it is switched
+    on again, up to tries attempts.
+
+    enable() returns one asyncio.Future per channel resolving to the measured voltage (or raising RampError);
+    an optional callback(channel, future) is called when each channel finishes.
+    """
+    retry_mask = (OutputStatus.outputLowCurrentRange | OutputStatus.outputFailureMaxCurrent
+                  | OutputStatus.outputFailureCurrentLimit | OutputStatus.outputEmergencyOff
+                  | OutputStatus.outputFailureMaxTerminalVoltage | OutputStatus.outputFailureMaxSenseVoltage)
+
+    def __init__(self, wiener, tolerance : float = 1.0, tries : int = 3, min_interval : float = 0.1,
+                 max_interval : float = 2.0, slack : float = 1.5, grace : float = 5.0):
+        self.wiener = wiener # AsyncWiener
+        self.tolerance = tolerance
+        self.tries = tries
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slack = slack
+        self.grace = grace
+        self._ramps = {}
+        self._task = None
+        self._wakeup = None
+
+    def enable(self, channels : list[int], callback=None, tries : int | None = None) -> dict[int, asyncio.Future]:
+        """
+        Switch the channels on and supervise their ramps. Must be called from the event loop.
+        Channels already being supervised keep their existing future.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for channel in channels:
+            ramp = self._ramps.get(channel)
+            if ramp is None:
+                ramp = self._ramps[channel] = _Ramp(channel, loop.create_future(), callback, tries or self.tries)
+            futures[channel] = ramp.future
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._supervise())
+        self._wakeup.set()
+        return futures
+
+    def cancel(self, channel : int):
+        """
+        Stop supervising a channel (its future is cancelled; the output is left as it is).
+        """
+        ramp = self._ramps.pop(channel, None)
+        if ramp is not None:
+            ramp.future.cancel()
+
+    @property
+    def active(self) -> list[int]:
+        return list(self._ramps)
+
+    async def _supervise(self):
+        try:
+            while self._ramps:
+                await self._start_attempts()
+                await self._poll()
+                if not self._ramps:
+                    break
+                interval = min((r.remaining for r in self._ramps.values() if r.remaining is not None),
+                               default=self.min_interval) / 2
+                interval = min(max(interval, self.min_interval), self.max_interval)
+                self._wakeup.clear()
+                try: # new channels wake the supervisor up early
+                    await asyncio.wait_for(self._wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            for channel in list(self._ramps):
+                self._finish(channel, error=e)
+
+    async def _start_attempts(self):
+        """
+        Switch on every channel that starts a new attempt, and read its setpoint and rise rate.
+        """
+        starting = [r for r in self._ramps.values() if not r.switched]
+        if not starting:
+            return
+        settings = await self.wiener.read_many([(command, r.channel) for r in starting
+                                                for command in ("outputVoltage", "outputVoltageRiseRate")])
+        await asyncio.gather(*(self.wiener.write("outputSwitch", r.channel, 1) for r in starting))
+        now = time.monotonic()
+        for r in starting:
+            r.attempt += 1
+            r.switched = True
+            r.setpoint = settings[("outputVoltage", r.channel)]
+            if r.setpoint is None:
+                self._finish(r.channel, error=RampError(f"CH{r.channel}: voltage setpoint could not be read"))
+                continue
+            rate = settings[("outputVoltageRiseRate", r.channel)] or 0.0
+            r.rate = rate if rate > 0 else 5.0 # without a rise rate assume the ~5 V/s the crate ramps at by default
+            r.remaining = r.setpoint / r.rate
+            r.deadline = now + r.remaining * self.slack + self.grace
+            logger.info(f"CH{r.channel}: ramping to {r.setpoint} V, attempt {r.attempt}/{r.tries}")
+
+    async def _poll(self):
+        channels = list(self._ramps)
+        values = await self.wiener.read_many([(command, channel) for channel in channels
+                                              for command in ("outputStatus", "outputMeasurementTerminalVoltage")])
+        now = time.monotonic()
+        for channel in channels:
+            r = self._ramps.get(channel)
+            if r is None:
+                continue
+            raw = values[("outputStatus", channel)]
+            status = from_bits(raw) if raw is not None else OutputStatus(0)
+            volt_meas = values[("outputMeasurementTerminalVoltage", channel)]
+            logger.debug(f"CH{channel}: {volt_meas} V, {status!r}")
+            settled = volt_meas is not None and abs(volt_meas - r.setpoint) <= self.tolerance # None: not read
+            if status & self.retry_mask:
+                await self._retry(r, f"status {status!r}")
+            elif status & OutputStatus.outputConstantVoltage and settled:
+                self._finish(channel, result=volt_meas)
+            elif now > r.deadline:
+                await self._retry(r, f"timed out at {volt_meas} V")
+            elif volt_meas is not None:
+                r.remaining = abs(r.setpoint - volt_meas) / r.rate
+
+    async def _retry(self, r : _Ramp, reason : str):
+        logger.info(f"CH{r.channel}: {reason}")
+        if r.attempt >= r.tries:
+            self._finish(r.channel, error=RampError(f"CH{r.channel} failed to ramp after {r.attempt} attempts: {reason}"))
+            return
+        await self.wiener.clear_events(r.channel)
+        r.switched = False
+
+    def _finish(self, channel : int, result=None, error : Exception | None = None):
+        r = self._ramps.pop(channel)
+        if r.future.done():
+            return
+        if error is not None:
+            r.future.set_exception(error)
+        else:
+            logger.info(f"CH{channel}: reached {result} V")
+            r.future.set_result(result)
+        if r.callback is not None:
+            r.callback(channel, r.future)
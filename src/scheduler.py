@@ -0,0 +1,165 @@
+import asyncio, logging, math, time
+
+from pysnmp.proto.errind import RequestTimedOut
+from metrics import METRICS
+
+logger = logging.getLogger("WienerScheduler")
+
+
+class TokenBucket:
+    """
+    Caps the request rate at rate per second with bursts of up to burst requests (rate None: no limit).
+    Requests over the budget reserve a later slot and wait for it, so they go out in arrival order.
+    """
+    def __init__(self, rate : float | None, burst : int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._last = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Take a token; returns how long to wait before using it.
+        """
+        if self.rate is None:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RttEstimator:
+    """
+    Retransmission timeout from measured round trip times (RFC 6298): rto = srtt + 4 * rttvar, clamped to
+    [min_rto, max_rto] and rounded up to granularity (each distinct timeout is a separate pysnmp transport target).
+    Timeouts double the rto until the next sample.
+    """
+    def __init__(self, initial : float = 1.0, min_rto : float = 0.25, max_rto : float = 5.0, granularity : float = 0.05):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self._rto = initial
+
+    def sample(self, rtt : float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self._rto = self.srtt + 4 * self.rttvar
+
+    def backoff(self):
+        self._rto = min(self._rto * 2, self.max_rto)
+
+    @property
+    def rto(self) -> float:
+        rto = min(max(self._rto, self.min_rto), self.max_rto)
+        return math.ceil(rto / self.granularity) * self.granularity
+
+
+class RequestScheduler:
+    """
+    Shared by every AsyncWiener talking to one crate (see for_crate), so that all of them together:
+      - stay under a token-bucket request rate (rate, burst),
+      - time out and retry requests themselves, with a timeout adapted to the measured round trip time
+        instead of pysnmp's fixed timeout and retries,
+      - coalesce reads: a GET of an object that is already being read waits for that response (claim/resolve).
+    """
+    _crates = {}
+
+    def __init__(self, rate : float | None = 100.0, burst : int = 16, retries : int = 3, **rtt_options):
+        self.bucket = TokenBucket(rate, burst)
+        self.rtt = RttEstimator(**rtt_options)
+        self.retries = retries
+        self._pending = {} # oid -> Future of the raw value
+        self.requests = 0
+        self.timeouts = 0
+        self.coalesced = 0
+
+    @classmethod
+    def for_crate(cls, host : str, port : int = 161, **options) -> "RequestScheduler":
+        """
+        The scheduler of a crate, created with options on first use.
+        """
+        key = (host, port)
+        if key not in cls._crates:
+            cls._crates[key] = cls(**options)
+        return cls._crates[key]
+
+    async def send(self, session, snmp_func, auth_data, context, *var_binds, urgent : bool = False, **options):
+        """
+        Send a request over session (an SnmpSession) with rate limiting, adaptive timeout and retries.
+        urgent requests (e.g. switching everything off) are not rate limited.
+        Returns (errorIndication, errorStatus, errorIndex, varBinds) of the last attempt.
+        """
+        for attempt in range(self.retries + 1):
+            if not urgent:
+                await self.bucket.acquire()
+            timeout = self.rtt.rto
+            target = await session.target_for(timeout, retries=0)
+            self.requests += 1
+            start = time.monotonic()
+            response = await session.send(snmp_func, auth_data, context, *var_binds, target=target, **options)
+            elapsed = time.monotonic() - start
+            if METRICS.enabled:
+                METRICS.observe("wicc_phase_seconds", elapsed, phase="network")
+                if attempt:
+                    METRICS.inc("wicc_retries_total", host=session.host)
+            if not isinstance(response[0], RequestTimedOut):
+                if attempt == 0: # Karn: retransmitted requests give ambiguous round trip times
+                    self.rtt.sample(elapsed)
+                return response
+            self.timeouts += 1
+            if METRICS.enabled:
+                METRICS.inc("wicc_timeouts_total", host=session.host)
+            self.rtt.backoff()
+            logger.info(f"Request to {session.host} timed out after {timeout:.2f} s (attempt {attempt + 1}/{self.retries + 1})")
+        return response
+
+    def claim(self, oids : list[tuple]) -> tuple[list[tuple], dict]:
+        """
+        Split oids to GET into the ones the caller has to request (and resolve() afterwards) and
+        {oid: Future} of the ones another caller is already reading.
+        """
+        owned, shared = [], {}
+        loop = asyncio.get_running_loop()
+        for oid in oids:
+            future = self._pending.get(oid)
+            if future is not None and not future.done() and future.get_loop() is loop:
+                shared[oid] = future
+                self.coalesced += 1
+            else:
+                self._pending[oid] = loop.create_future()
+                owned.append(oid)
+        return owned, shared
+
+    def resolve(self, oids : list[tuple], values : list | None = None, error : BaseException | None = None):
+        """
+        Hand the raw values (or an error) of claimed oids to the callers waiting for them.
+        If the owner was cancelled (error is not an Exception), the futures are cancelled and the waiting
+        callers read the oids themselves.
+        """
+        for i, oid in enumerate(oids):
+            future = self._pending.pop(oid, None)
+            if future is None or future.done():
+                continue
+            if error is not None and not isinstance(error, Exception):
+                future.cancel()
+            elif error is not None:
+                future.set_exception(error)
+                future.exception() # retrieved by the owner, waiting callers get it too
+            else:
+                future.set_result(values[i])
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "timeouts": self.timeouts, "coalesced": self.coalesced,
+                "srtt": self.rtt.srtt, "rto": self.rtt.rto, "rate": self.bucket.rate}
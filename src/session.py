@@ -0,0 +1,76 @@
+import logging
+
+from pysnmp.hlapi.v3arch.asyncio import *
+from metrics import METRICS
+
+logger = logging.getLogger("WienerSession")
+
+
+class SnmpSession:
+    """
+    Long-lived SNMP session to a single Wiener crate.
+
+    Holds one SnmpEngine and one UDP transport target for the lifetime of the session,
+    so each request only pays for the crate round trip and not for engine/transport setup.
+    """
+    def __init__(self, host: str, port: int = 161, timeout: float = 1, retries: int = 5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.engine = None
+        self.target = None
+        self._targets = {} # (timeout, retries) -> UdpTransportTarget
+
+    @property
+    def is_open(self) -> bool:
+        return self.engine is not None
+
+    async def open(self):
+        """
+        Create the SNMP engine and transport target. Must be awaited on the event loop
+        that will be used for all subsequent requests.
+        """
+        if self.is_open:
+            return self
+        logger.debug(f"Opening SNMP session to {self.host}:{self.port}")
+        with METRICS.timer("wicc_phase_seconds", phase="engine"):
+            self.engine = SnmpEngine()
+            self.target = await UdpTransportTarget.create((self.host, self.port),
+                                                          timeout=self.timeout,
+                                                          retries=self.retries)
+        return self
+
+    def close(self):
+        if not self.is_open:
+            return
+        logger.debug(f"Closing SNMP session to {self.host}:{self.port}")
+        self.engine.close_dispatcher()
+        self.engine = None
+        self.target = None
+        self._targets = {} # (timeout, retries) -> UdpTransportTarget
+
+    async def target_for(self, timeout : float, retries : int = 0):
+        """
+        Transport target to the crate with the given timeout and retries (created once per combination).
+        """
+        if not self.is_open:
+            await self.open()
+        key = (timeout, retries)
+        if key not in self._targets:
+            with METRICS.timer("wicc_phase_seconds", phase="engine"):
+                self._targets[key] = await UdpTransportTarget.create((self.host, self.port), timeout=timeout,
+                                                                     retries=retries)
+        return self._targets[key]
+
+    async def send(self, snmp_func, auth_data, context, *var_binds, target=None, **options):
+        """
+        Send a request (snmp_func = get_cmd/set_cmd) over the open session, to target (see target_for)
+        or by default the session's target.
+        Requests are built from numeric OIDs, so responses are not looked up in a MIB (lookupMib=False).
+        Returns (errorIndication, errorStatus, errorIndex, varBinds) as pysnmp does.
+        """
+        if not self.is_open:
+            await self.open()
+        options.setdefault("lookupMib", False)
+        return await snmp_func(self.engine, auth_data, target or self.target, context, *var_binds, **options)
@@ -0,0 +1,538 @@
+import asyncio, bisect, logging, random, re, time
+
+import click
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api
+from utils import FloatOpaque, opaque_to_float, verbosity, LoggingFormat
+from oids import OidTable
+from status import OutputStatus, to_bits
+from transport import QUERIES, ORDERS, SWITCH_ORDERS, status_to_iseg
+
+logger = logging.getLogger("WienerSimulator")
+
+p_mod = api.PROTOCOL_MODULES[api.SNMP_VERSION_2C]
+
+# SNMPv2 error-status values used by the agent
+TOO_BIG, NO_ACCESS, WRONG_TYPE, WRONG_VALUE, NOT_WRITABLE = 1, 6, 7, 10, 17
+
+# objects computed by the channel model rather than stored
+MEASUREMENTS = ("outputStatus", "outputMeasurementSenseVoltage", "outputMeasurementTerminalVoltage",
+                "outputMeasurementCurrent", "outputMeasurementTemperature", "outputName", "outputSwitch")
+
+
+class SimulatedChannel:
+    """
+    One output channel: stores every writable outputTable column and models the output voltage ramp
+    (outputVoltageRiseRate / outputVoltageFallRate), a resistive load and the resulting outputStatus bits.
+    """
+    def __init__(self, index : int, name : str, config : dict, load : float, noise : float = 0.0):
+        self.index = index
+        self.name = name
+        self.values = dict(config)
+        self.load = load # ohm
+        self.noise = noise
+        self.switch = 0
+        self.events = OutputStatus(0) # latched failure bits, cleared by clearEvents
+        self._v_start = 0.0
+        self._t_start = time.monotonic()
+
+    def target(self) -> float:
+        return self.values["outputVoltage"] if self.switch == 1 and not self.events else 0.0
+
+    def voltage(self, now : float | None = None) -> float:
+        """
+        Output voltage at time now, ramping linearly from the last change towards target().
+        """
+        now = time.monotonic() if now is None else now
+        target = self.target()
+        elapsed = now - self._t_start
+        if target >= self._v_start:
+            return min(target, self._v_start + self.values["outputVoltageRiseRate"] * elapsed)
+        return max(target, self._v_start - self.values["outputVoltageFallRate"] * elapsed)
+
+    def current(self, now : float | None = None) -> float:
+        return min(self.voltage(now) / self.load, self.values["outputCurrent"])
+
+    def _retarget(self, change):
+        now = time.monotonic()
+        self._v_start = self.voltage(now)
+        self._t_start = now
+        change()
+
+    def write(self, command : str, value):
+        if command == "outputSwitch":
+            if value == 10: # clearEvents
+                self._retarget(lambda: setattr(self, "events", OutputStatus(0)))
+            elif value == 3: # setEmergencyOff: no ramp
+                self.events |= OutputStatus.outputEmergencyOff
+                self.switch, self._v_start, self._t_start = 0, 0.0, time.monotonic()
+            elif value == 2: # resetEmergencyOff
+                self._retarget(lambda: setattr(self, "events", self.events & ~OutputStatus.outputEmergencyOff))
+            elif value in (0, 1):
+                self._retarget(lambda: setattr(self, "switch", value))
+        elif command == "outputVoltage":
+            self._retarget(lambda: self.values.__setitem__(command, value))
+        else:
+            self.values[command] = value
+
+    def trip(self):
+        """
+        Simulate a current trip: the output switches off immediately and outputFailureMaxCurrent is latched.
+        """
+        self.events |= OutputStatus.outputFailureMaxCurrent
+        self.switch, self._v_start, self._t_start = 0, 0.0, time.monotonic()
+
+    def status(self, now : float | None = None) -> OutputStatus:
+        now = time.monotonic() if now is None else now
+        voltage, target = self.voltage(now), self.target()
+        status = self.events
+        if self.switch == 1:
+            status |= OutputStatus.outputOn
+        if voltage < target:
+            status |= OutputStatus.outputRampUp
+        elif voltage > target:
+            status |= OutputStatus.outputRampDown
+        if voltage / self.load >= self.values["outputCurrent"] and voltage > 0:
+            status |= OutputStatus.outputCurrentLimited
+        elif self.switch == 1 and voltage == target and not self.events:
+            status |= OutputStatus.outputConstantVoltage
+        return status
+
+    def read(self, command : str):
+        now = time.monotonic()
+        if command == "outputStatus":
+            return self.status(now)
+        if command in ("outputMeasurementSenseVoltage", "outputMeasurementTerminalVoltage"):
+            return self.voltage(now) + random.gauss(0, self.noise) if self.noise else self.voltage(now)
+        if command == "outputMeasurementCurrent":
+            return self.current(now)
+        if command == "outputMeasurementTemperature":
+            return 30
+        if command == "outputName":
+            return self.name
+        if command == "outputSwitch":
+            return self.switch
+        return self.values[command]
+
+
+class CrateSimulator:
+    """
+    In-memory model of a Wiener crate with one LV module (ma0, channels u0..) and one HV module
+    (ma1, channels u100..), addressed through the numeric OIDs of the WIENER-CRATE-MIB.
+    """
+    modules = {
+        "LV": {"module": "ma0", "first": 0, "description": "WIENER,MPOD LV simulator,{n},0000001,1.0",
+               "load": 1.0, "voltage": 5.0, "current": 1.0, "rate": 10.0},
+        "HV": {"module": "ma1", "first": 100, "description": "iseg,EHS simulator,{n},0000002,1.0",
+               "load": 10e6, "voltage": 0.0, "current": 1e-4, "rate": 10.0},
+    }
+
+    def __init__(self, oids : OidTable, channels : int = 8, noise : float = 0.0):
+        self.oids = oids
+        self.main_switch = 1
+        self.channels = {}
+        self.descriptions = {}
+        writable = [name for name, obj in oids.objects.items()
+                    if obj["index"] == "outputIndex" and obj["access"] == "read-write"
+                    and obj["syntax"] in ("float", "int", "enum") and name not in MEASUREMENTS]
+        for device, module in self.modules.items():
+            self.descriptions[oids.index("moduleDescription", module["module"])] = module["description"].format(n=channels)
+            for ch in range(channels):
+                config = {name: 0.0 if oids.syntax(name) == "float" else 0 for name in writable}
+                config.update(outputVoltage=module["voltage"], outputCurrent=module["current"],
+                              outputVoltageRiseRate=module["rate"], outputVoltageFallRate=module["rate"],
+                              outputGroup=1)
+                u = module["first"] + ch
+                self.channels[u + 1] = SimulatedChannel(u + 1, f"U{u}", config, module["load"], noise)
+        self._hv = {i for i in self.channels if i > 100}
+        self._readable = sorted(self._instances())
+
+    def _instances(self):
+        columns = [name for name, obj in self.oids.objects.items() if obj["index"] == "outputIndex"
+                   and obj["access"] not in ("not-accessible", None) and obj["syntax"] in ("float", "int", "enum", "bits", "string")
+                   and (name in MEASUREMENTS or name in next(iter(self.channels.values())).values)]
+        for name in columns:
+            for index in self.channels:
+                yield self.oids.oid(name, index)
+        for index in self.descriptions:
+            yield self.oids.oid("moduleDescription", index)
+        yield self.oids.oid("sysMainSwitch")
+
+    def _encode(self, command : str, value):
+        syntax = self.oids.syntax(command)
+        if syntax == "float":
+            return FloatOpaque(value)
+        if syntax == "bits":
+            return p_mod.OctetString(to_bits(value))
+        if syntax == "string":
+            return p_mod.OctetString(value)
+        return p_mod.Integer32(value)
+
+    def get(self, oid : tuple):
+        """
+        Value of one instance OID, or NoSuchObject/NoSuchInstance.
+        """
+        try:
+            command, index = self.oids.symbol(oid)
+        except KeyError:
+            return p_mod.NoSuchObject()
+        if command == "sysMainSwitch" and index == 0:
+            return p_mod.Integer32(self.main_switch)
+        if command == "moduleDescription" and index in self.descriptions:
+            return p_mod.OctetString(self.descriptions[index])
+        if command == "groupsSwitch":
+            return p_mod.Integer32(-1) # not defined for reads
+        channel = self.channels.get(index)
+        if self.oids[command]["index"] != "outputIndex" or channel is None:
+            return p_mod.NoSuchInstance()
+        try:
+            return self._encode(command, channel.read(command))
+        except KeyError:
+            return p_mod.NoSuchObject()
+
+    def next(self, oid : tuple):
+        """
+        (oid, value) of the first readable instance after oid, for GETNEXT/GETBULK.
+        """
+        i = bisect.bisect_right(self._readable, tuple(oid))
+        if i == len(self._readable):
+            return oid, p_mod.EndOfMibView()
+        found = self._readable[i]
+        return found, self.get(found)
+
+    def check_set(self, oid : tuple, value) -> int:
+        """
+        Validate one SET varbind. Returns 0 or an SNMP error-status.
+        """
+        try:
+            command, index = self.oids.symbol(oid)
+        except KeyError:
+            return NOT_WRITABLE
+        obj = self.oids[command]
+        if obj["access"] != "read-write":
+            return NOT_WRITABLE
+        if command == "sysMainSwitch":
+            return 0 if index == 0 else NOT_WRITABLE
+        if command == "groupsSwitch":
+            return 0
+        if obj["index"] != "outputIndex" or index not in self.channels:
+            return NOT_WRITABLE
+        if command != "outputSwitch" and command not in self.channels[index].values:
+            return NOT_WRITABLE
+        is_float = isinstance(value, p_mod.Opaque)
+        if is_float != (obj["syntax"] == "float"):
+            return WRONG_TYPE
+        if command == "outputVoltage" and opaque_to_float(value) < 0:
+            return WRONG_VALUE
+        return 0
+
+    def switch_main(self, value : int):
+        self.main_switch = value
+        if not value:
+            for channel in self.channels.values():
+                channel.write("outputSwitch", 0)
+
+    def set(self, oid : tuple, value):
+        command, index = self.oids.symbol(oid)
+        decoded = opaque_to_float(value) if isinstance(value, p_mod.Opaque) else int(value)
+        if command == "sysMainSwitch":
+            self.switch_main(decoded)
+        elif command == "groupsSwitch":
+            # 0: all channels, 0x40: HV only, 0x80: LV only, otherwise channels with that outputGroup
+            for i, channel in self.channels.items():
+                if (index == 0 or (index == 0x40 and i in self._hv) or (index == 0x80 and i not in self._hv)
+                        or channel.values["outputGroup"] == index):
+                    channel.write("outputSwitch", decoded)
+        else:
+            self.channels[index].write(command, decoded)
+        return self.get(oid) if command not in ("groupsSwitch",) else value
+
+
+class SimulatorProtocol(asyncio.DatagramProtocol):
+    """
+    SNMPv2c agent for a CrateSimulator with configurable latency, jitter and packet loss.
+    Reads are allowed for the public/private/admin/guru communities, writes only for guru.
+    """
+    read_communities = (b"public", b"private", b"admin", b"guru")
+    write_communities = (b"guru",)
+
+    def __init__(self, crate : CrateSimulator, latency : float = 0.0, jitter : float = 0.0, loss : float = 0.0,
+                 max_size : int = 1472):
+        self.crate = crate
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.max_size = max_size
+        self.transport = None
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        if self.loss and random.random() < self.loss:
+            logger.debug(f"Dropping request from {addr}")
+            return
+        try:
+            response = self.handle(data)
+        except Exception as e:
+            logger.warning(f"Could not handle request from {addr}: {e}")
+            return
+        if response is None:
+            return
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, response, addr)
+        else:
+            self.transport.sendto(response, addr)
+
+    def handle(self, data : bytes) -> bytes | None:
+        msg, _ = decoder.decode(data, asn1Spec=p_mod.Message())
+        community = bytes(p_mod.apiMessage.get_community(msg))
+        if community not in self.read_communities:
+            return None
+        pdu = p_mod.apiMessage.get_pdu(msg)
+        rsp_msg = p_mod.apiMessage.get_response(msg)
+        rsp_pdu = p_mod.apiMessage.get_pdu(rsp_msg)
+        var_binds = [(tuple(oid), value) for oid, value in p_mod.apiPDU.get_varbinds(pdu)]
+        error_status = error_index = 0
+
+        if pdu.isSameTypeWith(p_mod.GetRequestPDU()):
+            rsp_binds = [(oid, self.crate.get(oid)) for oid, _ in var_binds]
+        elif pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+            rsp_binds = [self.crate.next(oid) for oid, _ in var_binds]
+        elif pdu.isSameTypeWith(p_mod.GetBulkRequestPDU()):
+            rsp_binds = self._bulk(pdu, var_binds)
+        elif pdu.isSameTypeWith(p_mod.SetRequestPDU()):
+            rsp_binds = var_binds
+            if community not in self.write_communities:
+                error_status, error_index = NO_ACCESS, 1
+            else:
+                for i, (oid, value) in enumerate(var_binds): # all-or-nothing: validate before applying
+                    error_status = self.crate.check_set(oid, value)
+                    if error_status:
+                        error_index = i + 1
+                        break
+                else:
+                    rsp_binds = [(oid, self.crate.set(oid, value)) for oid, value in var_binds]
+        else:
+            return None
+
+        p_mod.apiPDU.set_error_status(rsp_pdu, error_status)
+        p_mod.apiPDU.set_error_index(rsp_pdu, error_index)
+        p_mod.apiPDU.set_varbinds(rsp_pdu, rsp_binds)
+        response = encoder.encode(rsp_msg)
+        if len(response) > self.max_size:
+            p_mod.apiPDU.set_error_status(rsp_pdu, TOO_BIG)
+            p_mod.apiPDU.set_error_index(rsp_pdu, 0)
+            p_mod.apiPDU.set_varbinds(rsp_pdu, var_binds if not pdu.isSameTypeWith(p_mod.GetRequestPDU())
+                                      else [(oid, p_mod.null) for oid, _ in var_binds])
+            response = encoder.encode(rsp_msg)
+        return response
+
+    def _bulk(self, pdu, var_binds : list) -> list:
+        non_repeaters = int(p_mod.apiBulkPDU.get_non_repeaters(pdu))
+        max_repetitions = int(p_mod.apiBulkPDU.get_max_repetitions(pdu))
+        rsp_binds = [self.crate.next(oid) for oid, _ in var_binds[:non_repeaters]]
+        cursor = [oid for oid, _ in var_binds[non_repeaters:]]
+        budget = self.max_size - 64 # GETBULK responses are truncated rather than answered with tooBig
+        for repetition in range(max_repetitions):
+            if not cursor:
+                break
+            row = [self.crate.next(oid) for oid in cursor]
+            size = sum(len(encoder.encode(p_mod.ObjectIdentifier(oid))) + len(encoder.encode(value)) + 4
+                       for oid, value in row)
+            if size > budget and repetition: # the first row always goes out, as tooBig if it is too large
+                break
+            budget -= size
+            rsp_binds.extend(row)
+            cursor = [oid for oid, _ in row]
+            if all(isinstance(value, p_mod.EndOfMibView) for _, value in row):
+                break
+        return rsp_binds
+
+
+class ScpiProtocol(asyncio.Protocol):
+    """
+    Stand-in for the SCPI service of a CC24 crate controller (TCP port 10001) on a CrateSimulator: the subset of
+    iseg SCPI used by transport.ScpiTransport. Channel c of slot s, (#s@c), is outputIndex u{100 * s + c}.
+    As on the device, a line with an error gets no answer, and a line without queries an empty one.
+    """
+    command = re.compile(r"^(?P<name>[*:A-Za-z]+\??)\s*(?P<param>[^,(]*?)\s*,?\s*(\((?P<address>[^)]*)\))?$")
+    queries = {query: (command, unit) for command, (query, unit) in reversed(QUERIES.items())}
+    orders = {order: command for command, order in ORDERS.items()}
+    switches = {order.split(" ", 1)[1]: value for value, order in SWITCH_ORDERS.items() if order.startswith(":VOLT ")}
+
+    def __init__(self, crate : CrateSimulator, latency : float = 0.0):
+        self.crate = crate
+        self.latency = latency
+        self.transport = None
+        self.buffer = b""
+        self.lines = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while b"\r\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\r\n", 1)
+            self.lines += 1
+            try:
+                answer = self.handle(line.decode())
+            except Exception as e:
+                logger.info(f"Rejected SCPI line {line!r}: {e}")
+                continue
+            response = answer.encode() + b"\r\n"
+            if self.latency > 0:
+                asyncio.get_running_loop().call_later(self.latency, self.transport.write, response)
+            else:
+                self.transport.write(response)
+
+    def handle(self, line : str) -> str:
+        answers = []
+        for text in line.split(";"):
+            if not text.strip():
+                continue
+            match = self.command.match(text.strip())
+            if match is None:
+                raise ValueError(f"Syntax error: {text}")
+            name = ":" + match["name"].upper().lstrip(":") if match["name"][0] != "*" else match["name"].upper()
+            slot, channels = self._address(match["address"])
+            if name.endswith("?"):
+                answers.append(self.query(name, slot, channels))
+            else:
+                self.order(name, match["param"].upper(), slot, channels)
+        return ";".join(answers)
+
+    def _address(self, address : str | None) -> tuple[int, list[int]]:
+        """
+        "#1@0-2,5" -> (1, [0, 1, 2, 5])
+        """
+        if not address:
+            return 0, []
+        slot, _, channels = address.partition("@")
+        result = []
+        for part in filter(None, channels.split(",")):
+            first, _, last = part.partition("-")
+            result += list(range(int(first), int(last or first) + 1))
+        return int(slot.lstrip("#") or 0), result
+
+    def _channels(self, slot : int, channels : list[int]) -> list[SimulatedChannel]:
+        if not channels:
+            raise ValueError("No channel given")
+        return [self.crate.channels[100 * slot + channel + 1] for channel in channels]
+
+    def query(self, name : str, slot : int, channels : list[int]) -> str:
+        if name == "*IDN?":
+            return "iseg Spezialelektronik GmbH,CC24 simulator,0000000,iCS 2.8.0"
+        if name == "*OPC?":
+            return "1"
+        if name == ":CRATE:POWER?":
+            return str(self.crate.main_switch)
+        if name == ":READ:MOD:LIST?":
+            return ",".join(str(module["first"] // 100) for module in self.crate.modules.values())
+        if name == ":READ:MOD:CHAN?":
+            return str(sum(1 for index in self.crate.channels if (index - 1) // 100 == slot))
+        if name == ":READ:MOD:IDENT?":
+            return self.crate.descriptions[self.crate.oids.index("moduleDescription", f"ma{slot}")]
+        command, unit = self.queries[name]
+        values = []
+        for channel in self._channels(slot, channels):
+            value = channel.read(command)
+            if unit == "status":
+                values.append(str(status_to_iseg(value)))
+            elif unit is None:
+                values.append(str(int(value)))
+            else:
+                values.append(f"{value:.5E}{unit}")
+        return ",".join(values)
+
+    def order(self, name : str, param : str, slot : int, channels : list[int]):
+        if name == ":CRATE:POWER":
+            self.crate.switch_main(int(param))
+            return
+        targets = self._channels(slot, channels)
+        if name == ":VOLT" and param in self.switches:
+            command, value = "outputSwitch", self.switches[param]
+        elif name == ":EVENT" and param == "CLEAR":
+            command, value = "outputSwitch", 10
+        else:
+            command, value = self.orders[name], float(param.rstrip("AV/S%"))
+            if command == "outputVoltage" and value < 0:
+                raise ValueError(f"Negative voltage {value}")
+        for channel in targets:
+            channel.write(command, value)
+
+
+async def start_scpi(host : str = "127.0.0.1", port : int = 10001, crate : CrateSimulator | None = None,
+                     oids : OidTable | None = None, channels : int = 8, latency : float = 0.0, noise : float = 0.0):
+    """
+    Start the SCPI stand-in on the running event loop, serving crate (by default a new CrateSimulator).
+    Returns (server, crate); server.close() stops it.
+    """
+    if crate is None:
+        oids = oids or OidTable.load("/usr/share/snmp/mibs", "WIENER-CRATE-MIB")
+        crate = CrateSimulator(oids, channels=channels, noise=noise)
+    server = await asyncio.get_running_loop().create_server(lambda: ScpiProtocol(crate, latency=latency), host, port)
+    return server, crate
+
+
+async def start(host : str = "127.0.0.1", port : int = 1161, oids : OidTable | None = None, channels : int = 8,
+                latency : float = 0.0, jitter : float = 0.0, loss : float = 0.0, noise : float = 0.0,
+                max_size : int = 1472):
+    """
+    Start a simulated crate on the running event loop. Returns (transport, protocol);
+    protocol.crate is the CrateSimulator, transport.close() stops it.
+    """
+    oids = oids or OidTable.load("/usr/share/snmp/mibs", "WIENER-CRATE-MIB")
+    crate = CrateSimulator(oids, channels=channels, noise=noise)
+    return await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: SimulatorProtocol(crate, latency=latency, jitter=jitter, loss=loss, max_size=max_size),
+        local_addr=(host, port))
+
+
+@click.command()
+@click.option('-H', "--host", default="127.0.0.1", help="Address to listen on. Default: 127.0.0.1")
+@click.option('-p', "--port", default=1161, type=click.INT, help="UDP port to listen on. Default: 1161")
+@click.option('-M', "--mib-path", default="/usr/share/snmp/mibs", help="Path to MIB files. Default: /usr/share/snmp/mibs")
+@click.option('-m', "--mib-name", default="WIENER-CRATE-MIB", help="Name of Wiener Crate MIB file. Default: WIENER-CRATE-MIB")
+@click.option("--channels", default=8, type=click.INT, help="Channels per module. Default: 8")
+@click.option("--latency", default=0.0, type=click.FLOAT, help="Response delay in s. Default: 0")
+@click.option("--jitter", default=0.0, type=click.FLOAT, help="Extra uniformly distributed delay in s. Default: 0")
+@click.option("--loss", default=0.0, type=click.FLOAT, help="Probability of dropping a request. Default: 0")
+@click.option("--noise", default=0.0, type=click.FLOAT, help="Standard deviation of voltage measurements in V. Default: 0")
+@click.option("--scpi-port", default=None, type=click.INT, help="Also serve the crate over SCPI on this TCP port (e.g. 10001)")
+@click.option('-v', "--verbose", count=True, help="Verbose output (-v = INFO, -vv = DEBUG)")
+def main(host, port, mib_path, mib_name, channels, latency, jitter, loss, noise, scpi_port, verbose):
+    """
+    Run a simulated Wiener crate (SNMPv2c agent, optionally also SCPI over TCP) for testing without hardware.
+    """
+    logger.setLevel(verbosity(verbose))
+    ch = logging.StreamHandler()
+    ch.setFormatter(LoggingFormat())
+    logger.addHandler(ch)
+
+    async def serve():
+        transport, protocol = await start(host, port, OidTable.load(mib_path, mib_name), channels=channels,
+                                          latency=latency, jitter=jitter, loss=loss, noise=noise)
+        logger.warning(f"Simulated Wiener crate listening on {host}:{port}")
+        server = None
+        if scpi_port is not None:
+            server, _ = await start_scpi(host, scpi_port, crate=protocol.crate, latency=latency)
+            logger.warning(f"Simulated SCPI service listening on {host}:{scpi_port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            transport.close()
+            if server is not None:
+                server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from enum import IntFlag
+
+import numpy as np
+
+
+class OutputStatus(IntFlag):
+    """
+    outputStatus of WIENER-CRATE-MIB as an integer bitmask: MIB bit n is 1 << n.
+    """
+    outputOn = 1 << 0
+    outputInhibit = 1 << 1
+    outputFailureMinSenseVoltage = 1 << 2
+    outputFailureMaxSenseVoltage = 1 << 3
+    outputFailureMaxTerminalVoltage = 1 << 4
+    outputFailureMaxCurrent = 1 << 5
+    outputFailureMaxTemperature = 1 << 6
+    outputFailureMaxPower = 1 << 7
+    reserved = 1 << 8
+    outputFailureTimeout = 1 << 9
+    outputCurrentLimited = 1 << 10
+    outputRampUp = 1 << 11
+    outputRampDown = 1 << 12
+    outputEnableKill = 1 << 13
+    outputEmergencyOff = 1 << 14
+    outputAdjusting = 1 << 15
+    outputConstantVoltage = 1 << 16
+    outputLowCurrentRange = 1 << 17
+    outputCurrentBoundsExceeded = 1 << 18
+    outputFailureCurrentLimit = 1 << 19
+    outputCurrentIncreasing = 1 << 20
+    outputCurrentDecreasing = 1 << 21
+    outputConstantPower = 1 << 22
+    outputVoltageRampSpeedLimited = 1 << 23
+    outputVoltageBottomReached = 1 << 24
+    outputInitCrcCheckBad = 1 << 25
+
+
+# precomputed masks for the checks on the interlock path
+TRIPPED = (OutputStatus.outputFailureMinSenseVoltage | OutputStatus.outputFailureMaxSenseVoltage
+           | OutputStatus.outputFailureMaxTerminalVoltage | OutputStatus.outputFailureMaxCurrent
+           | OutputStatus.outputFailureMaxTemperature | OutputStatus.outputFailureMaxPower
+           | OutputStatus.outputFailureTimeout | OutputStatus.outputEmergencyOff
+           | OutputStatus.outputFailureCurrentLimit)
+RAMPING = OutputStatus.outputRampUp | OutputStatus.outputRampDown
+
+FLAGS = tuple(OutputStatus) # column order of status_matrix(), i.e. MIB bit order
+N_BITS = len(FLAGS)
+_N_BYTES = (N_BITS + 7) // 8
+
+# MIB BITS put bit 0 in the most significant bit of the first octet
+_REVERSED_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def from_bits(raw : bytes) -> OutputStatus:
+    """
+    Decode one raw outputStatus BITS value.
+    """
+    return OutputStatus(int.from_bytes(raw.translate(_REVERSED_BITS), "little") & ((1 << N_BITS) - 1))
+
+
+def to_bits(status : int) -> bytes:
+    """
+    Encode a status bitmask as the BITS octets the crate sends.
+    """
+    return int(status).to_bytes(_N_BYTES, "little").translate(_REVERSED_BITS)
+
+
+def _octets(raws) -> np.ndarray:
+    """
+    Stack raw BITS values into a (n, _N_BYTES) uint8 array, zero padded (the agent may drop trailing octets).
+    """
+    buffer = b"".join(bytes(raw or b"")[:_N_BYTES].ljust(_N_BYTES, b"\0") for raw in raws)
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(-1, _N_BYTES)
+
+
+def status_matrix(raws) -> np.ndarray:
+    """
+    Decode many raw outputStatus values (e.g. the outputStatus column of a snapshot) at once into a
+    bool matrix of shape (channel, flag); column j is FLAGS[j], i.e. MIB bit j. Missing values (None) decode as 0.
+    """
+    return np.unpackbits(_octets(raws), axis=1, bitorder="big")[:, :N_BITS].astype(bool)
+
+
+def status_masks(raws) -> np.ndarray:
+    """
+    Decode many raw outputStatus values into an array of integer bitmasks (MIB bit n is 1 << n).
+    """
+    octets = np.frombuffer(_octets(raws).tobytes().translate(_REVERSED_BITS), dtype=np.uint8)
+    octets = octets.reshape(-1, _N_BYTES).astype(np.int64)
+    return (octets << (8 * np.arange(_N_BYTES))).sum(axis=1)
+
+
+def any_set(raws, mask : int = TRIPPED) -> bool:
+    """
+    True if any of the raw outputStatus values has one of the bits of mask set (by default: any channel tripped).
+    """
+    return bool((status_masks(raws) & int(mask)).any())
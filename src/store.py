@@ -0,0 +1,445 @@
+"""
+Append-only long-term store of channel measurements for campaigns of months, e.g.
+    store = Store("campaign.wstore", writable=True)
+    store.append(time.time(), "10.179.59.29", 1, [1, 2], current=[1e-6, 2e-6])
+    view = Store("campaign.wstore").range(start, end) # {field: read-only array}, no copy
+    hourly = Store("campaign.wstore").downsample("current", 3600)
+A store is a directory with one raw little-endian file per field (FIELDS) and meta.json. Records are fixed size
+and appended in time order. Reads memory-map the files, so a time range is found by binary search on the time
+column and only the pages of the records in it are read from disk.
+"""
+
+import asyncio, json, logging, math, os, time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from status import status_masks
+
+logger = logging.getLogger("WienerStore")
+
+VERSION = 1
+FIELDS = (
+    ("time", "<f8"),          # unix time in s
+    ("crate", "<u2"),         # index into meta["crates"] (host names)
+    ("slot", "u1"),           # module slot (HV 1, LV 0)
+    ("channel", "u1"),        # channel 1..
+    ("voltage", "<f4"),       # outputMeasurementTerminalVoltage in V
+    ("sense_voltage", "<f4"), # outputMeasurementSenseVoltage in V
+    ("current", "<f4"),       # outputMeasurementCurrent in A
+    ("temperature", "<f4"),   # outputMeasurementTemperature in degC
+    ("status", "<u4"),        # outputStatus bitmask (see status.OutputStatus)
+)
+DTYPES = {name: np.dtype(dtype) for name, dtype in FIELDS}
+MEASUREMENTS = ("voltage", "sense_voltage", "current", "temperature")
+# outputTable objects stored, and their fields
+QUANTITIES = {
+    "outputMeasurementTerminalVoltage": "voltage",
+    "outputMeasurementSenseVoltage": "sense_voltage",
+    "outputMeasurementCurrent": "current",
+    "outputMeasurementTemperature": "temperature",
+    "outputStatus": "status",
+}
+NO_STATUS = 0xFFFFFFFF # status of records whose outputStatus was not read (measurements are NaN instead)
+
+
+class Store:
+    """
+    Append-only columnar store of per-channel records (see FIELDS) in the directory path.
+    Opened writable, the directory is created if needed and a record cut short by a crash is dropped.
+    Readers in other processes see new records after refresh().
+    """
+    def __init__(self, path : str | Path, writable : bool = False):
+        self.path = Path(path)
+        self.writable = writable
+        if writable:
+            self.path.mkdir(parents=True, exist_ok=True)
+        meta_file = self.path / "meta.json"
+        if meta_file.exists():
+            with open(meta_file) as f:
+                self.meta = json.load(f)
+            if self.meta.get("version") != VERSION:
+                raise ValueError(f"Unsupported store version {self.meta.get('version')} in {path} (expected {VERSION})")
+        elif writable:
+            self.meta = {"version": VERSION, "fields": [list(field) for field in FIELDS], "crates": [], "sorted": True}
+            self._write_meta()
+        else:
+            raise FileNotFoundError(f"{path} is not a store (no meta.json)")
+        self._crates = {host: i for i, host in enumerate(self.meta["crates"])}
+        self._maps = {}
+        self._length = self._count()
+        self._files = {}
+        if writable:
+            for name, dtype in DTYPES.items(): # drop the tail of an interrupted append
+                with open(self._file(name), "ab") as f:
+                    f.truncate(self._length * dtype.itemsize)
+            self._files = {name: open(self._file(name), "ab") for name in DTYPES}
+            self._last = float(self.columns()["time"][-1]) if self._length else -math.inf
+
+    def _file(self, name : str) -> Path:
+        return self.path / f"{name}.bin"
+
+    def _count(self) -> int:
+        """
+        Complete records on disk: time is written last, so every field of the first n records is there.
+        """
+        sizes = [os.path.getsize(self._file(name)) // dtype.itemsize if self._file(name).exists() else 0
+                 for name, dtype in DTYPES.items()]
+        return min(sizes)
+
+    def _write_meta(self):
+        tmp = self.path / f"meta.json.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.path / "meta.json")
+
+    def __len__(self) -> int:
+        return self._length
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def crate_id(self, host : str) -> int:
+        if host not in self._crates:
+            if not self.writable:
+                raise KeyError(f"No records of crate {host} in {self.path}")
+            self._crates[host] = len(self.meta["crates"])
+            self.meta["crates"].append(host)
+            self._write_meta()
+        return self._crates[host]
+
+    def append(self, t : float | np.ndarray, host : str, slot : int, channels, **fields) -> int:
+        """
+        Append one record per element of channels (fields broadcast against them), e.g.
+            append(time.time(), "10.179.59.29", 1, [1, 2, 3], current=currents, status=masks)
+        Fields not given are NaN (status: NO_STATUS). Returns the number of records appended.
+        """
+        if not self.writable:
+            raise ValueError(f"{self.path} was opened read-only")
+        unknown = set(fields) - set(MEASUREMENTS) - {"status"}
+        if unknown:
+            raise ValueError(f"Unknown store fields {', '.join(sorted(unknown))}")
+        channels = np.atleast_1d(np.asarray(channels))
+        n = len(channels)
+        if n == 0:
+            return 0
+        columns = {"time": np.broadcast_to(np.asarray(t, dtype=np.float64), n),
+                   "crate": np.full(n, self.crate_id(host)),
+                   "slot": np.full(n, slot),
+                   "channel": channels}
+        for name in MEASUREMENTS:
+            columns[name] = np.broadcast_to(np.asarray(fields.get(name, np.nan), dtype=np.float64), n)
+        columns["status"] = np.broadcast_to(np.asarray(fields.get("status", NO_STATUS), dtype=np.int64), n)
+        times = columns["time"]
+        if self.meta["sorted"] and (times[0] < self._last or (n > 1 and np.any(np.diff(times) < 0))):
+            logger.warning(f"Records out of time order in {self.path}: range queries fall back to a full scan")
+            self.meta["sorted"] = False
+            self._write_meta()
+        for name, dtype in DTYPES.items():
+            if name != "time":
+                self._files[name].write(columns[name].astype(dtype).tobytes())
+                self._files[name].flush()
+        self._files["time"].write(times.astype(DTYPES["time"]).tobytes()) # last: completes the records
+        self._files["time"].flush()
+        self._last = max(self._last, float(times.max()))
+        self._length += n
+        self._maps = {}
+        return n
+
+    def append_samples(self, host : str, slot : int, channels : list[int], quantities : list[str],
+                       times : np.ndarray, data : np.ndarray) -> int:
+        """
+        Append telemetry samples: times (n,) and data (n, channel, quantity) as collected by telemetry.Telemetry.
+        Quantities the store does not keep are ignored.
+        """
+        if len(times) == 0:
+            return 0
+        fields = {QUANTITIES[q]: data[:, :, j].ravel() for j, q in enumerate(quantities) if q in QUANTITIES}
+        if "status" in fields:
+            status = fields["status"]
+            fields["status"] = np.where(np.isnan(status), NO_STATUS, np.nan_to_num(status)).astype(np.int64)
+        return self.append(np.repeat(times, len(channels)), host, slot, np.tile(channels, len(times)), **fields)
+
+    def record(self, host : str, slot : int, t : float, values : dict) -> int:
+        """
+        Append the measurements among read results {(command, channel): decoded value} (AsyncWiener.read_many),
+        one record per channel. Returns the number of records appended.
+        """
+        rows = {}
+        for (command, channel), value in values.items():
+            field = QUANTITIES.get(command)
+            if field is not None and isinstance(channel, int) and value is not None:
+                rows.setdefault(channel, {})[field] = value
+        if not rows:
+            return 0
+        fields = {field: [row.get(field, np.nan) for row in rows.values()]
+                  for field in MEASUREMENTS if any(field in row for row in rows.values())}
+        if any("status" in row for row in rows.values()):
+            raws = [row.get("status") for row in rows.values()]
+            fields["status"] = np.where([raw is None for raw in raws], NO_STATUS, status_masks(raws))
+        return self.append(t, host, slot, list(rows), **fields)
+
+    def record_snapshot(self, host : str, slot : int, t : float, snap : dict) -> int:
+        """
+        Append the measurement columns of an AsyncWiener.snapshot().
+        """
+        channels = snap["channel"].tolist()
+        return self.record(host, slot, t, {(column, ch): snap[column][i] for column in snap if column in QUANTITIES
+                                           for i, ch in enumerate(channels)})
+
+    def refresh(self) -> int:
+        """
+        Pick up records appended since the store was opened (by another process). Returns the record count.
+        """
+        length = self._count()
+        if length != self._length:
+            self._length = length
+            self._maps = {}
+        return length
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        Every field as a read-only memory-mapped array of len(self) records.
+        """
+        if not self._maps:
+            for name, dtype in DTYPES.items():
+                if self._length:
+                    self._maps[name] = np.memmap(self._file(name), dtype=dtype, mode="r", shape=(self._length,))
+                else:
+                    self._maps[name] = np.empty(0, dtype=dtype)
+        return self._maps
+
+    def _bounds(self, start : float | None, end : float | None) -> tuple[int, int]:
+        times = self.columns()["time"]
+        first = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        last = len(times) if end is None else int(np.searchsorted(times, end, side="left"))
+        return first, last
+
+    def range(self, start : float | None = None, end : float | None = None) -> dict[str, np.ndarray]:
+        """
+        Records with start <= time < end as {field: array}. The arrays are views into the memory-mapped files
+        (no copy, pages are read as they are touched) unless records were appended out of time order.
+        """
+        columns = self.columns()
+        if not self.meta["sorted"]:
+            times = columns["time"]
+            mask = np.ones(len(times), dtype=bool)
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times < end
+            return {name: column[mask] for name, column in columns.items()}
+        first, last = self._bounds(start, end)
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def series(self, view : dict[str, np.ndarray] | None = None, chunk : int = 1 << 20) -> list[tuple[str, int, int]]:
+        """
+        (host, slot, channel) of every channel with records (in view, by default in the whole store), sorted.
+        """
+        view = self.columns() if view is None else view
+        keys = np.empty(0, dtype=np.int64)
+        for i in range(0, len(view["time"]), chunk):
+            keys = np.union1d(keys, _keys(view["crate"][i:i + chunk], view["slot"][i:i + chunk],
+                                          view["channel"][i:i + chunk]))
+        return [(self.meta["crates"][key >> 16], (key >> 8) & 0xFF, key & 0xFF) for key in keys.tolist()]
+
+    def downsample(self, field : str, interval : float, start : float | None = None, end : float | None = None,
+                   chunk : int = 1 << 20) -> dict:
+        """
+        min/max/mean/count of a measurement per channel and interval seconds (from start, or the first record),
+        computed chunk records at a time so memory does not grow with the time range. Returns
+        {"time": (bins,) interval starts, "series": [(host, slot, channel)], "min"/"max"/"mean": (series, bins)
+        with NaN for empty intervals, "count": (series, bins)}; NaN measurements are not counted.
+        """
+        if field not in MEASUREMENTS:
+            raise ValueError(f"Can only downsample {', '.join(MEASUREMENTS)}, not {field}")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        view = self.range(start, end)
+        times = view["time"]
+        if not len(times):
+            return {"time": np.empty(0), "series": [], "min": np.empty((0, 0)), "max": np.empty((0, 0)),
+                    "mean": np.empty((0, 0)), "count": np.empty((0, 0), dtype=np.int64)}
+        origin = (float(times[0]) if self.meta["sorted"] else float(times.min())) if start is None else start
+        if end is None:
+            n_bins = int(((float(times[-1]) if self.meta["sorted"] else float(times.max())) - origin) // interval) + 1
+        else:
+            n_bins = max(1, math.ceil((end - origin) / interval))
+        series = self.series(view, chunk)
+        keys = np.array([_key(self._crates[host], slot, ch) for host, slot, ch in series]) # sorted like series
+        mins = np.full((len(series), n_bins), np.inf)
+        maxs = np.full((len(series), n_bins), -np.inf)
+        sums = np.zeros((len(series), n_bins))
+        counts = np.zeros((len(series), n_bins), dtype=np.int64)
+        for i in range(0, len(times), chunk):
+            values = np.asarray(view[field][i:i + chunk], dtype=np.float64)
+            valid = ~np.isnan(values)
+            rows = np.searchsorted(keys, _keys(view["crate"][i:i + chunk], view["slot"][i:i + chunk],
+                                               view["channel"][i:i + chunk]))[valid]
+            bins = ((np.asarray(times[i:i + chunk])[valid] - origin) // interval).astype(np.int64)
+            values = values[valid]
+            if not len(values):
+                continue
+            # group by (series, bin): sort once, then reduce each run
+            cells = rows * n_bins + bins
+            sort = np.argsort(cells, kind="stable")
+            cells, values = cells[sort], values[sort]
+            runs = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            r, b = np.divmod(cells[runs], n_bins)
+            mins[r, b] = np.minimum(mins[r, b], np.minimum.reduceat(values, runs))
+            maxs[r, b] = np.maximum(maxs[r, b], np.maximum.reduceat(values, runs))
+            sums[r, b] += np.add.reduceat(values, runs)
+            counts[r, b] += np.diff(np.r_[runs, len(values)])
+        empty = counts == 0
+        mins[empty] = maxs[empty] = np.nan
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(empty, np.nan, sums / counts)
+        return {"time": origin + interval * np.arange(n_bins), "series": series,
+                "min": mins, "max": maxs, "mean": means, "count": counts}
+
+
+def _key(crate, slot, channel):
+    return (crate << 16) | (slot << 8) | channel
+
+
+def _keys(crate : np.ndarray, slot : np.ndarray, channel : np.ndarray) -> np.ndarray:
+    return _key(np.asarray(crate, dtype=np.int64), np.asarray(slot, dtype=np.int64), np.asarray(channel, dtype=np.int64))
+
+
+class Recorder:
+    """
+    Records AsyncWiener read results into a Store without blocking the event loop: record() and
+    record_snapshot() only buffer, and the buffer is appended in a worker thread at most every interval
+    seconds (and on flush(), e.g. when the AsyncWiener closes), in the order it was recorded.
+    """
+    def __init__(self, store : Store, interval : float = 1.0):
+        self.store = store
+        self.interval = interval
+        self._pending = [] # (Store method, arguments)
+        self._task = None # scheduled flush
+        self._lock = None # one worker thread writes at a time
+        self._loop = None # of the lock
+
+    def record(self, host : str, slot : int, t : float, values : dict):
+        self._pending.append((self.store.record, (host, slot, t, dict(values))))
+        self._schedule()
+
+    def record_snapshot(self, host : str, slot : int, t : float, snap : dict):
+        self._pending.append((self.store.record_snapshot, (host, slot, t, {k: v.copy() for k, v in snap.items()})))
+        self._schedule()
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Append everything recorded so far.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                await loop.run_in_executor(None, self._write, batch)
+
+    def _write(self, batch : list):
+        for method, args in batch:
+            try:
+                method(*args)
+            except Exception as e:
+                logger.error(f"Recording into {self.store.path} failed: {e}")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+class StoreSink:
+    """
+    Telemetry sink (see telemetry.open_sink) appending samples to a Store.
+    """
+    def __init__(self, path : str, channels : list[int], quantities : list[str], host : str = "", slot : int = 0):
+        self.store = Store(path, writable=True)
+        self.channels = np.array(channels)
+        self.quantities = quantities
+        self.host = host
+        self.slot = slot
+
+    def write(self, times : np.ndarray, data : np.ndarray):
+        self.store.append_samples(self.host, self.slot, self.channels, self.quantities, times, data)
+
+    def close(self):
+        self.store.close()
+
+
+def _parse_time(value : str | None) -> float | None:
+    """
+    Unix time, or ISO 8601 date/time in local time.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.group()
+    def main():
+        """
+        Inspect and query a measurement store (e.g. written by 'wicc_cli.py monitor -o campaign.wstore').
+        """
+
+    @main.command("info")
+    @click.argument("path", type=click.Path(exists=True, file_okay=False))
+    def cli_info(path):
+        """
+        Record count, time span and channels of the store at PATH.
+        """
+        store = Store(path)
+        times = store.columns()["time"]
+        print(json.dumps({"records": len(store),
+                          "first": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(times[0])) if len(times) else None,
+                          "last": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(times[-1])) if len(times) else None,
+                          "sorted": store.meta["sorted"],
+                          "channels": [f"{host}/{slot}/{ch}" for host, slot, ch in store.series()]}))
+
+    @main.command("downsample")
+    @click.argument("path", type=click.Path(exists=True, file_okay=False))
+    @click.option('-f', "--field", default="current", type=click.Choice(MEASUREMENTS), help="Default: current")
+    @click.option('-i', "--interval", default=60.0, type=click.FLOAT, help="Seconds per output row. Default: 60")
+    @click.option("--start", default=None, help="Unix time or ISO date/time. Default: first record")
+    @click.option("--end", default=None, help="Unix time or ISO date/time. Default: after the last record")
+    def cli_downsample(path, field, interval, start, end):
+        """
+        Print min/max/mean of FIELD per channel and interval as CSV.
+        """
+        result = Store(path).downsample(field, interval, _parse_time(start), _parse_time(end))
+        print("time,crate,slot,channel,count,min,max,mean")
+        for j, t in enumerate(result["time"]):
+            for i, (host, slot, ch) in enumerate(result["series"]):
+                if result["count"][i, j]:
+                    print(f"{t:.3f},{host},{slot},{ch},{result['count'][i, j]},{result['min'][i, j]:.6g},"
+                          f"{result['max'][i, j]:.6g},{result['mean'][i, j]:.6g}")
+
+    main()
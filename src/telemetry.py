@@ -0,0 +1,223 @@
+import asyncio, csv, logging, sys, time
+
+import numpy as np
+from status import status_masks
+
+logger = logging.getLogger("WienerTelemetry")
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer of samples: times (capacity,) and data (capacity, channel, quantity) as float64.
+    Samples are numbered by a running sequence number; the buffer holds the last capacity of them.
+    """
+    def __init__(self, capacity : int, channels : list[int], quantities : list[str]):
+        self.capacity = capacity
+        self.channels = list(channels)
+        self.quantities = list(quantities)
+        self.times = np.full(capacity, np.nan)
+        self.data = np.full((capacity, len(self.channels), len(self.quantities)), np.nan)
+        self.count = 0 # samples written so far (sequence number of the next sample)
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, t : float, values : np.ndarray):
+        i = self.count % self.capacity
+        self.times[i] = t
+        self.data[i] = values
+        self.count += 1
+
+    def since(self, seq : int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (times, data) of the samples with sequence number >= seq, oldest first.
+        Raises IndexError if some of them have already been overwritten.
+        """
+        if seq < self.count - self.capacity:
+            raise IndexError(f"Samples {seq}..{self.count - self.capacity - 1} were overwritten")
+        idx = np.arange(seq, self.count) % self.capacity
+        return self.times[idx], self.data[idx]
+
+    def latest(self, n : int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        n = len(self) if n is None else min(n, len(self))
+        return self.since(self.count - n)
+
+
+class CsvSink:
+    """
+    Streams samples as CSV rows: time, channel, one column per quantity. path '-' writes to stdout.
+    Values are written losslessly: the quantities in integers (bitmasks, switches) as integers, the rest
+    as the shortest repr of the float64.
+    """
+    integers = ("outputStatus", "outputSwitch")
+
+    def __init__(self, path : str, channels : list[int], quantities : list[str]):
+        self._file = sys.stdout if path == "-" else open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["time", "channel", *quantities])
+        self.channels = channels
+        self._formats = [self._integer if q in self.integers else repr for q in quantities]
+
+    @staticmethod
+    def _integer(v : float) -> str:
+        return str(int(v)) if v == v else "nan"
+
+    def write(self, times : np.ndarray, data : np.ndarray):
+        for t, sample in zip(times.tolist(), data.tolist()):
+            for channel, row in zip(self.channels, sample):
+                self._writer.writerow([f"{t:.6f}", channel, *(f(v) for f, v in zip(self._formats, row))])
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetSink:
+    """
+    Streams samples to a Parquet file, one row group per chunk (requires pyarrow).
+    """
+    def __init__(self, path : str, channels : list[int], quantities : list[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from None
+        self._pa = pa
+        self.channels = np.array(channels)
+        self.quantities = quantities
+        schema = pa.schema([("time", pa.float64()), ("channel", pa.int32())]
+                           + [(q, pa.float64()) for q in quantities])
+        self._writer = pq.ParquetWriter(path, schema)
+
+    def write(self, times : np.ndarray, data : np.ndarray):
+        n_ch = len(self.channels)
+        columns = {"time": np.repeat(times, n_ch), "channel": np.tile(self.channels, len(times)).astype(np.int32)}
+        for j, q in enumerate(self.quantities):
+            columns[q] = data[:, :, j].ravel()
+        self._writer.write_table(self._pa.table(columns))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(path : str, channels : list[int], quantities : list[str], host : str = "", slot : int = 0):
+    """
+    Sink for path by extension: .parquet (ParquetSink), .wstore (store.StoreSink, records tagged with the
+    crate host and module slot), otherwise CSV.
+    """
+    if path.endswith(".parquet"):
+        return ParquetSink(path, channels, quantities)
+    if path.endswith(".wstore"):
+        from store import StoreSink
+        return StoreSink(path, channels, quantities, host=host, slot=slot)
+    return CsvSink(path, channels, quantities)
+
+
+class Telemetry:
+    """
+    Samples quantities (outputTable columns) of channels of an AsyncWiener at a fixed rate into a RingBuffer,
+    streaming every flush_every samples to an optional sink (CsvSink/ParquetSink/store.StoreSink).
+
+    Each sample is one batched read_many. Sampling keeps to a fixed schedule (start + k / rate): if a sample
+    takes longer than the period, the ticks it overran are counted as missed and skipped rather than queued,
+    so stats() shows when the requested rate is more than the crate can handle.
+    outputStatus is stored as its integer bitmask (see status.OutputStatus).
+    """
+    def __init__(self, wiener, channels : list[int], quantities : list[str], rate : float = 1.0,
+                 capacity : int = 3600, sink=None, flush_every : int = 100):
+        self.wiener = wiener # AsyncWiener
+        self.channels = list(channels)
+        self.quantities = list(quantities)
+        self.period = 1 / rate
+        self.sink = sink
+        self.flush_every = min(flush_every, capacity)
+        self.buffer = RingBuffer(capacity, self.channels, self.quantities)
+        self._requests = [(q, ch) for ch in self.channels for q in self.quantities]
+        self._flushed = 0
+        self._durations = RingBuffer(capacity, [0], ["duration"])
+        self.missed = 0
+        self.max_lag = 0.0
+        self._started = None
+        self._ended = None
+        self._task = None
+
+    async def sample(self) -> np.ndarray:
+        values = await self.wiener.read_many(self._requests)
+        data = np.empty((len(self.channels), len(self.quantities)))
+        for j, q in enumerate(self.quantities):
+            column = [values[(q, ch)] for ch in self.channels]
+            if q == "outputStatus":
+                data[:, j] = status_masks(column)
+            else:
+                data[:, j] = [np.nan if v is None else v for v in column]
+        return data
+
+    async def run(self, duration : float | None = None, samples : int | None = None):
+        """
+        Sample until duration seconds or samples samples have passed (or forever), then flush the sink.
+        """
+        start = self._started = time.monotonic()
+        self._ended = None
+        tick = 0
+        try:
+            while (samples is None or self.buffer.count < samples) and (duration is None or tick * self.period < duration):
+                deadline = start + tick * self.period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                begin = time.monotonic()
+                self.max_lag = max(self.max_lag, begin - deadline)
+                data = await self.sample()
+                self.buffer.append(time.time(), data)
+                end = time.monotonic()
+                self._durations.append(end, [[end - begin]])
+                if self.sink is not None and self.buffer.count - self._flushed >= self.flush_every:
+                    self.flush()
+                # skip (and count) the ticks that passed while sampling
+                next_tick = max(tick + 1, int((end - start) / self.period) + 1)
+                if next_tick > tick + 1:
+                    self.missed += next_tick - tick - 1
+                    logger.info(f"Sampling took {end - begin:.3f} s, missed {next_tick - tick - 1} ticks")
+                tick = next_tick
+        finally:
+            self._ended = time.monotonic()
+            self.flush()
+
+    def flush(self):
+        if self.sink is None or self._flushed == self.buffer.count:
+            return
+        self.sink.write(*self.buffer.since(self._flushed))
+        self._flushed = self.buffer.count
+
+    def start(self, **kwargs) -> asyncio.Task:
+        """
+        Run in the background on the running event loop (stop() to end).
+        """
+        self._task = asyncio.get_running_loop().create_task(self.run(**kwargs))
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """
+        Sampling statistics: achieved vs. requested rate, missed ticks and sample durations.
+        """
+        _, durations = self._durations.latest()
+        durations = durations.ravel()
+        elapsed = (self._ended or time.monotonic()) - self._started if self._started is not None else 0.0
+        return {"samples": self.buffer.count,
+                "missed": self.missed,
+                "rate": 1 / self.period,
+                "achieved_rate": self.buffer.count / elapsed if elapsed > 0 else 0.0,
+                "max_lag_s": self.max_lag,
+                "duration_p50_s": float(np.percentile(durations, 50)) if len(durations) else None,
+                "duration_p99_s": float(np.percentile(durations, 99)) if len(durations) else None,
+                "duration_max_s": float(durations.max()) if len(durations) else None}
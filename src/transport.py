@@ -0,0 +1,367 @@
+"""
+Transports AsyncWiener can use instead of its built-in SNMP session (AsyncWiener(..., transport="scpi")).
+SCPI is the iseg text protocol (docs/Wiener_SCPI.pdf) spoken by CC24/iCS crate controllers on TCP port 10001:
+lines end with CR LF, commands within a line are separated by ';' and so are their answers, and one command
+can address several channels of a slot, (#slot@0-3,5), with the answers separated by ','.
+"""
+
+import abc, asyncio, collections, logging, re
+
+from metrics import METRICS
+from status import OutputStatus, to_bits
+
+logger = logging.getLogger("WienerTransport")
+
+# bit of the iseg Channel Status register (:READ:CHAN:STAT?) -> outputStatus flag of the MIB
+ISEG_STATUS = {
+    3: OutputStatus.outputOn,
+    5: OutputStatus.outputEmergencyOff,
+    6: OutputStatus.outputCurrentLimited, # constant current
+    7: OutputStatus.outputConstantVoltage,
+    8: OutputStatus.outputLowCurrentRange,
+    10: OutputStatus.outputCurrentBoundsExceeded,
+    12: OutputStatus.outputInhibit,
+    13: OutputStatus.outputFailureMaxCurrent, # current trip
+    14: OutputStatus.outputFailureCurrentLimit,
+    15: OutputStatus.outputFailureMaxTerminalVoltage, # voltage limit
+    17: OutputStatus.outputCurrentIncreasing,
+    18: OutputStatus.outputCurrentDecreasing,
+    19: OutputStatus.outputRampUp,
+    20: OutputStatus.outputRampDown,
+}
+ISEG_VOLTAGE_RAMP = 4 # direction bits 19/20 exist on NHR/SHR only; elsewhere a ramp is reported as outputRampUp
+
+# MIB object -> (SCPI query of one or more channels, unit of the answer; None for integers, "status", "string")
+QUERIES = {
+    "outputVoltage": (":READ:VOLT?", "V"),
+    "outputCurrent": (":READ:CURR?", "A"),
+    "outputMeasurementTerminalVoltage": (":MEAS:VOLT?", "V"),
+    "outputMeasurementSenseVoltage": (":MEAS:VOLT?", "V"), # iseg modules have no sense lines
+    "outputMeasurementCurrent": (":MEAS:CURR?", "A"),
+    "outputSwitch": (":READ:VOLT:ON?", None),
+    "outputStatus": (":READ:CHAN:STAT?", "status"),
+    "outputVoltageRiseRate": (":CONF:RAMP:VOLT:UP?", "V/s"),
+    "outputVoltageFallRate": (":CONF:RAMP:VOLT:DOWN?", "V/s"),
+    "outputCurrentRiseRate": (":CONF:RAMP:CURR:UP?", "A/s"),
+    "outputCurrentFallRate": (":CONF:RAMP:CURR:DOWN?", "A/s"),
+}
+# MIB object -> SCPI order setting a channel value
+ORDERS = {
+    "outputVoltage": ":VOLT",
+    "outputCurrent": ":CURR",
+    "outputVoltageRiseRate": ":CONF:RAMP:VOLT:UP",
+    "outputVoltageFallRate": ":CONF:RAMP:VOLT:DOWN",
+    "outputCurrentRiseRate": ":CONF:RAMP:CURR:UP",
+    "outputCurrentFallRate": ":CONF:RAMP:CURR:DOWN",
+}
+# outputSwitch / groupsSwitch value -> SCPI order
+SWITCH_ORDERS = {
+    0: ":VOLT OFF",
+    1: ":VOLT ON",
+    2: ":VOLT EMCY CLR", # resetEmergencyOff
+    3: ":VOLT EMCY OFF", # setEmergencyOff
+    10: ":EVENT CLEAR", # clearEvents
+}
+
+_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+
+def status_from_iseg(word : int) -> OutputStatus:
+    """
+    Translate an iseg Channel Status register into the outputStatus flags of the MIB.
+    """
+    status = OutputStatus(0)
+    for bit, flag in ISEG_STATUS.items():
+        if word >> bit & 1:
+            status |= flag
+    if word >> ISEG_VOLTAGE_RAMP & 1 and not word & (1 << 19 | 1 << 20):
+        status |= OutputStatus.outputRampUp
+    return status
+
+
+def status_to_iseg(status : int) -> int:
+    """
+    Inverse of status_from_iseg (for simulator.py).
+    """
+    word = sum(1 << bit for bit, flag in ISEG_STATUS.items() if status & flag)
+    if status & (OutputStatus.outputRampUp | OutputStatus.outputRampDown):
+        word |= 1 << ISEG_VOLTAGE_RAMP
+    return word
+
+
+def parse_number(text : str, unit : str | None):
+    """
+    "1.23400E3V" -> 1234.0 (unit "V"); "132" -> 132 (unit None)
+    """
+    match = _NUMBER.match(text.strip())
+    if match is None:
+        raise ValueError(f"Not a number: {text!r}")
+    return float(match.group()) if unit else int(float(match.group()))
+
+
+def channel_list(channels : list[int]) -> str:
+    """
+    [0, 1, 2, 5] -> "0-2,5"
+    """
+    parts, channels = [], sorted(set(channels))
+    start = previous = channels[0]
+    for channel in channels[1:] + [None]:
+        if channel is not None and channel == previous + 1:
+            previous = channel
+            continue
+        parts.append(str(start) if start == previous else f"{start}-{previous}")
+        start = previous = channel
+    return ",".join(parts)
+
+
+class Transport(abc.ABC):
+    """
+    What AsyncWiener needs from a transport other than its built-in SNMP session. Objects are addressed as in the
+    MIB, (command, instance) with instance as AsyncWiener.get_channel gives it ("u100", 64/128 for groupsSwitch, 0).
+    """
+    @abc.abstractmethod
+    async def open(self):
+        pass
+
+    @abc.abstractmethod
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def read_many(self, requests : list[tuple[str, str | int]]) -> dict:
+        """
+        {(command, instance): decoded value as read_many returns it, None if the transport does not have it}
+        """
+
+    @abc.abstractmethod
+    async def write_many(self, writes : list[tuple[str, str | int, float | int]], urgent : bool = False) -> dict:
+        """
+        Apply the writes in order; {(command, instance): decoded value the crate reports afterwards}
+        """
+
+    @abc.abstractmethod
+    async def channels(self) -> int:
+        """
+        Number of channels of the module.
+        """
+
+
+class ScpiTransport(Transport):
+    """
+    SCPI over one persistent TCP connection to the crate controller, for the module in slot.
+
+    Requests are pipelined: lines are written as soon as they are ready and answers matched to them in order,
+    so concurrent callers share the connection without waiting for each other's round trips. read_many
+    batches every channel read of the same quantity into one multi-channel query, and lines are packed with
+    ';'-separated commands up to max_line characters (the receive buffer of the smaller iseg devices is 80).
+    Every line contains a query (order-only lines get *OPC?), so every line is answered.
+    A line the device rejects gets no answer at all, so after timeout the connection is dropped
+    (reopened by the next request) instead of matching later answers to the wrong lines.
+    """
+    def __init__(self, host : str, slot : int, port : int = 10001, timeout : float = 2.0, max_line : int = 80):
+        self.host = host
+        self.slot = slot
+        self.port = port
+        self.timeout = timeout
+        self.max_line = max_line
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = collections.deque() # futures of the lines sent, in order
+        self._channels = None
+        self._lock = asyncio.Lock() # one connection attempt at a time
+        self.lines = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        async with self._lock:
+            if not self.is_open:
+                logger.debug(f"Opening SCPI connection to {self.host}:{self.port}")
+                with METRICS.timer("wicc_phase_seconds", phase="engine"):
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                self._receiver = asyncio.get_running_loop().create_task(self._receive())
+        return self
+
+    async def close(self):
+        if not self.is_open:
+            return
+        logger.debug(f"Closing SCPI connection to {self.host}:{self.port}")
+        writer, receiver = self._writer, self._receiver
+        self._reader = self._writer = self._receiver = None
+        receiver.cancel()
+        self._fail(ConnectionError(f"SCPI connection to {self.host}:{self.port} closed"))
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    def _fail(self, error : Exception):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def _receive(self):
+        reader, writer = self._reader, self._writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError(f"SCPI connection to {self.host}:{self.port} closed by the crate")
+                answer = line.decode(errors="replace").strip()
+                if not answer: # iCS controllers send empty lines after order commands
+                    continue
+                if not self._pending:
+                    logger.warning(f"Unexpected SCPI answer from {self.host}: {answer}")
+                    continue
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(answer)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(str(e))
+            if self._writer is writer: # the next request reconnects
+                self._reader = self._writer = self._receiver = None
+                writer.close()
+            self._fail(e)
+
+    async def query(self, lines : list[str]) -> list[str]:
+        """
+        Send lines (each must contain a query) back to back and return their answers.
+        """
+        if not self.is_open:
+            await self.open()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for line in lines:
+            futures.append(loop.create_future())
+            self._pending.append(futures[-1])
+            logger.debug("Sending %s to %s", line, self.host)
+            self._writer.write(line.encode() + b"\r\n")
+        self.lines += len(lines)
+        await self._writer.drain()
+        try:
+            with METRICS.timer("wicc_phase_seconds", phase="network"):
+                return await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        except asyncio.TimeoutError:
+            if METRICS.enabled:
+                METRICS.inc("wicc_timeouts_total", host=self.host)
+            await self.close()
+            raise Exception(f"No SCPI answer from {self.host}:{self.port} within {self.timeout} s "
+                            f"(command rejected or connection lost): {' / '.join(lines)}")
+
+    def _pack(self, commands : list[str], reserve : int = 0) -> list[str]:
+        """
+        Join commands into lines of at most max_line - reserve characters (longer commands go alone).
+        """
+        lines, line = [], ""
+        for command in commands:
+            if line and len(line) + 1 + len(command) > self.max_line - reserve:
+                lines.append(line)
+                line = ""
+            line = f"{line};{command}" if line else command
+        if line:
+            lines.append(line)
+        return lines
+
+    def _address(self, instance : str | int) -> tuple[int, int]:
+        """
+        "u105" -> (slot 1, channel 5); SCPI channels count from 0 within the slot, like the MIB's u{100 * slot + ch}
+        """
+        if not isinstance(instance, str) or not instance.startswith("u"):
+            raise ValueError(f"Not an output channel: {instance}")
+        return divmod(int(instance[1:]), 100)
+
+    def _batch(self, requests : list[tuple[str, str]]) -> tuple[list[str], list[tuple]]:
+        """
+        One multi-channel query per quantity and slot: returns the commands and their (query, slot, channels).
+        """
+        groups = {}
+        for command, instance in requests:
+            groups.setdefault((QUERIES[command][0], self._address(instance)[0]), set()).add(self._address(instance)[1])
+        batches = [(query, slot, sorted(channels)) for (query, slot), channels in groups.items()]
+        return [f"{query} (#{slot}@{channel_list(channels)})" for query, slot, channels in batches], batches
+
+    def _values(self, requests : list[tuple[str, str]], batches : list[tuple], answers : list[str]) -> dict:
+        """
+        Split the answer lines of _batch's queries into {(command, instance): decoded value}.
+        """
+        parts = [part for answer in answers for part in answer.split(";") if part]
+        if len(parts) != len(batches):
+            raise Exception(f"Expected {len(batches)} SCPI answers from {self.host}, got {len(parts)}: {parts}")
+        raw = {}
+        for (query, slot, channels), part in zip(batches, parts):
+            values = part.split(",")
+            if len(values) != len(channels):
+                raise Exception(f"Expected {len(channels)} values for {query} from {self.host}, got {part}")
+            raw.update({(query, slot, channel): value for channel, value in zip(channels, values)})
+        retv = {}
+        for command, instance in requests:
+            query, unit = QUERIES[command]
+            answer = raw[(query, *self._address(instance))]
+            retv[(command, instance)] = (to_bits(status_from_iseg(parse_number(answer, None))) if unit == "status"
+                                         else parse_number(answer, unit))
+        return retv
+
+    async def read_many(self, requests : list[tuple[str, str | int]]) -> dict:
+        retv, channel_reads = {}, []
+        for command, instance in requests:
+            if command in QUERIES and isinstance(instance, str) and instance.startswith("u"):
+                channel_reads.append((command, instance))
+            elif command == "moduleDescription": # the answer contains commas, so it goes on a line of its own
+                slot = int(str(instance).removeprefix("ma"))
+                retv[(command, instance)] = (await self.query([f":READ:MOD:IDENT? (#{slot})"]))[0]
+            elif command == "sysMainSwitch":
+                retv[(command, instance)] = parse_number((await self.query([":CRATE:POWER?"]))[0], None)
+            else:
+                retv[(command, instance)] = None
+        if channel_reads:
+            commands, batches = self._batch(channel_reads)
+            retv.update(self._values(channel_reads, batches, await self.query(self._pack(commands))))
+        return {key: retv[key] for key in requests}
+
+    async def channels(self) -> int:
+        if self._channels is None:
+            self._channels = parse_number((await self.query([f":READ:MOD:CHAN? (#{self.slot})"]))[0], None)
+        return self._channels
+
+    async def write_many(self, writes : list[tuple[str, str | int, float | int]], urgent : bool = False) -> dict:
+        """
+        The orders go out in the order given, each line followed by *OPC? so a rejected line is noticed,
+        and in the same pipeline the queries reading back the written setpoints and switches, batched per quantity
+        like read_many (so they see every order applied). Writes without a read-back (clearEvents, emergency off,
+        groupsSwitch, sysMainSwitch) report the value written. urgent has no effect: there is no queue to skip.
+        """
+        orders, echoes, retv = [], [], {}
+        for command, instance, value in writes:
+            if command == "groupsSwitch": # every channel of this module
+                channels = channel_list(list(range(await self.channels())))
+                orders.append(f"{SWITCH_ORDERS[int(value)]},(#{self.slot}@{channels})")
+                retv[(command, instance)] = int(value)
+            elif command == "sysMainSwitch":
+                orders.append(f":CRATE:POWER {int(value)}")
+                retv[(command, instance)] = int(value)
+            elif command == "outputSwitch" and int(value) in SWITCH_ORDERS:
+                slot, channel = self._address(instance)
+                orders.append(f"{SWITCH_ORDERS[int(value)]},(#{slot}@{channel})")
+                if int(value) in (0, 1):
+                    echoes.append((command, instance))
+                else:
+                    retv[(command, instance)] = int(value)
+            elif command in ORDERS:
+                slot, channel = self._address(instance)
+                orders.append(f"{ORDERS[command]} {float(value):.7G},(#{slot}@{channel})")
+                echoes.append((command, instance))
+            else:
+                raise ValueError(f"{command} cannot be written over SCPI")
+        order_lines = [f"{line};*OPC?" for line in self._pack(orders, reserve=len(";*OPC?"))]
+        commands, batches = self._batch(echoes) if echoes else ([], [])
+        answers = await self.query(order_lines + self._pack(commands))
+        if echoes:
+            retv.update(self._values(echoes, batches, answers[len(order_lines):]))
+        return {(command, instance): retv[(command, instance)] for command, instance, _ in writes}
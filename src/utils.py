@@ -1,7 +1,9 @@
-import struct, logging
+import struct
+import numpy as np
 from pysnmp.proto.rfc1902 import Opaque
-import click
-from functools import update_wrapper
+from pysnmp.proto.rfc1905 import NoSuchObject, NoSuchInstance, EndOfMibView
+from pyasn1.error import PyAsn1Error
+from log import verbosity, LoggingFormat # re-exported; the CLIs import them from log without numpy and pysnmp
 
 def strip_hex(s : str) -> int:
     s_strip = s[2:] if s[0:2] == "0x" else s #remove hex prefix
@@ -56,6 +58,9 @@ def decode_ber(ser : str | int, prec : int = 4) -> float:
     trunc_dec = int(dec * x)/x
     return trunc_dec
 
+FLOATTYPE = b'\x9f\x78\x04' # tag 9f78, length 4: big-endian IEEE754 single
+DOUBLETYPE = b'\x9f\x79\x08' # tag 9f79, length 8: big-endian IEEE754 double
+
 class FloatOpaque(Opaque):
     """
     Encodes a 32-bit IEEE754 float as the WIENER FLOATTYPE tag-length-value (TLV) format.:
@@ -64,21 +69,100 @@ class FloatOpaque(Opaque):
     """
     def __init__(self, value):
         float_bytes = struct.pack(">f", float(value)) #
-        float_type_tlv = b'\x9f\x78\x04' + float_bytes #prepends tags
+        float_type_tlv = FLOATTYPE + float_bytes #prepends tags
         super().__init__(float_type_tlv)  # Opaque(inner_tlv)
 
 def opaque_to_float(o: Opaque) -> float:
     """
-    Decode the Wiener FLOATTYPE inside of an Opaque object.
+    Decode the Wiener FLOATTYPE (or DOUBLETYPE) inside of an Opaque object.
     Returns Python float. Raises ValueError on unexpected formats.
     """
-    payload = bytes(o.asNumbers()) if hasattr(o, 'asNumbers') else bytes(o) 
+    payload = o.asOctets() if hasattr(o, 'asOctets') else bytes(o)
     # payload is the inner bytes (prefixes 0x9f 0x78 0x04 are tags indicating type 0x9f78 
     # and length of data 0x04). 
-    if len(payload) < 6 or payload[0:2] != b'\x9f\x78' or payload[2] != 0x04:
-        raise ValueError(f"Not a Wiener FLOATTYPE value: {payload!r}")
-    float_bytes = payload[3:7] # trim initial tags
-    return struct.unpack(">f", float_bytes)[0]
+    if len(payload) == 7 and payload[:3] == FLOATTYPE:
+        return struct.unpack(">f", payload[3:])[0]
+    if len(payload) == 11 and payload[:3] == DOUBLETYPE:
+        return struct.unpack(">d", payload[3:])[0]
+    raise ValueError(f"Not a Wiener FLOATTYPE value: {payload!r}")
+
+def _missing(raw) -> bool:
+    return raw is None or isinstance(raw, (NoSuchObject, NoSuchInstance, EndOfMibView))
+
+def _payloads(raws) -> list[bytes]:
+    payloads = []
+    for raw in raws: # noSuchObject/noSuchInstance/endOfMibView are Null, i.e. empty
+        try:
+            payloads.append(b"" if raw is None else raw if isinstance(raw, bytes) else raw.asOctets())
+        except PyAsn1Error: # no value at all
+            payloads.append(b"")
+    return payloads
+
+def _decode_payloads(payloads : list[bytes], dtype) -> np.ndarray:
+    values = np.full(len(payloads), np.nan, dtype=dtype)
+    lengths = np.fromiter(map(len, payloads), dtype=np.int64, count=len(payloads))
+    for header, fmt in ((FLOATTYPE, ">f4"), (DOUBLETYPE, ">f8")):
+        size = len(header) + header[2]
+        idx = np.flatnonzero(lengths == size)
+        if not len(idx):
+            continue
+        buffer = np.frombuffer(b"".join([payloads[i] for i in idx]), dtype=np.uint8).reshape(-1, size)
+        ok = (buffer[:, :3] == np.frombuffer(header, dtype=np.uint8)).all(axis=1)
+        values[idx[ok]] = np.ascontiguousarray(buffer[ok, 3:]).view(fmt)[:, 0]
+    return values
+
+def decode_floats(raws, dtype=np.float32) -> np.ndarray:
+    """
+    Decode many FLOATTYPE/DOUBLETYPE Opaque values (e.g. a column of a GETBULK walk) into one array.
+    The payloads are joined into one byte buffer and decoded per type with a single NumPy view, instead of
+    one struct.unpack per value. Missing values (None, noSuchInstance, ...) and malformed payloads are NaN.
+    """
+    return _decode_payloads(_payloads(raws), dtype)
+
+def encode_floats(values) -> list[Opaque]:
+    """
+    Encode many values as FLOATTYPE Opaque at once (one NumPy conversion to big-endian float32 for all of them).
+    """
+    data = np.asarray(values, dtype=">f4").tobytes()
+    return [Opaque(FLOATTYPE + data[i:i + 4]) for i in range(0, len(data), 4)]
+
+def decode_value(syntax : str, raw):
+    """
+    Decode a raw SNMP value according to the MIB syntax of its object (see oids.OidTable.syntax):
+    float -> float, int/enum -> int, bits -> bytes, string -> str.
+    Returns None if the crate answered noSuchObject/noSuchInstance/endOfMibView.
+    """
+    if _missing(raw):
+        return None
+    if syntax == "float":
+        return opaque_to_float(raw)
+    if syntax in ("int", "enum"):
+        return int(raw)
+    if syntax == "bits":
+        return bytes(raw)
+    if syntax == "string":
+        return bytes(raw).decode(errors="replace")
+    return raw.prettyPrint()
+
+def decode_values(syntaxes : list[str], raws : list) -> list:
+    """
+    decode_value of many values, decoding all the floats at once with decode_floats
+    (as float64, so FLOATTYPE values come out exactly as from opaque_to_float). Missing values are None;
+    like decode_value, malformed or non-Opaque float values raise ValueError.
+    """
+    retv = [None if syntax == "float" and hasattr(raw, "asOctets") else decode_value(syntax, raw)
+            for syntax, raw in zip(syntaxes, raws)]
+    floats = [i for i, syntax in enumerate(syntaxes) if syntax == "float" and hasattr(raws[i], "asOctets")]
+    if floats:
+        payloads = _payloads([raws[i] for i in floats])
+        for i, payload, value in zip(floats, payloads, _decode_payloads(payloads, np.float64).tolist()):
+            if not payload:
+                retv[i] = None
+            elif value != value: # NaN: malformed (opaque_to_float raises) or a NaN sent by the crate
+                retv[i] = opaque_to_float(raws[i])
+            else:
+                retv[i] = value
+    return retv
 
 def switch_to_int(state : str | int | bool) -> int:
     if isinstance(state,bool):
@@ -86,39 +170,3 @@ def switch_to_int(state : str | int | bool) -> int:
     elif isinstance(state,str):
         return 1 if "on" in state.lower() else 0
     return state
-
-def verbosity(level : int):
-    if level == 0:
-        return logging.WARNING
-    elif level == 1:
-        return logging.INFO
-    else:
-        return logging.DEBUG
-    
-
-class LoggingFormat(logging.Formatter):
-    """
-    Use ANSI colour codes to format logging messages
-    """
-    grey = "\x1b[38;20m"
-    yellow = "\x1b[33;20m"
-    red = "\x1b[31;20m"
-    bold_red = "\x1b[31;1m"
-    reset = "\x1b[0m"
-    format = "[%(asctime)s][%(name)s][%(levelname)s] - %(message)s @ (%(filename)s:%(lineno)d)"
-
-    formats = {
-        logging.DEBUG: grey + format + reset,
-        logging.INFO: grey + format + reset,
-        logging.WARNING: yellow + format + reset,
-        logging.ERROR: red + format + reset,
-        logging.CRITICAL: bold_red + format + reset
-    }
-        
-    def format(self, record):
-        log_fmt = self.formats.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
-    
-# def decode_output_status(bits : str):
-    
\ No newline at end of file
@@ -1,10 +1,29 @@
-from Wiener import Wiener
-import click, logging
-from utils import verbosity, LoggingFormat
+import click, json, logging
+from log import verbosity, LoggingFormat
 logger = logging.getLogger("WienerCLI")
-"""
+# Wiener (pysnmp, numpy, asyncio) and the command modules are imported when a command first uses them, so --help
+# (also of a subcommand) and usage errors return without loading them; the OID table comes precompiled
+# (see oids.OidTable.load).
+
+class LazyWiener:
+    """
+    Stands in for the Wiener of the chained commands and builds it on first use. The group callback runs before
+    the subcommands are parsed, so building it there would load pysnmp and the MIB for 'set --help' too.
+    """
+    def __init__(self, **options):
+        self._options = options
+        self._wiener = None
+
+    def __getattr__(self, name):
+        if self._wiener is None:
+            from Wiener import Wiener
+            self._wiener = Wiener(**self._options)
+        return getattr(self._wiener, name)
+
+    def close(self):
+        if self._wiener is not None:
+            self._wiener.close()
 
-"""
 @click.group(chain = True) # may need to add chain=True
 @click.option('-d', "--device",
               default='LV',
@@ -15,6 +34,18 @@ logger = logging.getLogger("WienerCLI")
               default='10.179.59.29',
               type=click.STRING,
               help="IP address assigned to Wiener crate controller. Default: 10.179.59.29")
+@click.option('-p', "--port",
+              default=161,
+              type=click.INT,
+              help="SNMP port of the crate controller (e.g. of simulator.py). Default: 161")
+@click.option('-t', "--transport",
+              default="snmp",
+              type=click.Choice(["snmp", "scpi"]),
+              help="Talk SNMP, or SCPI over TCP to the crate controller. Default: snmp")
+@click.option("--scpi-port",
+              default=10001,
+              type=click.INT,
+              help="SCPI port of the crate controller. Default: 10001")
 @click.option('-M', "--mib-path",
               default="/usr/share/snmp/mibs",
               help="Path to MIB files (e.g. path to WIENER-CRATE-MIB). Default: /usr/share/snmp/mibs ",
@@ -32,9 +63,19 @@ logger = logging.getLogger("WienerCLI")
               count=True, 
               help = "Verbose output (-v = INFO, -vv = DEBUG)"
               )
+@click.option("--metrics",
+              default=None,
+              type=click.Path(dir_okay=False, writable=True),
+              help="Record request counters and latencies and write them to this file (Prometheus text format) on exit")
 @click.pass_context
-def wicc(ctx, device, ip, mib_path, mib_name, verbose):
-    ctx.obj = Wiener(host=ip, mib_dir=mib_path, mib_name=mib_name,device=device)
+def wicc(ctx, device, ip, port, transport, scpi_port, mib_path, mib_name, verbose, metrics):
+    if metrics:
+        import metrics as wicc_metrics
+        wicc_metrics.enable()
+        ctx.call_on_close(lambda: wicc_metrics.METRICS.write(metrics)) # runs after close(): includes its requests
+    ctx.obj = LazyWiener(host=ip, mib_dir=mib_path, mib_name=mib_name,device=device, port=port, transport=transport,
+                         scpi_port=scpi_port)
+    ctx.call_on_close(ctx.obj.close) # one SNMP session (or SCPI connection) shared by all chained commands
     ctx.device = device
     logger.level = verbosity(verbose)
 
@@ -114,5 +155,132 @@ def cli_meas_voltage(obj):
     print(f"{retv:.2f} V")
     return retv
 
+@wicc.command("monitor")
+@click.option('-c', "--channels", default="1-8", help="Channels to sample, e.g. 1,3,5-8 or * for all. Default: 1-8")
+@click.option('-q', "--quantities",
+              default="outputMeasurementCurrent,outputMeasurementTerminalVoltage",
+              help="Comma separated outputTable objects to sample. Default: outputMeasurementCurrent,outputMeasurementTerminalVoltage")
+@click.option('-r', "--rate", default=1.0, type=click.FLOAT, help="Samples per second. Default: 1")
+@click.option('-t', "--duration", default=None, type=click.FLOAT, help="Seconds to sample for. Default: until interrupted")
+@click.option('-o', "--output", default="-",
+              help="CSV file, .parquet file (needs pyarrow) or .wstore measurement store (see store.py). Default: stdout (CSV)")
+@click.option("--flush-every", default=100, type=click.INT, help="Samples buffered before writing. Default: 100")
+@click.pass_obj
+def cli_monitor(obj, channels : str, quantities : str, rate : float, duration : float | None, output : str,
+                flush_every : int):
+    """
+    Sample measurements of several channels at a fixed rate over one SNMP session and stream them to a file.
+    Sampling statistics (achieved rate, missed ticks) are printed to stderr at the end.
+    """
+    from batch import parse_channels
+    from telemetry import Telemetry, open_sink
+    channels, quantities = parse_channels(channels), quantities.split(",")
+    if channels is None: # '*': every channel of the module
+        channels = obj._run(obj.aio.snapshot(("outputSwitch",)))["channel"].tolist()
+    try:
+        sink = open_sink(output, channels, quantities, host=obj.host, slot=obj.aio.slot)
+    except ImportError as e:
+        raise click.ClickException(str(e))
+    telemetry = Telemetry(obj.aio, channels, quantities, rate=rate, sink=sink,
+                          capacity=max(flush_every, 1), flush_every=flush_every)
+    try:
+        obj._run(telemetry.run(duration=duration))
+    except KeyboardInterrupt:
+        telemetry.flush()
+    finally:
+        sink.close()
+        click.echo(json.dumps(telemetry.stats()), err=True)
+
+@wicc.command("batch")
+@click.argument("script", type=click.File("r"), default="-")
+@click.option('-e', "--execute", default=None, help="Run these statements instead of a script, e.g. 'HV 1 set 50 0.001; LV * meas-current'")
+@click.pass_context
+def cli_batch(ctx, script, execute : str | None):
+    """
+    Run a script of 'DEVICE CHANNELS COMMAND [ARGS]' statements (from SCRIPT or stdin) for many channels of both
+    modules, e.g. 'HV 1-8 set 50 0.001; HV 1-8 enable 1; LV * meas-current'. Statements on different channels are
+    combined into shared PDUs and sent concurrently; results are printed as JSON lines.
+    """
+    import asyncio, batch
+    params = ctx.parent.params
+    batch.logger.setLevel(verbosity(params["verbose"]))
+    batch.logger.addHandler(logger.handlers[0])
+    try:
+        failed = asyncio.run(batch.run(execute if execute is not None else script.read(), params["ip"],
+                                       params["mib_path"], params["mib_name"], port=params["port"],
+                                       transport=params["transport"], scpi_port=params["scpi_port"]))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if failed:
+        ctx.exit(1)
+
+@wicc.command("config-export")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option('-c', "--channels", default="*", help="Channels to export, e.g. 1,3,5-8. Default: * (all)")
+@click.pass_obj
+def cli_config_export(obj, path : str, channels : str):
+    """
+    Save setpoints, ramp rates, supervision limits, trip actions and switches of the module's channels to PATH (JSON).
+    """
+    import config
+    from batch import parse_channels
+    saved = obj._run(config.export([obj.aio], parse_channels(channels)))
+    config.save(saved, path)
+    click.echo(f"Saved {sum(map(len, saved['modules'][obj.device]['channels'].values()))} values to {path}", err=True)
+
+def _config_changes(obj, path : str, dry_run : bool):
+    import config
+    try:
+        changes = obj._run(config.restore(obj.aio, config.load(path), dry_run=dry_run))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for command, channel, saved, live in changes:
+        print(json.dumps({"channel": channel, "object": command, "saved": saved, "live": live}))
+    return changes
+
+@wicc.command("config-diff")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.pass_obj
+def cli_config_diff(obj, path : str):
+    """
+    Print the values saved in PATH that differ from the module's current state, as JSON lines.
+    """
+    _config_changes(obj, path, dry_run=True)
+
+@wicc.command("config-restore")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Only print what would be written")
+@click.pass_obj
+def cli_config_restore(obj, path : str, dry_run : bool):
+    """
+    Restore the module to the state saved in PATH, writing only the values that differ (printed as JSON lines):
+    limits first, then currents and ramp rates, then voltages; switches last, with supervised ramps.
+    """
+    changes = _config_changes(obj, path, dry_run)
+    click.echo(f"{'Would write' if dry_run else 'Wrote'} {len(changes)} values", err=True)
+
+@wicc.command("serve")
+@click.option('-s', "--socket", "path", default=None, help="Unix socket to listen on. Default: $XDG_RUNTIME_DIR/wicc-UID.sock")
+@click.option("--metrics-port", default=None, type=click.INT,
+              help="Record request counters and latencies and serve them for Prometheus on this HTTP port")
+@click.pass_context
+def cli_serve(ctx, path : str | None, metrics_port : int | None):
+    """
+    Run the wicc daemon: keep warm SNMP sessions to the crate and serve requests from client.py over a Unix socket.
+    """
+    import asyncio
+    from daemon import WienerDaemon, logger as daemon_logger
+    params = ctx.parent.params
+    daemon_logger.setLevel(verbosity(params["verbose"]))
+    daemon_logger.addHandler(logger.handlers[0])
+    daemon = WienerDaemon(params["ip"], params["mib_path"], params["mib_name"], port=params["port"], path=path,
+                          metrics_port=metrics_port, transport=params["transport"], scpi_port=params["scpi_port"])
+    try:
+        asyncio.run(daemon.serve())
+    except FileExistsError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        pass
+
 if __name__=='__main__':
     wicc()
\ No newline at end of file
@@ -0,0 +1,55 @@
+import asyncio, json
+
+import pytest
+import batch
+import simulator
+from oids import OidTable
+
+MIB_DIR = "docs"
+PORT = 11298
+
+
+@pytest.mark.parametrize("script, message", [
+    ("HV 1 enable 1\nHV 1 set abc 0.001", "Line 2: set takes a voltage and a current"),
+    ("HV 1 set 10 0.001; HV 1 enable maybe", "Line 1: enable takes on, off, 1 or 0"),
+])
+def test_bad_statements_fail_before_any_module_is_touched(script, message):
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, protocol = await simulator.start(port=PORT, oids=oids)
+        try:
+            channel = protocol.crate.channels[101] # HV channel 1
+            channel.write("outputSwitch", 1)
+            with pytest.raises(ValueError, match=message):
+                await batch.run(script, "127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", port=PORT, out=lambda line: None)
+            assert channel.switch == 1
+            assert channel.values["outputVoltage"] == 0.0
+        finally:
+            transport.close()
+    asyncio.run(run())
+
+
+def test_parse_converts_arguments():
+    set_, enable, status = batch.parse("HV 1-3 set 50 1e-3; lv 2 enable OFF\nLV * status # all")
+    assert (set_.channels, set_.values) == ([1, 2, 3], [50.0, 0.001])
+    assert (enable.device, enable.values) == ("LV", [0])
+    assert status.channels is None
+
+
+def test_star_runs_every_channel_of_the_module():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, _ = await simulator.start(port=PORT + 1, oids=oids, channels=4)
+        lines = []
+        try:
+            failed = await batch.run("HV * set 20 0.001\nLV * status", "127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB",
+                                     port=PORT + 1, out=lambda line: lines.append(json.loads(line)))
+        finally:
+            transport.close()
+        assert failed == 0
+        assert [(line["device"], line["channel"]) for line in lines] == \
+            [("HV", ch) for ch in range(1, 5)] + [("LV", ch) for ch in range(1, 5)]
+        assert lines[0]["result"]["voltage"] == 20.0
+        assert lines[0]["result"]["current"] == pytest.approx(1.0) # mA, through float32
+        assert all(isinstance(line["result"], list) for line in lines[4:])
+    asyncio.run(run())
@@ -0,0 +1,30 @@
+import asyncio
+
+import simulator
+from oids import OidTable
+from scheduler import RequestScheduler
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11295
+
+
+def test_read_started_before_a_write_does_not_overwrite_its_echo():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, protocol = await simulator.start(port=PORT, oids=oids)
+        try:
+            async with AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", port=PORT, cache=True,
+                                   scheduler=RequestScheduler(rate=None)) as hv:
+                await hv.set_voltage(1, 10.0)
+                hv.cache.invalidate()
+                protocol.latency = 0.2 # the GET is answered after the SET below completes
+                read = asyncio.create_task(hv.get_voltage(1))
+                await asyncio.sleep(0.05)
+                protocol.latency = 0.0
+                assert await hv.set_voltage(1, 50.0) == 50.0
+                assert await read == 10.0
+                assert await hv.get_voltage(1) == 50.0
+        finally:
+            transport.close()
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import asyncio
+
+import config
+import simulator
+from oids import OidTable
+from scheduler import RequestScheduler
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11306
+
+
+def _wiener(port):
+    return AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", port=port, scheduler=RequestScheduler(rate=None))
+
+
+def test_export_restore_leaves_no_diff(tmp_path):
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        source, _ = await simulator.start(port=PORT, oids=oids, channels=4)
+        target, _ = await simulator.start(port=PORT + 1, oids=oids, channels=4)
+        path = str(tmp_path / "hv.json")
+        try:
+            async with _wiener(PORT) as hv:
+                await hv.set_outputs({1: (2.0, 2e-4), 3: (1.5, 5e-5)})
+                await hv.write_many([("outputVoltageRiseRate", 1, 20.0), ("outputSwitch", 1, 1)])
+                config.save(await config.export([hv]), path)
+            saved = config.load(path)
+            async with _wiener(PORT + 1) as hv:
+                assert await config.restore(hv, saved, dry_run=True) # the fresh crate differs
+                await config.restore(hv, saved)
+                assert await config.restore(hv, saved, dry_run=True) == []
+                assert await hv.get_voltage(1) == 2.0
+                assert await hv.output_enabled(1)
+        finally:
+            source.close()
+            target.close()
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import os, signal, subprocess, sys, time
+
+import bench
+from client import WiccClient
+from oids import OidTable
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src", "wicc_cli.py")
+MIB_DIR = "docs"
+PORT = 11308
+
+
+def _wait_for(condition, timeout : float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def _serve(path : str, port : int = 161) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, CLI, "-M", MIB_DIR, "-i", "127.0.0.1", "-p", str(port), "serve", "-s", path],
+                            stderr=subprocess.PIPE, text=True)
+
+
+def test_client_round_trip_and_second_daemon_refused(tmp_path):
+    bench.start_simulator(PORT, OidTable.load(MIB_DIR, "WIENER-CRATE-MIB"), 8, 0.0, 0.0, 0.0)
+    path = str(tmp_path / "wicc.sock")
+    daemon = _serve(path, PORT)
+    try:
+        _wait_for(lambda: os.path.exists(path))
+        with WiccClient(path, device="HV") as client:
+            assert client.call("set_voltage", 3, 12.5) == 12.5
+            assert client.call("get_voltage", 3) == 12.5
+        second = _serve(path, PORT)
+        assert second.wait(10) == 1
+        assert "already listening" in second.stderr.read()
+        with WiccClient(path, device="HV") as client: # the first daemon still owns the socket
+            assert client.call("get_voltage", 3) == 12.5
+    finally:
+        daemon.kill()
+
+
+def test_sigterm_removes_the_socket(tmp_path):
+    path = str(tmp_path / "wicc.sock")
+    daemon = subprocess.Popen([sys.executable, CLI, "-M", MIB_DIR, "-i", "127.0.0.1", "serve", "-s", path],
+                              stderr=subprocess.DEVNULL)
+    try:
+        _wait_for(lambda: os.path.exists(path))
+        daemon.send_signal(signal.SIGTERM)
+        assert daemon.wait(10) == 0
+        assert not os.path.exists(path)
+    finally:
+        daemon.kill()
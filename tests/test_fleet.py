@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+import simulator
+from fleet import Fleet
+from oids import OidTable
+
+MIB_DIR = "docs"
+PORT = 11300
+
+
+def _config(port):
+    return {"crates": {"cc1": {"host": "127.0.0.1", "port": port, "rate": None,
+                               "modules": {"hv": {"device": "HV"}, "lv": {"device": "LV"}}}},
+            "aliases": {"bias": "cc1/hv/2"}}
+
+
+def test_channels_are_checked_against_the_module():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, _ = await simulator.start(port=PORT, oids=oids, channels=4)
+        try:
+            async with Fleet(_config(PORT), MIB_DIR, "WIENER-CRATE-MIB") as fleet:
+                assert await fleet.resolve(["cc1/hv/*"]) == [("cc1", "hv", ch) for ch in range(1, 5)]
+                assert await fleet.resolve(["bias"]) == [("cc1", "hv", 2)]
+                with pytest.raises(ValueError, match="Channel 7 does not exist on cc1/hv"):
+                    await fleet.read("outputMeasurementCurrent", ["cc1/hv/7"])
+        finally:
+            transport.close()
+    asyncio.run(run())
+
+
+def test_set_read_and_all_off():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, protocol = await simulator.start(port=PORT + 1, oids=oids, channels=4)
+        try:
+            async with Fleet(_config(PORT + 1), MIB_DIR, "WIENER-CRATE-MIB") as fleet:
+                set_ = await fleet.set_outputs({"bias": (30.0, 1e-4), "cc1/lv/*": (5.0, 0.5)})
+                assert set_["cc1/hv/2"][0] == 30.0
+                assert len(set_) == 5
+                assert (await fleet.read("outputVoltage", ["bias"]))["cc1/hv/2"] == 30.0
+                assert set((await fleet.write("outputSwitch", {"*": 1})).values()) == {1}
+                assert all(channel.switch == 1 for channel in protocol.crate.channels.values())
+                off = await fleet.all_off()
+                assert set(off) == {"cc1/hv", "cc1/lv"}
+                assert set((await fleet.read("outputSwitch", ["*"])).values()) == {0}
+        finally:
+            transport.close()
+    asyncio.run(run())
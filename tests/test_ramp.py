@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from ramp import RampError, RampSupervisor
+from status import OutputStatus, to_bits
+
+
+class StubWiener:
+    """
+    Answers the supervisor's reads from a table; measured voltages come from voltages(channel, poll).
+    """
+    def __init__(self, setpoints : dict, voltages):
+        self.setpoints = setpoints
+        self.voltages = voltages
+        self.polls = 0
+
+    async def read_many(self, requests):
+        if any(command == "outputStatus" for command, _ in requests):
+            self.polls += 1
+        values = {}
+        for command, channel in requests:
+            if command == "outputVoltage":
+                values[(command, channel)] = self.setpoints[channel]
+            elif command == "outputVoltageRiseRate":
+                values[(command, channel)] = 100.0
+            elif command == "outputStatus":
+                values[(command, channel)] = to_bits(OutputStatus.outputOn | OutputStatus.outputConstantVoltage)
+            else:
+                values[(command, channel)] = self.voltages(channel, self.polls)
+        return values
+
+    async def write(self, command, channel, value):
+        return value
+
+    async def clear_events(self, channel):
+        pass
+
+
+def test_missing_measurement_only_delays_its_channel():
+    async def run():
+        wiener = StubWiener({1: 10.0, 2: 20.0}, lambda ch, poll: None if ch == 2 and poll < 3 else 10.0 * ch)
+        ramps = RampSupervisor(wiener, min_interval=0.01)
+        futures = ramps.enable([1, 2])
+        assert await asyncio.wait_for(futures[1], 5) == 10.0
+        assert await asyncio.wait_for(futures[2], 5) == 20.0
+    asyncio.run(run())
+
+
+def test_channel_never_measured_fails_alone():
+    async def run():
+        wiener = StubWiener({1: 10.0, 2: 20.0}, lambda ch, poll: None if ch == 2 else 10.0)
+        ramps = RampSupervisor(wiener, tries=1, min_interval=0.01, grace=0.1)
+        futures = ramps.enable([1, 2])
+        assert await asyncio.wait_for(futures[1], 5) == 10.0
+        with pytest.raises(RampError):
+            await asyncio.wait_for(futures[2], 5)
+    asyncio.run(run())
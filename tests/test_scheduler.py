@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+import simulator
+from oids import OidTable
+from scheduler import RequestScheduler
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11291
+
+
+@pytest.fixture
+def oids():
+    return OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+
+
+def _wiener(port):
+    scheduler = RequestScheduler(rate=None) # a fresh scheduler per test, not the shared one of the port
+    return AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", port=port, scheduler=scheduler)
+
+
+def test_cancelled_read_does_not_block_the_oid(oids):
+    async def run():
+        transport, _ = await simulator.start(port=PORT, oids=oids, latency=0.3)
+        try:
+            async with _wiener(PORT) as hv:
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(hv.meas_current(1), 0.05)
+                assert await asyncio.wait_for(hv.meas_current(1), 5) is not None
+                assert not hv.scheduler._pending
+        finally:
+            transport.close()
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_cancel_the_owner(oids):
+    async def run():
+        transport, _ = await simulator.start(port=PORT + 1, oids=oids, latency=0.3)
+        try:
+            async with _wiener(PORT + 1) as hv:
+                owner = asyncio.create_task(hv.meas_current(1))
+                await asyncio.sleep(0.05)
+                waiter = asyncio.create_task(hv.meas_current(1))
+                await asyncio.sleep(0.05)
+                assert hv.scheduler.coalesced == 1
+                waiter.cancel()
+                assert await asyncio.wait_for(owner, 5) is not None
+        finally:
+            transport.close()
+    asyncio.run(run())
+
+
+def test_waiter_reads_itself_when_the_owner_is_cancelled(oids):
+    async def run():
+        transport, _ = await simulator.start(port=PORT + 2, oids=oids, latency=0.3)
+        try:
+            async with _wiener(PORT + 2) as hv:
+                owner = asyncio.create_task(hv.meas_current(1))
+                await asyncio.sleep(0.05)
+                waiter = asyncio.create_task(hv.meas_current(1))
+                await asyncio.sleep(0.05)
+                owner.cancel()
+                assert await asyncio.wait_for(waiter, 5) is not None
+        finally:
+            transport.close()
+    asyncio.run(run())
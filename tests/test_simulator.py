@@ -0,0 +1,31 @@
+import asyncio
+
+import numpy as np
+import simulator
+from oids import OidTable
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11296
+
+
+def test_snapshot_backs_off_when_one_row_does_not_fit():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        snaps = []
+        for port, max_size in ((PORT, 300), (PORT + 1, 1472)):
+            transport, _ = await simulator.start(port=port, oids=oids, max_size=max_size)
+            try:
+                async with AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", port=port) as hv:
+                    snaps.append(await asyncio.wait_for(hv.snapshot(), 10))
+            finally:
+                transport.close()
+        small, large = snaps
+        assert small["channel"].tolist() == list(range(1, 9))
+        assert small.keys() == large.keys()
+        for column in small:
+            if small[column].dtype == float:
+                np.testing.assert_allclose(small[column], large[column])
+            else:
+                assert small[column].tolist() == large[column].tolist()
+    asyncio.run(run())
@@ -0,0 +1,6 @@
+import bench
+
+
+def test_cli_help_and_usage_errors_do_not_load_heavy_modules():
+    # wicc_cli.py --help, a subcommand's --help and usage errors, each in a fresh interpreter
+    assert bench.startup(runs=1)["cli_heavy_imports"] == {}
@@ -0,0 +1,51 @@
+import asyncio, csv, io, json, os, subprocess, sys
+
+import bench
+import simulator
+from oids import OidTable
+from scheduler import RequestScheduler
+from store import Store
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11302
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+
+def test_reads_are_recorded_off_the_event_loop(tmp_path):
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        transport, _ = await simulator.start(port=PORT, oids=oids)
+        store = Store(tmp_path / "reads.wstore", writable=True)
+        try:
+            async with AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", port=PORT, store=store,
+                                   scheduler=RequestScheduler(rate=None)) as hv:
+                for _ in range(3):
+                    await hv.meas_current(1)
+                assert len(store) == 0 # buffered, not appended on the loop
+                await hv.snapshot(("outputMeasurementCurrent", "outputStatus"))
+        finally:
+            transport.close()
+        assert len(store) == 3 + 8 # flushed on close, in order
+        columns = Store(tmp_path / "reads.wstore").columns()
+        assert columns["channel"].tolist() == [1, 1, 1, *range(1, 9)]
+    asyncio.run(run())
+
+
+def test_monitor_into_store_then_info_and_downsample(tmp_path):
+    bench.start_simulator(PORT + 1, OidTable.load(MIB_DIR, "WIENER-CRATE-MIB"), 8, 0.0, 0.0, 0.0)
+    path = str(tmp_path / "campaign.wstore")
+    subprocess.run([sys.executable, os.path.join(SRC, "wicc_cli.py"), "-M", MIB_DIR, "-i", "127.0.0.1",
+                    "-p", str(PORT + 1), "-d", "HV", "monitor", "-c", "1-4", "-r", "20", "-t", "0.5",
+                    "-q", "outputMeasurementCurrent,outputStatus", "-o", path],
+                   check=True, capture_output=True)
+
+    def store_cli(*args):
+        return subprocess.run([sys.executable, os.path.join(SRC, "store.py"), *args, path],
+                              check=True, capture_output=True, text=True).stdout
+    info = json.loads(store_cli("info"))
+    assert info["records"] % 4 == 0 and info["records"] >= 4 * 5
+    assert info["channels"] == [f"127.0.0.1/1/{ch}" for ch in range(1, 5)]
+    rows = list(csv.DictReader(io.StringIO(store_cli("downsample", "-f", "current", "-i", "3600"))))
+    assert sum(int(row["count"]) for row in rows) == info["records"]
+    assert {row["channel"] for row in rows} == {"1", "2", "3", "4"}
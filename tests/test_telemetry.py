@@ -0,0 +1,18 @@
+import csv
+
+import numpy as np
+from status import OutputStatus
+from telemetry import CsvSink
+
+
+def test_csv_sink_is_lossless(tmp_path):
+    mask = int(OutputStatus.outputOn | OutputStatus.outputConstantVoltage | OutputStatus.outputCurrentIncreasing
+               | OutputStatus.outputInitCrcCheckBad)
+    current = 1.2345678901234567e-7
+    sink = CsvSink(str(tmp_path / "samples.csv"), [1], ["outputStatus", "outputMeasurementCurrent"])
+    sink.write(np.array([1.0]), np.array([[[mask, current]]], dtype=float))
+    sink.close()
+    with open(tmp_path / "samples.csv") as f:
+        row = list(csv.DictReader(f))[0]
+    assert int(row["outputStatus"]) == mask
+    assert float(row["outputMeasurementCurrent"]) == current
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+import simulator
+from oids import OidTable
+from Wiener import AsyncWiener
+
+MIB_DIR = "docs"
+PORT = 11304
+
+
+def test_scpi_get_set_round_trip():
+    async def run():
+        oids = OidTable.load(MIB_DIR, "WIENER-CRATE-MIB")
+        server, crate = await simulator.start_scpi(port=PORT, oids=oids, channels=4)
+        try:
+            async with AsyncWiener("127.0.0.1", MIB_DIR, "WIENER-CRATE-MIB", "HV", transport="scpi",
+                                   scpi_port=PORT) as hv:
+                assert await hv.set_voltage(2, 40.0) == 40.0
+                assert await hv.get_voltage(2) == 40.0
+                assert crate.channels[102].values["outputVoltage"] == 40.0
+                values = await hv.read_many([("outputCurrent", 2), ("outputSwitch", 2)])
+                assert values[("outputCurrent", 2)] == pytest.approx(1e-4)
+                assert values[("outputSwitch", 2)] == 0
+                snap = await hv.snapshot(("outputVoltage",))
+                assert snap["channel"].tolist() == [1, 2, 3, 4]
+                assert snap["outputVoltage"][1] == 40.0
+        finally:
+            server.close()
+    asyncio.run(run())
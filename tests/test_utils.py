@@ -0,0 +1,20 @@
+import math
+
+import pytest
+from pysnmp.proto.rfc1902 import Integer32, Opaque
+from pysnmp.proto.rfc1905 import NoSuchInstance
+from utils import FloatOpaque, decode_value, decode_values
+
+
+def test_decode_values_matches_decode_value():
+    raws = [FloatOpaque(1.5), NoSuchInstance(), None]
+    assert decode_values(["float"] * 3, raws) == [decode_value("float", raw) for raw in raws] == [1.5, None, None]
+    assert math.isnan(decode_values(["float"], [FloatOpaque(math.nan)])[0])
+
+
+@pytest.mark.parametrize("raw", [Opaque(b"\x01\x02"), Opaque(b"\x9f\x78\x04abc"), Integer32(5)])
+def test_decode_values_raises_on_malformed_floats(raw):
+    with pytest.raises(ValueError):
+        decode_value("float", raw)
+    with pytest.raises(ValueError):
+        decode_values(["int", "float"], [Integer32(1), raw])